@@ -0,0 +1,79 @@
+'''
+Startup benchmark: measures the time to import namelist_lattice and ensembler in fresh
+interpreters, beyond the time to import numpy alone, and checks that no heavy optional
+dependency (matplotlib, scipy, netCDF4) or module only needed by some methods (asyncio,
+multiprocessing, xml) is imported along the way. Exits with
+status 1 if either check fails, so that it can guard against import time regressions, e.g.
+
+    python benchmarks/bench_import.py --max-overhead 0.1
+'''
+
+import sys
+import json
+import time
+import argparse
+import pathlib
+import subprocess
+import numpy as np
+
+ROOT = str(pathlib.Path(__file__).parent.parent.absolute())
+MODULES = ['namelist_lattice', 'ensembler']
+FORBIDDEN = ['matplotlib', 'scipy', 'netCDF4', 'asyncio', 'multiprocessing', 'xml']
+
+
+# =============================================================================
+# =============================================================================
+
+
+def import_time(module, repeat):
+    '''
+    Median wall time, over repeat fresh interpreters, of importing module
+    '''
+    code = 'import sys, time; sys.path.insert(0, {!r}); t0 = time.perf_counter(); '\
+           'import {}; print(time.perf_counter() - t0)'.format(ROOT, module)
+    times = [float(subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, 
+                                  check=True, text=True).stdout) for _ in range(repeat)]
+    return float(np.median(times))
+
+
+def imported_modules(module):
+    '''
+    Top-level packages imported by importing module in a fresh interpreter
+    '''
+    code = 'import sys; sys.path.insert(0, {!r}); import {}; '\
+           'print(" ".join(sorted({{m.split(".")[0] for m in sys.modules}})))'.format(ROOT, module)
+    return subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, 
+                          check=True, text=True).stdout.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=5, help='interpreters per measurement')
+    parser.add_argument('--max-overhead', type=float, default=0.1, 
+                        help='maximum import time beyond numpy, in seconds')
+    parser.add_argument('--json', help='file to write results to')
+    args = parser.parse_args()
+
+    baseline = import_time('numpy', args.repeat)
+    print('numpy: {:.3f} s'.format(baseline))
+    results = {'numpy': baseline}
+    failed = False
+    for module in MODULES:
+        t = import_time(module, args.repeat)
+        heavy = sorted(set(imported_modules(module)) & set(FORBIDDEN))
+        results[module] = {'seconds': t, 'overhead': t - baseline, 'heavy_imports': heavy}
+        print('{}: {:.3f} s ({:+.3f} s beyond numpy){}'.format(module, t, t - baseline,
+              '; imports {}'.format(', '.join(heavy)) if heavy else ''))
+        failed |= (t - baseline > args.max_overhead) or len(heavy) > 0
+
+    if(args.json is not None):
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if(failed):
+        print('FAILED: import overhead above {} s, or heavy dependencies imported'.format(
+              args.max_overhead))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
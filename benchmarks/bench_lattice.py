@@ -0,0 +1,129 @@
+'''
+Lattice benchmark: measures the wall time and peak memory (as traced by tracemalloc, which
+includes numpy allocations) of building, filtering, and constraining high-dimensional
+lattices, e.g. 20 parameters of 2 values each, without creating any clones, e.g.
+
+    python benchmarks/bench_lattice.py --json lattice.json
+
+Each shape is given as {dimensions}x{values per dimension}. Results can be compared between
+runs with compare.py.
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+import pathlib
+import platform
+import tracemalloc
+import warnings
+import numpy as np
+
+ROOT = str(pathlib.Path(__file__).parent.parent.absolute())
+sys.path.insert(0, ROOT)
+from namelist_lattice import namelist_lattice
+
+SHAPES = ['6x10', '8x6', '12x3', '20x2']
+
+
+# =============================================================================
+# =============================================================================
+
+
+def environment():
+    '''
+    Description of the machine and software the benchmark ran on
+    '''
+    return {'python': platform.python_version(), 'numpy': np.__version__,
+            'platform': platform.platform(), 'cpus': os.cpu_count()}
+
+
+def measure(func):
+    '''
+    Wall time, and peak memory traced during, a call to func
+
+    Returns
+    -------
+    result : the return value of func
+    stats : dict
+        'seconds', and 'peak_mb', the peak traced memory beyond that at the call, in MiB
+    '''
+    tracemalloc.reset_peak()
+    start, _ = tracemalloc.get_traced_memory()
+    t0 = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    return result, {'seconds': seconds, 'peak_mb': (peak - start) / 2**20}
+
+
+def bench_shape(ndims, nvalues):
+    '''
+    Builds a lattice of ndims dimensions of nvalues values each, then filters it by a mask
+    over one column, and separately constrains it with a string predicate over two
+    parameters, returning the cost of each step
+    '''
+    names = ['p{}'.format(i) for i in range(ndims)]
+    vectors = [np.round(np.linspace(1, 2, nvalues) * (i+1), 6) for i in range(ndims)]
+
+    def expand():
+        nl = namelist_lattice()
+        nl.expand(names, values=vectors)
+        return nl
+    nl, expand_stats = measure(expand)
+    _, build_stats = measure(nl._build_lattice)
+    size, len_stats = measure(lambda: len(nl.lattice))
+
+    def filter():
+        column = nl.lattice.column(names[0])
+        nl.filter(column > np.median(column))
+        return len(nl.lattice)
+    nfiltered, filter_stats = measure(filter)
+    _, materialize_stats = measure(lambda: nl.lattice.materialize())
+
+    # constraints are evaluated lazily, over only the dimensions they depend on
+    nl._build_lattice()
+    def constrain():
+        nl.constrain('{} < 1.5 * {}'.format(names[1], names[0]))
+        return len(nl.lattice)
+    nconstrained, constrain_stats = measure(constrain)
+
+    results = {'expand': expand_stats, 'build_lattice': build_stats, 'len': len_stats,
+               'filter': filter_stats, 'materialize_filtered': materialize_stats,
+               'constrain': constrain_stats}
+    for r in results.values():
+        r['per_point'] = r['seconds'] / size
+    results['points'] = {'lattice': size, 'filtered': nfiltered, 'constrained': nconstrained}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--shapes', nargs='+', default=SHAPES,
+                        help='lattice shapes, as {dimensions}x{values per dimension}')
+    parser.add_argument('--json', help='file to write results to')
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    tracemalloc.start()
+    results = {}
+    for shape in args.shapes:
+        ndims, nvalues = [int(n) for n in shape.split('x')]
+        results[shape] = bench_shape(ndims, nvalues)
+        points = results[shape]['points']
+        print('\n=============== {} ({} points, {} filtered, {} constrained) ==============='.format(
+              shape, points['lattice'], points['filtered'], points['constrained']))
+        for step, r in results[shape].items():
+            if(step != 'points'):
+                print('  {:<22s}{:>9.3f} s{:>10.1f} MiB peak'.format(step, r['seconds'], r['peak_mb']))
+    tracemalloc.stop()
+
+    if(args.json is not None):
+        with open(args.json, 'w') as f:
+            json.dump({'benchmark': 'lattice', 'environment': environment(), 'results': results},
+                      f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
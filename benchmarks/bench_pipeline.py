@@ -0,0 +1,158 @@
+'''
+Pipeline benchmark: measures the wall time, and throughput per lattice point, of planning,
+creating, submitting, monitoring, and resubmitting clones of a fake CIME case, across lattice
+sizes. The CIME scripts and the scheduler are replaced by the stand-ins in fake_cime/scripts
+(see fake_case.py), which sleep --latency seconds per call, so that the benchmark runs
+anywhere and measures the overhead of namelist_lattice itself, e.g.
+
+    python benchmarks/bench_pipeline.py --sizes 10 100 1000 10000 --json pipeline.json
+
+Results can be compared between runs with compare.py.
+'''
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import pathlib
+import platform
+import tempfile
+import contextlib
+import numpy as np
+
+ROOT = str(pathlib.Path(__file__).parent.parent.absolute())
+sys.path.insert(0, ROOT)
+sys.path.insert(0, str(pathlib.Path(__file__).parent.absolute()))
+from namelist_lattice import namelist_lattice
+from fake_case import SCRIPTS, make_root_case, fake_env
+
+STAGES = ['plan_clones', 'create_clones', 'submit_clone_runs', 'monitor_clone_runs',
+          'resubmit_hung_clone_runs']
+
+
+# =============================================================================
+# =============================================================================
+
+
+def environment():
+    '''
+    Description of the machine and software the benchmark ran on
+    '''
+    return {'python': platform.python_version(), 'numpy': np.__version__,
+            'platform': platform.platform(), 'cpus': os.cpu_count()}
+
+
+def build_lattice(size):
+    '''
+    A lattice of size points over a namelist parameter and an xmlchange parameter
+    '''
+    nl = namelist_lattice(component='cam')
+    nl.expand('clubb_c1', values=[np.round(np.linspace(0.5, 5, max(size // 2, 1)), 6)])
+    nl.expand('STOP_N', values=[[5, 10]], xmlchange=True)
+    return nl
+
+
+def bench_size(size, workdir, args, log):
+    '''
+    Runs every stage of the pipeline for a lattice of size points, returning the wall time
+    of each stage
+    '''
+    top = '{}/n{}'.format(workdir, size)
+    shutil.rmtree(top, ignore_errors=True)
+    os.makedirs('{}/cases'.format(top))
+    root_case = '{}/cases/root'.format(top)
+    make_root_case(root_case, '{}/output'.format(top), component='cam', bulk_kb=args.case_kb)
+
+    nl = build_lattice(size)
+    kwargs = {'top_clone_dir': '{}/clones'.format(top), 'top_output_dir': '{}/output'.format(top),
+              'clone_prefix': 'clone', 'layout': args.layout}
+    times = {}
+    with contextlib.redirect_stdout(log):
+        t0 = time.perf_counter()
+        plan = nl.plan_clones(root_case, **kwargs)
+        times['plan_clones'] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        nl.create_clones(root_case, cime_dir=SCRIPTS, plan=plan, layout=args.layout,
+                         resubmits=1, max_workers=args.max_workers, clone_mode=args.clone_mode,
+                         stdout='{}/cime.log'.format(top))
+        times['create_clones'] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        nl.submit_clone_runs(max_concurrent=args.max_workers)
+        times['submit_clone_runs'] = time.perf_counter() - t0
+
+        queue_cmd = '{}/squeue'.format(SCRIPTS)
+        t0 = time.perf_counter()
+        nl.monitor_clone_runs(queue_cmd=queue_cmd, max_workers=args.max_workers)
+        times['monitor_clone_runs'] = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        nl.monitor_clone_runs(queue_cmd=queue_cmd, max_workers=args.max_workers)
+        times['monitor_clone_runs_repeat'] = time.perf_counter() - t0
+
+        # every clone was created with RESUBMIT=1, so every clone is resubmitted
+        t0 = time.perf_counter()
+        nl.resubmit_hung_clone_runs()
+        times['resubmit_hung_clone_runs'] = time.perf_counter() - t0
+        if(nl.stdoutf is not None):
+            nl.stdoutf.close()
+
+    if(len(nl.clone_dirs) != size):
+        raise RuntimeError('created {} of {} clones'.format(len(nl.clone_dirs), size))
+    if(not args.keep):
+        shutil.rmtree(top)
+    return {stage: {'seconds': t, 'per_point': t / size, 'points_per_second': size / t}
+            for stage, t in times.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000],
+                        help='lattice sizes (even numbers)')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds slept by each call to a fake CIME script')
+    parser.add_argument('--job-seconds', type=float, default=60.0,
+                        help='seconds each fake job stays in the queue')
+    parser.add_argument('--clone-mode', default='copy', choices=['create_clone', 'copy'])
+    parser.add_argument('--layout', default='flat', choices=['flat', 'hashed', 'index'])
+    parser.add_argument('--max-workers', type=int, default=8,
+                        help='clones created, submitted, and checked at once')
+    parser.add_argument('--case-kb', type=int, default=256,
+                        help='approximate size of the fake case directory, in KiB')
+    parser.add_argument('--workdir', help='directory to build cases in; defaults to a temporary '\
+                        'directory')
+    parser.add_argument('--keep', action='store_true', help='keep the cases of each size')
+    parser.add_argument('--log', default=os.devnull, help='file to write pipeline output to')
+    parser.add_argument('--json', help='file to write results to')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_pipeline_') if args.workdir is None else \
+              os.path.abspath(args.workdir)
+    os.makedirs(workdir, exist_ok=True)
+    os.environ.update(fake_env('{}/queue'.format(workdir), args.latency, args.job_seconds))
+
+    results = {}
+    with open(args.log, 'w') as log:
+        for size in args.sizes:
+            results[str(size)] = bench_size(size, workdir, args, log)
+            print('\n=============== {} points ==============='.format(size))
+            for stage, r in results[str(size)].items():
+                print('  {:<28s}{:>9.3f} s{:>10.2f} ms/point{:>10.0f} points/s'.format(
+                      stage, r['seconds'], 1000*r['per_point'], r['points_per_second']))
+    shutil.rmtree('{}/queue'.format(workdir), ignore_errors=True)
+    if(args.workdir is None and not args.keep):
+        shutil.rmtree(workdir)
+
+    if(args.json is not None):
+        with open(args.json, 'w') as f:
+            json.dump({'benchmark': 'pipeline', 'environment': environment(),
+                       'config': {'latency': args.latency, 'clone_mode': args.clone_mode,
+                                  'layout': args.layout, 'max_workers': args.max_workers,
+                                  'case_kb': args.case_kb},
+                       'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
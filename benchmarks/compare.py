@@ -0,0 +1,93 @@
+'''
+Compares two benchmark results files written with --json, e.g. by bench_pipeline.py or
+bench_lattice.py, and reports every measurement which regressed: timings ('seconds') slower
+than the baseline by more than a relative tolerance and an absolute margin, and peak
+memory ('peak_mb') likewise. Exits with status 1 if any measurement regressed, e.g.
+
+    python benchmarks/compare.py baseline.json pipeline.json --tolerance 0.25
+'''
+
+import sys
+import json
+import argparse
+
+# measured quantities compared, and the absolute margin below which changes are ignored
+METRICS = {'seconds': 'min_seconds', 'peak_mb': 'min_mb'}
+
+
+# =============================================================================
+# =============================================================================
+
+
+def flatten(results, prefix=''):
+    '''
+    Maps each compared quantity in a nested results dict to its value, by its path of keys,
+    e.g. '1000/create_clones/seconds'
+    '''
+    flat = {}
+    for key, value in results.items():
+        path = '{}/{}'.format(prefix, key) if prefix else str(key)
+        if(isinstance(value, dict)):
+            flat.update(flatten(value, path))
+        elif(key in METRICS and isinstance(value, (int, float))):
+            flat[path] = float(value)
+    return flat
+
+
+def compare(baseline, current, tolerance, margins):
+    '''
+    Compares the results of two benchmark runs
+
+    Returns
+    -------
+    rows : list of tuples
+        (path, baseline value, current value, relative change, regressed) per quantity
+        measured in both runs
+    '''
+    base, cur = flatten(baseline['results']), flatten(current['results'])
+    rows = []
+    for path in [p for p in base if p in cur]:
+        b, c = base[path], cur[path]
+        change = (c - b) / b if b > 0 else 0.0
+        margin = margins[path.split('/')[-1]]
+        rows.append((path, b, c, change, c > b * (1 + tolerance) and c - b > margin))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('baseline', help='results of the reference run')
+    parser.add_argument('current', help='results of the run to check')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='relative slowdown (or memory growth) allowed')
+    parser.add_argument('--min-seconds', type=float, default=0.01,
+                        help='timing changes smaller than this are ignored')
+    parser.add_argument('--min-mb', type=float, default=1.0,
+                        help='memory changes smaller than this, in MiB, are ignored')
+    parser.add_argument('--all', action='store_true', help='report every measurement')
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    if(baseline.get('benchmark') != current.get('benchmark')):
+        sys.exit('cannot compare results of benchmarks {} and {}'.format(
+                 baseline.get('benchmark'), current.get('benchmark')))
+    if(baseline.get('environment') != current.get('environment')):
+        print('WARNING: the runs were made in different environments')
+
+    margins = {metric: getattr(args, option) for metric, option in METRICS.items()}
+    rows = compare(baseline, current, args.tolerance, margins)
+    regressions = [row for row in rows if row[4]]
+    for path, b, c, change, regressed in (rows if args.all else regressions):
+        print('{} {:<48s}{:>12.4g}{:>12.4g}{:>+9.1%}'.format('REGRESSED' if regressed else '         ',
+              path, b, c, change))
+    print('{} of {} measurements regressed (tolerance {:.0%})'.format(len(regressions), len(rows),
+          args.tolerance))
+    if(len(regressions) > 0):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+'''
+Fake CIME harness for benchmarks: builds root cases with the directory skeleton of a real
+CIME case, whose scripts (xmlchange, xmlquery, case.submit) are the stand-ins in
+fake_cime/scripts. Cases built here can be cloned, edited, submitted, and monitored by
+namelist_lattice without a CESM install or a scheduler; the stand-ins sleep
+FAKE_CIME_LATENCY seconds per call to model the cost of the real tools.
+'''
+
+import os
+import time
+import pathlib
+
+SCRIPTS = str(pathlib.Path(__file__).parent.absolute() / 'fake_cime' / 'scripts')
+
+# entries of the env xml files of the skeleton, by file
+_ENV = {
+    'env_case.xml': [('CASE', '{case}', 'char'), ('CASEROOT', '{caseroot}', 'char'),
+                     ('CIMEROOT', '{cimeroot}', 'char'), ('CIME_OUTPUT_ROOT', '{output_root}', 'char'),
+                     ('COMPSET', 'F2000climo', 'char'), ('GRID', 'ne30pg2_ne30pg2_mg17', 'char'),
+                     ('MACH', 'fake', 'char')],
+    'env_run.xml': [('RUNDIR', '{output_root}/{case}/run', 'char'),
+                    ('DOUT_S_ROOT', '{output_root}/archive/{case}', 'char'),
+                    ('RESUBMIT', '0', 'integer'), ('CONTINUE_RUN', 'FALSE', 'logical'),
+                    ('STOP_OPTION', 'ndays', 'char'), ('STOP_N', '5', 'integer'),
+                    ('REST_OPTION', 'ndays', 'char'), ('RUN_STARTDATE', '0001-01-01', 'char'),
+                    ('DOUT_S', 'TRUE', 'logical')],
+    'env_build.xml': [('EXEROOT', '{output_root}/{case}/bld', 'char'), ('DEBUG', 'FALSE', 'logical')],
+    'env_mach_pes.xml': [('NTASKS_ATM', '128', 'integer'), ('NTHRDS_ATM', '1', 'integer')],
+    'env_batch.xml': [('JOB_QUEUE', 'regular', 'char'), ('JOB_WALLCLOCK_TIME', '01:00:00', 'char')],
+    'env_workflow.xml': [('PROJECT', 'fake', 'char')],
+}
+
+
+# =============================================================================
+# =============================================================================
+
+
+def make_root_case(case, output_root, component='cam', bulk_kb=256):
+    '''
+    Builds a fake root case with the skeleton of a CIME case: env xml files (and their
+    LockedFiles copies), user_nl files, Buildconf and CaseDocs namelists, SourceMods, batch
+    scripts, and symlinks to the stand-in CIME scripts
+
+    Parameters
+    ----------
+    case : string
+        Location of the case to build; its parent must exist
+    output_root : string
+        CIME_OUTPUT_ROOT of the case
+    component : string, optional
+        Atmosphere component, naming user_nl_{component}. Defaults to 'cam'.
+    bulk_kb : int, optional
+        Approximate size in KiB of the generated namelists under Buildconf and CaseDocs, so
+        that copying cases costs about what it does for real cases. Defaults to 256.
+    '''
+    case, output_root = os.path.abspath(case), os.path.abspath(output_root)
+    name = os.path.basename(case)
+    fields = {'case': name, 'caseroot': case, 'output_root': output_root,
+              'cimeroot': os.path.dirname(os.path.dirname(SCRIPTS))}
+    for d in ['LockedFiles', 'Buildconf/{}conf'.format(component), 'CaseDocs',
+              'SourceMods/src.{}'.format(component), 'SourceMods/src.share', 'logs', 'timing']:
+        os.makedirs('{}/{}'.format(case, d), exist_ok=True)
+    os.makedirs('{}/{}/run'.format(output_root, name), exist_ok=True)
+
+    for xml, entries in _ENV.items():
+        text = _env_xml(xml, entries, fields)
+        _write('{}/{}'.format(case, xml), text)
+        if(xml in ['env_case.xml', 'env_build.xml', 'env_mach_pes.xml']):
+            _write('{}/LockedFiles/{}'.format(case, xml), text)
+
+    for comp in [component, 'clm', 'cice', 'docn', 'mosart']:
+        _write('{}/user_nl_{}'.format(case, comp),
+               '!----------------------------------------------------------------------------------\n'
+               '! Users should add all user specific namelist changes below in the form of\n'
+               '! namelist_var = new_namelist_value\n'
+               '!----------------------------------------------------------------------------------\n')
+    line = ' fake_namelist_variable_{:06d} = 1.0e-3\n'
+    nlines = max(bulk_kb * 1024 // len(line.format(0)) // 2, 1)
+    namelist = '&{}_inparm\n'.format(component) + ''.join(line.format(i) for i in range(nlines)) + '/\n'
+    _write('{}/Buildconf/{}conf/atm_in'.format(case, component), namelist)
+    _write('{}/CaseDocs/atm_in'.format(case), namelist)
+    _write('{}/SourceMods/src.{}/README'.format(case, component), 'Put source mods here\n')
+
+    for job, script in [('run', '.case.run'), ('st_archive', 'case.st_archive')]:
+        _write('{}/{}'.format(case, script),
+               '#!/bin/bash\n#SBATCH --job-name={}.{}\n#SBATCH --nodes=1\n'\
+               '#SBATCH --time=01:00:00\necho {}\n'.format(job, name, job), mode=0o755)
+    _write('{}/README.case'.format(case), '{}: ./create_newcase --case {}\n'.format(
+           time.strftime('%Y-%m-%d %H:%M:%S'), name))
+    for script in ['xmlchange', 'xmlquery', 'case.submit']:
+        link = '{}/{}'.format(case, script)
+        if(not os.path.lexists(link)):
+            os.symlink('{}/{}'.format(SCRIPTS, script), link)
+
+
+def fake_env(queue, latency=0.0, job_seconds=1.0):
+    '''
+    Environment for the stand-in scripts: the directory of the fake job queue, the latency
+    of each script call, and how long submitted jobs stay in the queue. The stand-in
+    scheduler commands (squeue, sbatch) are put first on the PATH.
+    '''
+    env = dict(os.environ)
+    env.update({'FAKE_CIME_QUEUE': queue, 'FAKE_CIME_LATENCY': str(latency),
+                'FAKE_CIME_JOB_SECONDS': str(job_seconds),
+                'PATH': '{}:{}'.format(SCRIPTS, os.environ.get('PATH', ''))})
+    return env
+
+
+# -----------------------------------------------------------------------------
+
+
+def _env_xml(xml, entries, fields):
+    '''
+    Renders an env xml file in CIME's format
+    '''
+    lines = ['<?xml version="1.0"?>', '<file id="{}" version="2.0">'.format(xml),
+             '  <header>', '      These variables may be changed anytime during a run.',
+             '  </header>', '  <group id="{}">'.format(os.path.splitext(xml)[0])]
+    for name, value, vtype in entries:
+        lines.extend(['    <entry id="{}" value="{}">'.format(name, value.format(**fields)),
+                      '      <type>{}</type>'.format(vtype),
+                      '      <desc>{} (fake)</desc>'.format(name), '    </entry>'])
+    lines.extend(['  </group>', '</file>', ''])
+    return '\n'.join(lines)
+
+
+def _write(path, text, mode=None):
+    with open(path, 'w') as f:
+        f.write(text)
+    if(mode is not None):
+        os.chmod(path, mode)
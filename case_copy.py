@@ -0,0 +1,130 @@
+import os
+import re
+import glob
+import shutil
+
+ERRC  = '\033[91m'
+ENDC  = '\033[0m'
+
+# env_*.xml entries which hold the case name or case location
+CASE_ENTRIES = ['CASE', 'CASEROOT', 'RUNDIR', 'DOUT_S_ROOT']
+# batch directive prefixes, in which job names derived from the case name are rewritten
+BATCH_DIRECTIVES = ('#SBATCH', '#PBS', '#BSUB', '#COBALT')
+
+
+# ==========================================================================================
+# ==========================================================================================
+
+
+def copy_case(template_case, new_case, template_output_root=None, output_root=None):
+    '''
+    Creates a CIME case by copying an existing case directory, rather than calling
+    create_clone. Intended for producing many clones of a single template clone that
+    was itself created with create_clone --keepexe, so that all copies share the root
+    case's build. Only the case-specific fields (CASE, CASEROOT, RUNDIR, DOUT_S_ROOT) are
+    rewritten in the env_*.xml files (including those under LockedFiles), as well as any
+    job names in the batch directives of the case scripts. The output root is shared with
+    the template, unless output_root is passed.
+
+    Files are copied with copy_file_range, which produces reflinks on filesystems that
+    support them, and otherwise copies in-kernel. Files are never hardlinked, since CIME
+    rewrites several case files (namelists under Buildconf and CaseDocs, CaseStatus, env
+    xml files) in place, which would then leak across clones.
+
+    Parameters
+    ----------
+    template_case : string
+        Location of the template case
+    new_case : string
+        Location of the case to create. Must not exist.
+    template_output_root : string, optional
+        Output root (CIME_OUTPUT_ROOT) of the template case. Required if output_root is passed.
+    output_root : string, optional
+        Output root of the new case, if it differs from that of the template (e.g. for
+        clones sharded into subdirectories). Defaults to None.
+    '''
+    template_case = os.path.abspath(template_case)
+    new_case = os.path.abspath(new_case)
+    if(os.path.exists(new_case)):
+        raise RuntimeError(ERRC+'case at {} already exists!'.format(new_case)+ENDC)
+
+    shutil.copytree(template_case, new_case, symlinks=True, copy_function=_copy_file)
+
+    old_name, new_name = os.path.basename(template_case), os.path.basename(new_case)
+    roots = None if output_root is None else (os.path.abspath(template_output_root), 
+                                              os.path.abspath(output_root))
+    for xml in glob.glob('{}/env_*.xml'.format(new_case)) + \
+               glob.glob('{}/LockedFiles/env_*.xml'.format(new_case)):
+        _rewrite_case_entries(xml, template_case, new_case, old_name, new_name, roots)
+    for script in glob.glob('{}/.case.*'.format(new_case)) + \
+                  glob.glob('{}/case.st_archive'.format(new_case)):
+        if(os.path.isfile(script) and not os.path.islink(script)):
+            _rewrite_batch_directives(script, old_name, new_name)
+
+
+# ------------------------------------------------------------------------------
+
+
+def _copy_file(src, dst):
+    '''
+    Copies a file with os.copy_file_range (reflinked where supported), falling back to
+    shutil.copy2. File metadata is preserved in either case.
+    '''
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            remaining = os.fstat(fsrc.fileno()).st_size
+            while remaining > 0:
+                n = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                if(n == 0): break
+                remaining -= n
+        shutil.copystat(src, dst)
+    except (AttributeError, OSError):
+        shutil.copy2(src, dst)
+    return dst
+
+
+def _replace_name(value, old_name, new_name):
+    '''
+    Replaces the case name in value where it is a full path component
+    '''
+    return re.sub('(^|/){}(?=/|$)'.format(re.escape(old_name)),
+                  lambda m: m.group(1) + new_name, value)
+
+
+def _rewrite_case_entries(xml, old_root, new_root, old_name, new_name, output_roots=None):
+    '''
+    Rewrites the values of the CASE_ENTRIES in a CIME env xml file, in place, leaving all
+    other content of the file untouched. If output_roots is passed, as the (old, new) output
+    root, CIME_OUTPUT_ROOT is rewritten, and paths under the old output root are moved to
+    the new one.
+    '''
+    entries = CASE_ENTRIES + ([] if output_roots is None else ['CIME_OUTPUT_ROOT'])
+    with open(xml) as f:
+        text = f.read()
+
+    def rewrite(m):
+        value = m.group(3).replace(old_root, new_root)
+        if(output_roots is not None and (value == output_roots[0] or 
+                                         value.startswith(output_roots[0] + '/'))):
+            value = output_roots[1] + value[len(output_roots[0]):]
+        value = _replace_name(value, old_name, new_name)
+        return '{}{}{}'.format(m.group(1), value, m.group(4))
+
+    pattern = r'(<entry\s+id="({})"\s+value=")([^"]*)(")'.format('|'.join(entries))
+    new_text = re.sub(pattern, rewrite, text)
+    if(new_text != text):
+        with open(xml, 'w') as f:
+            f.write(new_text)
+
+
+def _rewrite_batch_directives(script, old_name, new_name):
+    '''
+    Rewrites occurences of the case name in the batch directives of a case script
+    '''
+    with open(script) as f:
+        lines = f.readlines()
+    new_lines = [l.replace(old_name, new_name) if l.startswith(BATCH_DIRECTIVES) else l
+                 for l in lines]
+    if(new_lines != lines):
+        with open(script, 'w') as f:
+            f.writelines(new_lines)
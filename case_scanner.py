@@ -0,0 +1,111 @@
+import os
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+ERRC  = '\033[91m'
+ENDC  = '\033[0m'
+
+# env_run.xml fields read by default
+RUN_FIELDS = ['RESUBMIT', 'CONTINUE_RUN', 'STOP_OPTION', 'STOP_N', 'RUN_STARTDATE',
+              'RUNDIR', 'DOUT_S_ROOT']
+
+# cache of parsed env xml files, keyed by path, holding ((mtime_ns, size, fields), values)
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+# ==========================================================================================
+# ==========================================================================================
+
+
+def read_env_xml(path, fields=RUN_FIELDS):
+    '''
+    Reads entries from a CIME env_*.xml file directly, without calling xmlquery. Values
+    of integer and logical entries are converted to int and bool; all others are returned
+    as strings, unexpanded. Results are cached by file modification time and size, so
+    repeated reads of unchanged files do not re-parse them.
+
+    Parameters
+    ----------
+    path : string
+        Location of the xml file
+    fields : string list, optional
+        Entry ids to read. Defaults to RUN_FIELDS
+
+    Returns
+    -------
+    values : dict
+        Values of the requested entries present in the file, by entry id
+    '''
+    fields = tuple(fields)
+    st = os.stat(path)
+    key = (st.st_mtime_ns, st.st_size, fields)
+    with _cache_lock:
+        cached = _cache.get(path)
+    if(cached is not None and cached[0] == key):
+        return dict(cached[1])
+
+    values = {}
+    wanted = set(fields)
+    for _, elem in ET.iterparse(path, events=('end',)):
+        if(elem.tag != 'entry'):
+            continue
+        name = elem.get('id')
+        if(name in wanted):
+            values[name] = _convert(elem.get('value'), elem.findtext('type'))
+            if(len(values) == len(wanted)):
+                break
+        elem.clear()
+
+    with _cache_lock:
+        _cache[path] = (key, values)
+    return dict(values)
+
+
+def scan_cases(cases, fields=RUN_FIELDS, max_workers=16):
+    '''
+    Reads entries of env_run.xml concurrently for many cases (see read_env_xml())
+
+    Parameters
+    ----------
+    cases : string list
+        Case directories
+    fields : string list, optional
+        Entry ids to read. Defaults to RUN_FIELDS
+    max_workers : int, optional
+        Maximum number of files read at once. Defaults to 16.
+
+    Returns
+    -------
+    status : dict
+        Values of the requested entries per case, keyed by case directory, in the order of
+        cases. A case whose env_run.xml could not be read maps to None.
+    '''
+    def read(case):
+        try:
+            return read_env_xml('{}/env_run.xml'.format(case), fields)
+        except (OSError, ET.ParseError):
+            return None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return dict(zip(cases, pool.map(read, cases)))
+
+
+# ------------------------------------------------------------------------------
+
+
+def _convert(value, vtype):
+    '''
+    Converts an entry value by its CIME type
+    '''
+    if(value is None):
+        return None
+    try:
+        if(vtype == 'integer'):
+            return int(value)
+        if(vtype == 'logical'):
+            return value.strip().upper() == 'TRUE'
+    except ValueError:
+        pass
+    return value
@@ -0,0 +1,362 @@
+import os
+import csv
+import json
+import hashlib
+import tempfile
+import numpy as np
+
+ERRC  = '\033[91m'
+ENDC  = '\033[0m'
+
+# CESM components read case and run directory paths into Fortran strings of 256 characters
+MAX_PATH_LENGTH = 256
+# longest file name on most filesystems
+MAX_NAME_LENGTH = 255
+
+# clone directory layouts, and the name of the file mapping sharded clones to coordinates
+LAYOUTS = ['flat', 'hashed', 'index']
+CLONE_MAP_NAME = 'clone_map.json'
+
+
+# ==========================================================================================
+# ==========================================================================================
+
+
+class clone_plan:
+    def __init__(self, lattice, top_clone_dir, top_output_dir, clone_prefix, clone_sfx=None,
+                 layout='flat', shard_size=1000):
+        '''
+        This class holds the plan of clone creation for every selected lattice point: its case
+        and output directories, coordinates, and the namelist settings and env xml changes it
+        applies. Everything is computed up front, vectorized over points: each parameter value
+        is formatted once per dimension (into directory name fragments, namelist lines, and
+        xml settings), and points are assembled by indexing those tables with the lattice
+        codes (see lazy_lattice.codes()). The plan can thus be checked (see check()) and
+        exported (see export()) without running any CIME tool, and is executed as-is by
+        namelist_lattice.create_clones().
+
+        Parameters
+        ----------
+        lattice : namelist_lattice
+            The lattice to plan clones of
+        top_clone_dir : string
+            Top directory of the clones
+        top_output_dir : string
+            Top directory of clone outputs, or None
+        clone_prefix : string
+            Prefix of each clone directory name
+        clone_sfx : string or string array, optional
+            Suffix of each clone directory name, one per lattice point (or one for all).
+            Defaults to None, in which case suffixes concatenate each parameter name (or group
+            label) and value, separated by '__'. See namelist_lattice.create_clones().
+        layout : string, optional
+            Layout of the clone directories, one of LAYOUTS. Defaults to 'flat', in which case
+            every clone is placed directly in top_clone_dir (and its output directly in 
+            top_output_dir). The other layouts shard clones (and outputs) into subdirectories,
+            and give them short names, unless clone_sfx is passed:
+            'hashed' : {top_clone_dir}/{hh}/{clone_prefix}__{hash}, where hash is 12 hex 
+                characters of a hash of the clone's coordinates, and hh its first 2 (so 256 
+                shards). Names depend only on coordinates, so they are stable as the lattice
+                is refined, filtered, or reordered.
+            'index' : {top_clone_dir}/{shard}/{clone_prefix}__{point}, where point is the 
+                zero-padded flat index of the lattice point, and shard = point // shard_size. 
+                Names are stable only while the lattice is unchanged.
+        shard_size : int, optional
+            Clones per shard of the 'index' layout. Defaults to 1000.
+        '''
+        lat = lattice._lattice
+        if(lat is None):
+            raise RuntimeError('Lattice must first be built by calling expand()')
+        if(layout not in LAYOUTS):
+            raise RuntimeError(ERRC+'layout must be one of {}'.format(LAYOUTS)+ENDC)
+        params = [str(name) for name in lat.names]
+        print_params = np.array(params)
+        print_params[np.where(lattice.paramgroup_mask)] = lattice.paramgroup_labels
+
+        self.params = params
+        self.top_clone_dir = top_clone_dir
+        self.top_output_dir = top_output_dir
+        self.clone_prefix = clone_prefix
+        self.layout = layout
+        self.points = lat.flat_indices()
+        self.codes = lat.codes()
+        self.labels = [lat.labels(m) for m in range(len(params))]
+        self.values = [lat.values(m) for m in range(len(params))]
+        npoints = len(self.points)
+
+        # per-dimension tables of settings, indexed by value code
+        self.nl_settings, self.xml_settings = [], []
+        for m in range(len(params)):
+            settings = [list(zip(params[m].split(','), v.split(','))) if lattice.paramgroup_mask[m] == 1
+                        else [(params[m], v)] for v in self.values[m]]
+            empty = [[] for _ in settings]
+            self.xml_settings.append(settings if lattice.xml_mask[m] == 1 else empty)
+            self.nl_settings.append(empty if lattice.xml_mask[m] == 1 else settings)
+
+        # directory suffixes, assembled from per-dimension name fragments
+        if(clone_sfx is None and layout != 'flat'):
+            sfx = None
+        elif(clone_sfx is None):
+            sfx = np.full(npoints, '', dtype=object)
+            for m in range(len(params)):
+                fragments = np.array(['{}_{}'.format(print_params[m], _print_value(v))
+                                      for v in self.values[m]], dtype=object)
+                sfx = sfx + ('__' if m > 0 else '') + fragments[self.codes[:, m]]
+        else:
+            clone_sfx = np.atleast_1d(clone_sfx)
+            if(len(clone_sfx) != 1 and len(clone_sfx) != npoints):
+                raise RuntimeError('clone_sfx must be a single string, or length of'\
+                                   'clone_sfx must match number of lattice points')
+            sfx = np.broadcast_to(clone_sfx.astype(object), (npoints,))
+        
+        # shards and short names of the sharded layouts
+        if(layout == 'flat'):
+            shard = np.full(npoints, '', dtype=object)
+        elif(layout == 'hashed'):
+            key = np.full(npoints, '', dtype=object)
+            for m in range(len(params)):
+                key = key + np.array(['{}={}\x1f'.format(params[m], label) for label in 
+                                      self.labels[m]], dtype=object)[self.codes[:, m]]
+            digest = np.array([hashlib.blake2b(k.encode(), digest_size=6).hexdigest() 
+                               for k in key.tolist()], dtype=object)
+            shard = np.array([d[:2] + '/' for d in digest.tolist()], dtype=object)
+            if(sfx is None): sfx = digest
+        else:
+            # zero-padded to the width of the largest index of the unfiltered lattice
+            width = len(str(max(lat.size - 1, 0)))
+            shard = np.array(['{:0{}d}/'.format(p // shard_size, max(width - len(str(shard_size)) + 1, 1))
+                              for p in self.points.tolist()], dtype=object)
+            if(sfx is None): 
+                sfx = np.array(['{:0{}d}'.format(p, width) for p in self.points.tolist()], dtype=object)
+        self.cases = '{}/'.format(top_clone_dir) + shard + '{}__'.format(clone_prefix) + sfx
+        self.outputs = None if top_output_dir is None else \
+                       '{}/'.format(top_output_dir) + shard + '{}__'.format(clone_prefix) + sfx
+
+    def __len__(self):
+        return len(self.points)
+
+
+    # ------------------------------------------------------------------------------
+
+
+    def coords(self, i):
+        '''
+        Returns the coordinates (formatted parameter values) of planned clone i
+        '''
+        return tuple(self.labels[m][c] for m, c in enumerate(self.codes[i].tolist()))
+
+    def entry(self, i):
+        '''
+        Returns the plan of clone i, as a dict with keys 'case', 'output', 'point', 'coords',
+        'values', 'nl_settings', and 'xml_changes'
+        '''
+        codes = self.codes[i].tolist()
+        return {'case': self.cases[i],
+                'output': None if self.outputs is None else self.outputs[i],
+                'point': int(self.points[i]),
+                'coords': self.coords(i),
+                'values': tuple(self.values[m][c] for m, c in enumerate(codes)),
+                'nl_settings': [s for m, c in enumerate(codes) for s in self.nl_settings[m][c]],
+                'xml_changes': [s for m, c in enumerate(codes) for s in self.xml_settings[m][c]]}
+
+
+    def relocate(self, clones):
+        '''
+        Places the planned clones of points which already have a clone at that clone's case
+        and output directories, whatever layout the clone was created with, so that sharded
+        sweeps are found again from their clone map (see read_clone_map()) without passing
+        the layout they were created with
+
+        Parameters
+        ----------
+        clones : dict
+            Existing clones by case location, with keys 'output' and 'coords' (a dict of
+            formatted parameter values by name), as returned by read_clone_map()
+
+        Returns
+        -------
+        n : int
+            Number of planned clones relocated
+        '''
+        located = {tuple(clone['coords'][p] for p in self.params): (case, clone['output'])
+                   for case, clone in clones.items() if set(clone['coords']) == set(self.params)}
+        n = 0
+        for i in range(len(self)):
+            found = located.get(self.coords(i))
+            if(found is None):
+                continue
+            self.cases[i] = found[0]
+            if(self.outputs is not None and found[1] is not None):
+                self.outputs[i] = found[1]
+            n += 1
+        return n
+
+
+    # ------------------------------------------------------------------------------
+
+
+    def check(self, existing=None, max_path=MAX_PATH_LENGTH, max_name=MAX_NAME_LENGTH):
+        '''
+        Checks the plan for clone directory collisions (between planned clones, or with
+        existing clones of other coordinates), and for directory names or paths (including
+        the run directory under the output directory) which are too long
+
+        Parameters
+        ----------
+        existing : dict, optional
+            Coordinates of existing clones by case (e.g. from namelist_lattice.clone_records).
+            Defaults to None.
+        max_path : int, optional
+            Maximum length of case and run directory paths. Defaults to MAX_PATH_LENGTH.
+        max_name : int, optional
+            Maximum length of clone directory names. Defaults to MAX_NAME_LENGTH.
+
+        Raises
+        ------
+        RuntimeError
+            Describing every problem found
+        '''
+        problems = []
+        cases = self.cases.astype(str)
+        unique, inverse, counts = np.unique(cases, return_inverse=True, return_counts=True)
+        if(np.any(counts > 1)):
+            dup = unique[counts > 1]
+            problems.append('{} clone directories are shared by several lattice points, e.g. {}; '\
+                            'pass clone_sfx to name clones uniquely'.format(len(dup), dup[0]))
+        if(existing is not None):
+            clash = [c for i, c in enumerate(cases) if c in existing
+                     and tuple(existing[c]) != self.coords(i)]
+            if(len(clash) > 0):
+                problems.append('{} clone directories belong to existing clones of other lattice '\
+                                'points, e.g. {}'.format(len(clash), clash[0]))
+
+        lengths = np.char.str_len(cases)
+        names = lengths - np.char.rfind(cases, '/') - 1
+        if(np.any(names > max_name)):
+            problems.append('{} clone directory names exceed {} characters, e.g. {}'.format(
+                            np.sum(names > max_name), max_name, cases[np.argmax(names)]))
+        if(np.any(lengths > max_path)):
+            problems.append('{} clone paths exceed {} characters, e.g. {}'.format(
+                            np.sum(lengths > max_path), max_path, cases[np.argmax(lengths)]))
+        if(self.outputs is not None):
+            # CIME places the run directory at {output root}/{case name}/run
+            runs = np.char.str_len(self.outputs.astype(str)) + len('/run')
+            if(np.any(runs > max_path)):
+                problems.append('{} run directory paths exceed {} characters, e.g. {}/run'.format(
+                                np.sum(runs > max_path), max_path, self.outputs[np.argmax(runs)]))
+        if(len(problems) > 0):
+            raise RuntimeError(ERRC+'clone plan is invalid:\n  '+'\n  '.join(problems)+ENDC)
+
+
+    def export(self, path):
+        '''
+        Writes the plan to a JSON or CSV file, by the extension of path. Each clone has its
+        case and output directories, lattice point, parameter values, the namelist lines
+        written to its user_nl file, and its xmlchange settings.
+
+        Parameters
+        ----------
+        path : string
+            Location of the file, ending in .json or .csv
+        '''
+        fmt = os.path.splitext(path)[1].lower()
+        if(fmt not in ['.json', '.csv']):
+            raise RuntimeError(ERRC+'plan can be exported as .json or .csv, not {}'.format(fmt)+ENDC)
+
+        # namelist and xmlchange text per clone, assembled from per-dimension fragments
+        nl, xml = np.full(len(self), '', dtype=object), np.full(len(self), '', dtype=object)
+        for m in range(len(self.params)):
+            nl = nl + np.array([''.join('{} = {}\n'.format(n, v) for n, v in s)
+                                for s in self.nl_settings[m]], dtype=object)[self.codes[:, m]]
+            xml = xml + np.array([''.join(',{}={}'.format(n, v) for n, v in s)
+                                  for s in self.xml_settings[m]], dtype=object)[self.codes[:, m]]
+        outputs = [None]*len(self) if self.outputs is None else self.outputs.tolist()
+        coords = [np.array(self.labels[m], dtype=object)[self.codes[:, m]].tolist()
+                  for m in range(len(self.params))]
+
+        if(fmt == '.json'):
+            rows = [{'case': c, 'output': o, 'point': p, 'coords': dict(zip(self.params, v)),
+                     'namelist': n, 'xmlchange': x[1:]}
+                    for c, o, p, v, n, x in zip(self.cases.tolist(), outputs, self.points.tolist(),
+                                                zip(*coords), nl.tolist(), xml.tolist())]
+            # serialized in one call, which uses the C encoder (unlike json.dump with indent)
+            with open(path, 'w') as f:
+                f.write(json.dumps(rows))
+        else:
+            with open(path, 'w', newline='') as f:
+                w = csv.writer(f)
+                w.writerow(['case', 'output', 'point'] + self.params + ['namelist', 'xmlchange'])
+                w.writerows([c, o, p] + list(v) + [n, x[1:]]
+                            for c, o, p, v, n, x in zip(self.cases.tolist(), outputs,
+                                                        self.points.tolist(), zip(*coords),
+                                                        nl.tolist(), xml.tolist()))
+
+
+# ------------------------------------------------------------------------------
+
+
+def write_clone_map(path, params, records):
+    '''
+    Atomically writes the file mapping clones to their lattice coordinates, as JSON keyed by
+    case location relative to the directory of the file
+
+    Parameters
+    ----------
+    path : string
+        Location of the file, e.g. {top_clone_dir}/CLONE_MAP_NAME
+    params : string list
+        Parameter names of the lattice dimensions
+    records : dict
+        Clone records by case location, with keys 'output', 'point', and 'coords'; see
+        namelist_lattice.clone_records
+    '''
+    top = os.path.dirname(os.path.abspath(path))
+    clones = {os.path.relpath(case, top): {'output': record['output'], 'point': record['point'], 
+                                           'coords': dict(zip(params, record['coords']))}
+              for case, record in records.items()}
+    fd, tmp = tempfile.mkstemp(dir=top, prefix='.{}.'.format(os.path.basename(path)))
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(clones, f, indent=1)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def read_clone_map(path):
+    '''
+    Reads a file written by write_clone_map()
+
+    Parameters
+    ----------
+    path : string
+        Location of the file
+
+    Returns
+    -------
+    clones : dict
+        By absolute case location, dicts with keys 'output', 'point', and 'coords' (a dict of
+        formatted parameter values by name)
+    '''
+    top = os.path.dirname(os.path.abspath(path))
+    with open(path) as f:
+        clones = json.load(f)
+    return {os.path.normpath(os.path.join(top, case)): clone for case, clone in clones.items()}
+
+
+# ------------------------------------------------------------------------------
+
+
+def _print_value(value):
+    '''
+    Formats a parameter value for a directory name, replacing commas in parameter groups with
+    underscores, and removing '+' in scientific notation for integers >= 1e5. Numpy scalars
+    (as lattice values are) are formatted with str(), so that e.g. float32 values are not
+    widened to their float64 repr.
+    '''
+    if isinstance(value, str):
+        return value.replace(',', '_')
+    elif isinstance(value, int) and value >= 1e5:
+        return ('%e' % value).replace('+', '')
+    return str(value)
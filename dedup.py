@@ -0,0 +1,187 @@
+import os
+import stat
+import errno
+import fnmatch
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+ERRC  = '\033[91m'
+ENDC  = '\033[0m'
+
+# files which CIME, this package, or users commonly modify in place, and so must never share
+# storage between clones (e.g. the namelists generated under Buildconf and CaseDocs, which
+# case.submit rewrites); patterns match paths relative to each root, or file names
+DEFAULT_EXCLUDE = ['env_*.xml', 'LockedFiles/*', 'CaseStatus', '.case.*', 'case.st_archive',
+                   'user_nl_*', 'Buildconf/**', 'CaseDocs/*', '*.log', '*.log.*', 'logs/*',
+                   'timing/*']
+
+# bytes hashed at a time
+_HASH_CHUNK = 2**20
+
+
+# ==========================================================================================
+# ==========================================================================================
+
+
+def dedup_files(roots, store, mode='hardlink', include=None, exclude=DEFAULT_EXCLUDE,
+                min_size=4096, readonly=True, dry=False, max_workers=8):
+    '''
+    Finds files with identical content across directory trees (e.g. clone case directories),
+    and replaces each copy with a hardlink or symlink to a single object in a shared store,
+    named by its content hash. Only files whose size matches another file are hashed, and
+    hashing runs in a thread pool. Each replacement is atomic (the link is created beside the
+    file and renamed over it). Files which are already links are left alone, so the call can
+    be repeated as clones are added.
+
+    Deduplicated files share storage, so writing one in place changes every copy. Files known
+    to be modified in place are excluded by default (see DEFAULT_EXCLUDE), and the shared
+    objects are made read-only unless readonly is False, so that any other in-place write
+    fails rather than silently changing other clones. Replacing such a file (as editors and
+    user_nl.write() do) is safe.
+
+    Parameters
+    ----------
+    roots : string list
+        Directories to deduplicate
+    store : string
+        Directory of the shared store. For hardlinks, it must be on the same filesystem as
+        the roots; files on other filesystems are symlinked instead.
+    mode : string, optional
+        'hardlink' or 'symlink'. Defaults to 'hardlink'.
+    include : string list, optional
+        Glob patterns of files to consider (matching the path relative to its root, or the
+        file name). Defaults to None, in which case all files are considered.
+    exclude : string list, optional
+        Glob patterns of files to skip. Defaults to DEFAULT_EXCLUDE.
+    min_size : int, optional
+        Files smaller than this many bytes are skipped. Defaults to 4096.
+    readonly : bool, optional
+        Whether to remove write permissions from shared objects. Defaults to True.
+    dry : bool, optional
+        If True, duplicates are found and reported, but no files are changed. Defaults to
+        False.
+    max_workers : int, optional
+        Maximum number of files hashed at once. Defaults to 8.
+
+    Returns
+    -------
+    report : dict
+        With keys 'files' (number of files replaced by links), 'objects' (number of distinct
+        shared contents), and 'bytes_saved'
+    '''
+    if(mode not in ['hardlink', 'symlink']):
+        raise RuntimeError(ERRC+'mode must be \'hardlink\' or \'symlink\''+ENDC)
+    store = os.path.abspath(store)
+
+    # group candidate files by size; only sizes shared by several files need hashing
+    by_size = {}
+    for root in roots:
+        for path, st in _walk(os.path.abspath(root), store, include, exclude, min_size):
+            by_size.setdefault(st.st_size, []).append((path, st))
+    candidates = [f for files in by_size.values() if len(files) > 1 for f in files]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        digests = list(pool.map(lambda f: _hash(f[0]), candidates))
+
+    # group by content, and by whether executable, since linked files share permissions
+    groups = {}
+    for (path, st), digest in zip(candidates, digests):
+        executable = bool(st.st_mode & stat.S_IXUSR)
+        groups.setdefault(digest + ('.x' if executable else ''), []).append((path, st))
+
+    report = {'files': 0, 'objects': 0, 'bytes_saved': 0}
+    for digest, files in groups.items():
+        # files already linked to the same inode count once
+        inodes = {(st.st_dev, st.st_ino) for _, st in files}
+        if(len(inodes) < 2):
+            continue
+        size = files[0][1].st_size
+        counts = {}
+        for _, st in files:
+            counts[(st.st_dev, st.st_ino)] = counts.get((st.st_dev, st.st_ino), 0) + 1
+        report['objects'] += 1
+        report['files'] += len(files) - max(counts.values())
+        report['bytes_saved'] += (len(inodes) - 1) * size
+        if(not dry):
+            _share(files, '{}/{}/{}'.format(store, digest[:2], digest), mode, readonly)
+    return report
+
+
+# ------------------------------------------------------------------------------
+
+
+def _walk(root, store, include, exclude, min_size):
+    '''
+    Yields (path, stat) of regular, non-symlinked files under root, outside of the store,
+    which pass the include, exclude, and size filters
+    '''
+    stack = [root]
+    while stack:
+        d = stack.pop()
+        try:
+            it = os.scandir(d)
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                if(entry.is_dir(follow_symlinks=False)):
+                    if(entry.path != store):
+                        stack.append(entry.path)
+                    continue
+                if(not entry.is_file(follow_symlinks=False)):
+                    continue
+                rel = os.path.relpath(entry.path, root)
+                match = lambda patterns: any(fnmatch.fnmatch(rel, p) or fnmatch.fnmatch(entry.name, p)
+                                             for p in patterns)
+                if((include is not None and not match(include)) or match(exclude or [])):
+                    continue
+                st = entry.stat(follow_symlinks=False)
+                if(st.st_size >= min_size):
+                    yield entry.path, st
+
+
+def _hash(path):
+    '''
+    BLAKE2b digest of a file's content
+    '''
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _share(files, obj, mode, readonly):
+    '''
+    Replaces each of a group of identical files with a link to the store object obj,
+    creating the object from the first file if it does not exist
+    '''
+    os.makedirs(os.path.dirname(obj), exist_ok=True)
+    if(not os.path.exists(obj)):
+        try:
+            os.link(files[0][0], obj)
+        except OSError as e:
+            if(e.errno != errno.EXDEV):
+                raise
+            with open(files[0][0], 'rb') as fsrc, open(obj, 'wb') as fdst:
+                for chunk in iter(lambda: fsrc.read(_HASH_CHUNK), b''):
+                    fdst.write(chunk)
+            os.chmod(obj, stat.S_IMODE(files[0][1].st_mode))
+    if(readonly):
+        os.chmod(obj, stat.S_IMODE(os.stat(obj).st_mode) & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+    target = os.stat(obj)
+
+    for path, st in files:
+        if((st.st_dev, st.st_ino) == (target.st_dev, target.st_ino)):
+            continue
+        tmp = '{}/.{}.dedup'.format(os.path.dirname(path), os.path.basename(path))
+        if(mode == 'hardlink'):
+            try:
+                os.link(obj, tmp)
+            except OSError as e:
+                if(e.errno != errno.EXDEV):
+                    raise
+                os.symlink(obj, tmp)
+        else:
+            os.symlink(obj, tmp)
+        os.replace(tmp, path)
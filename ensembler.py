@@ -1,11 +1,12 @@
 import os
-import pdb
 import sys
-import glob
 import pathlib
+import numpy as np
 
 sys.path.append('{}/.'.format(pathlib.Path(__file__).parent.absolute()))
 from namelist_lattice import namelist_lattice
+# modules needed only by some methods (initial condition scanning and perturbation) are
+# imported in those methods, so that importing this module stays cheap
 
 
 # =============================================================================
@@ -27,29 +28,116 @@ class ensembler:
         self.N = 0
         self.lattice = namelist_lattice(component)
     
+    @classmethod
+    def load(cls, path):
+        '''
+        Reopens an ensemble from the manifest written when its members were created. See
+        namelist_lattice.load().
+
+        Parameters
+        ----------
+        path : string
+            Location of the manifest
+        '''
+        lattice = namelist_lattice.load(path)
+        obj = cls(lattice.component)
+        obj.lattice = lattice
+        obj.N = len(lattice.param_vectors[0]) if len(lattice.param_vectors) > 0 else 0
+        return obj
+    
     # ------------------------------------------------------------------------------
 
-    def add_members(self, ic_dir, globstr=None, regex=None):
+    def add_members(self, ic_dir, globstr=None, regex=None, validate=False, required_vars=None,
+                    max_workers=16):
         '''
+        Adds one ensemble member per initial condition file found in ic_dir, as values of 
+        NCDATA. See ic_scanner.scan_ics().
 
         Parameters
         ----------
-        ic_root : string
+        ic_dir : string
             path to directory containing initial condition files (netcdf). All files present
             in this directory will be assumed to be intial conditions for ensemble members, 
-            regardless of exrtension. Subdirectories will be ignored.
-        globstr : str
-            glob string to apply to files in the ic_root directory; only files matching this
+            regardless of exrtension, unless filtered by globstr, regex, or validate. 
+            Subdirectories will be ignored.
+        globstr : str, optional
+            glob string to apply to files in the ic_dir directory; only files matching this
             pattern will be included to generate members for the ensemble. Pattern is applied 
             to file names only, not full path. Defaults to None, in which case no filtering is
             applied.
+        regex : str, optional
+            regular expression to search for in file names; only files containing a match 
+            will be included. Defaults to None, in which case no filtering is applied.
+        validate : bool, optional
+            Whether to include only files which are NetCDF, judged by their headers. Defaults
+            to False.
+        required_vars : string list, optional
+            Variables which each file must contain to be included. Implies validate. Defaults
+            to None.
+        max_workers : int, optional
+            Maximum number of files validated concurrently. Defaults to 16.
+        '''
+        from ic_scanner import scan_ics
+        ic_files = scan_ics(ic_dir, globstr, regex, validate, required_vars, max_workers)
+        if(len(ic_files) == 0):
+            raise RuntimeError('no initial condition files found in {}'.format(ic_dir))
+        self._add_ic_files(ic_files)
+
+
+    def perturb_members(self, base_ic, n, out_dir, variables=('T',), amplitude=1e-14, 
+                        relative=True, seed=0, include_base=False, overwrite=False, max_workers=4):
         '''
-        if globstr is not None: 
-            globstr = '{}/{}'.format(ic_dir, globstr)
-        globstr = '{}/*'.format(ic_dir)
-        ic_files = glob.glob(globstr)
-        ic_files = ['\"{}\"'.format(f) for f in ic_files if not os.path.isdir(f)]
-        ic_files = sorted(ic_files)
+        Generates N ensemble members from a single initial condition file, by writing N 
+        copies of it with independent random perturbations (see ic_perturb.perturb_ic()), and
+        adds them as members. Files are perturbed in bounded-size chunks through memory maps,
+        so that memory use does not depend on the grid size.
+
+        Parameters
+        ----------
+        base_ic : string
+            Location of the unperturbed initial condition file (netcdf)
+        n : int
+            Number of perturbed members to generate
+        out_dir : string
+            Directory in which to write the perturbed files, named {base}.pert{i:03d}.nc
+        variables : string list, optional
+            Variables to perturb. Defaults to ('T',).
+        amplitude : float, optional
+            Perturbation amplitude. Defaults to 1e-14.
+        relative : bool, optional
+            Whether amplitude is relative to each value, or absolute. Defaults to True.
+        seed : int, optional
+            Seed of the perturbations; the perturbation of member i is reproducible given seed
+            and i. Defaults to 0.
+        include_base : bool, optional
+            Whether to also add the unperturbed file as a member. Defaults to False.
+        overwrite : bool, optional
+            Whether to regenerate perturbed files which already exist. Defaults to False, in 
+            which case existing files are assumed to be from a previous call with the same
+            arguments, and are reused.
+        max_workers : int, optional
+            Maximum number of files written concurrently. Defaults to 4.
+        '''
+        from concurrent.futures import ThreadPoolExecutor
+        from ic_perturb import perturb_ic
+        os.makedirs(out_dir, exist_ok=True)
+        stem = os.path.splitext(os.path.basename(base_ic))[0]
+        outs = ['{}/{}.pert{:03d}.nc'.format(os.path.abspath(out_dir), stem, i+1) for i in range(n)]
+        seeds = np.random.SeedSequence(seed).spawn(n)
+        todo = [i for i in range(n) if overwrite or not os.path.isfile(outs[i])]
+        
+        print('\n\n =============== WRITING {} PERTURBED ICS ===============\n'.format(len(todo)))
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            list(pool.map(lambda i: perturb_ic(base_ic, outs[i], seeds[i], variables, amplitude,
+                                               relative), todo))
+        self._add_ic_files(([os.path.abspath(base_ic)] if include_base else []) + outs)
+
+
+    def _add_ic_files(self, ic_files):
+        '''
+        Adds one ensemble member per initial condition file, as values of NCDATA
+        '''
+        ic_files = ['\"{}\"'.format(f) for f in ic_files]
         
         self.lattice.expand('NCDATA', values=ic_files)
         self.N = len(ic_files)
@@ -58,7 +146,9 @@ class ensembler:
 
     def create_members(self, root_case, top_clone_dir, top_output_dir, cime_dir,
                        clone_prefix=None, overwrite=False, clean_all=False, 
-                       stdout=None, resubmits=0, read_existing_clones=False):
+                       stdout=None, resubmits=0, read_existing_clones=False, max_workers=1,
+                       clone_mode='create_clone', resume=False, plan_file=None, dry=False,
+                       layout='flat', shard_size=1000):
         '''        
         Parameters
         ----------
@@ -98,10 +188,46 @@ class ensembler:
             been created, and do not need to be made again (e.g. resubmit_hung_clone_runs). 
             Defaults to False.
             If True, then overwrite and clean_all must both be False. This is enforced.
+        max_workers : int, optional
+            Maximum number of members to clone concurrently. Defaults to 1.
+        clone_mode : string, optional
+            Either 'create_clone' or 'copy'; see namelist_lattice.create_clones(). Defaults to 
+            'create_clone'.
+        resume : bool, optional
+            Whether to continue a previous, interrupted call; see 
+            namelist_lattice.create_clones(). Defaults to False.
+        plan_file : string, optional
+            Location of a .json or .csv file to export the plan of the members to; see 
+            clone_plan.export(). Defaults to None.
+        dry : bool, optional
+            If True, members are only planned, and not created. Defaults to False.
+        layout : string, optional
+            'flat', or 'index' to shard members into subdirectories of top_clone_dir (and 
+            top_output_dir) of shard_size members each; see namelist_lattice.create_clones(). 
+            Members keep their ens{V} names. Defaults to 'flat'.
+        shard_size : int, optional
+            Members per shard of the 'index' layout. Defaults to 1000.
+
+        Returns
+        -------
+        plan : clone_plan
+            Only if dry is True
         '''
         ens_sfx = ['ens{:02d}'.format(i+1) for i in range(self.N)]
-        self.lattice.create_clones(root_case, top_clone_dir, top_output_dir, cime_dir, clone_prefix, 
-                                   ens_sfx, overwrite, clean_all, stdout, resubmits, read_existing_clones)
+        return self.lattice.create_clones(root_case, top_clone_dir, top_output_dir, cime_dir, 
+                                          clone_prefix, ens_sfx, overwrite, clean_all, stdout, 
+                                          resubmits, read_existing_clones, max_workers, clone_mode, 
+                                          resume=resume, plan_file=plan_file, dry=dry, 
+                                          layout=layout, shard_size=shard_size)
+    
+    # ------------------------------------------------------------------------------
+    
+    def dedup_members(self, **kwargs):
+        '''
+        Replaces files with identical content across all members with links into a shared 
+        store. See namelist_lattice.dedup_clones() for the arguments.
+        '''
+        return self.lattice.dedup_clones(**kwargs)
     
     # ------------------------------------------------------------------------------
     
@@ -118,6 +244,22 @@ class ensembler:
         self.lattice.submit_clone_runs(dry)
 
 
+    def monitor_members(self, **kwargs):
+        '''
+        Reports where the runs of all members stand. See namelist_lattice.monitor_clone_runs()
+        for the arguments.
+        '''
+        return self.lattice.monitor_clone_runs(**kwargs)
+
+
+    def aggregate_members(self, variables, out, **kwargs):
+        '''
+        Extracts variables (or reductions of them) from the history files of all members into
+        one dataset. See namelist_lattice.aggregate_clone_history() for the arguments.
+        '''
+        return self.lattice.aggregate_clone_history(variables, out, **kwargs)
+
+
     def resubmit_hung_members(self, dry=False): 
         '''
         Resubmit runs of the cloned cases created by self.clone_members() for which the 
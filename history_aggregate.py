@@ -0,0 +1,452 @@
+import os
+import glob
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from case_scanner import read_env_xml
+from ncheader import nc_format, read_header
+
+ERRC  = '\033[91m'
+ENDC  = '\033[0m'
+
+# reductions applied to each variable, per time record:
+#   'none'        : the full field
+#   'mean'        : unweighted mean over all dimensions but time
+#   'global_mean' : area-weighted mean over the horizontal dimensions, keeping e.g. levels
+#   'zonal_mean'  : mean over longitude
+REDUCTIONS = ['none', 'mean', 'global_mean', 'zonal_mean']
+
+# history files of the first (monthly, by default) stream of every component
+DEFAULT_HIST_GLOB = '*.h0.*.nc'
+
+# maximum bytes of a variable read at once
+CHUNK_BYTES = 2**26
+
+# horizontal dimensions of structured (lat, lon) and unstructured (ncol) grids
+_HORIZONTAL = [('lat', 'lon'), ('ncol',)]
+
+# default fill values of the NetCDF float types, by dtype character
+_DEFAULT_FILL = {'f': np.float32(9.9692099683868690e+36), 'd': 9.9692099683868690e+36}
+
+
+# ==========================================================================================
+# ==========================================================================================
+
+
+def find_history(source, hist_glob=DEFAULT_HIST_GLOB):
+    '''
+    Lists the history files of a case, in its run directory and short term archive (as set
+    in its env_run.xml), or of an output directory, in the directory itself, its run
+    directory, and the hist directories of an archive below it
+
+    Parameters
+    ----------
+    source : string
+        Case directory, or output directory
+    hist_glob : string, optional
+        Glob pattern that history file names must match. Defaults to DEFAULT_HIST_GLOB.
+
+    Returns
+    -------
+    files : string list
+        Paths of the history files, sorted by file name (and so by model time), without
+        duplicates
+    '''
+    env = '{}/env_run.xml'.format(source)
+    if(os.path.isfile(env)):
+        fields = read_env_xml(env, ['RUNDIR', 'DOUT_S_ROOT'])
+        dirs = [fields.get('RUNDIR')]
+        if(fields.get('DOUT_S_ROOT') is not None):
+            dirs.extend(glob.glob('{}/*/hist'.format(fields['DOUT_S_ROOT'])))
+    else:
+        dirs = [source, '{}/run'.format(source)] + glob.glob('{}/*/*/hist'.format(source)) + \
+               glob.glob('{}/*/hist'.format(source))
+    files = {}
+    for d in dirs:
+        if(d is None or not os.path.isdir(d)):
+            continue
+        for f in glob.glob('{}/{}'.format(d, hist_glob)):
+            files.setdefault(os.path.basename(f), f)
+    return [files[name] for name in sorted(files)]
+
+
+def aggregate_history(sources, variables, out, reduction='global_mean', hist_glob=DEFAULT_HIST_GLOB,
+                      points=None, coords=None, max_workers=4, chunk_bytes=CHUNK_BYTES):
+    '''
+    Extracts variables from the history files of many clones into one dataset, whose leading
+    dimension is the clone (lattice point), followed by time, and the dimensions each
+    variable keeps after its reduction. Clones are processed in a pool of processes, each
+    streaming through the files of one clone at a time, reading each variable in chunks of
+    at most chunk_bytes (or one time record, if larger) and reducing each chunk as it is
+    read. Peak memory per process is therefore bounded by the chunk size and the reduced
+    output of one clone, not by the size of the files or the number of clones.
+
+    Files in NetCDF classic formats are read through memory maps at the offsets in their
+    headers (see ncheader.read_header()); NetCDF-4 files require the netCDF4 package.
+
+    Parameters
+    ----------
+    sources : string list
+        Case directories, or output directories, of the clones; see find_history()
+    variables : string list
+        Names of the variables to extract
+    out : string
+        Location of the dataset to write, ending in .nc (requires the netCDF4 package) or
+        .npz. Clones are written to a .nc dataset as they complete, while an .npz dataset is
+        held in memory until all clones are done; prefer .nc for unreduced variables.
+    reduction : string or dict, optional
+        One of REDUCTIONS, applied to all variables, or a dict of reductions by variable
+        name (with 'global_mean' for variables not in the dict). Defaults to 'global_mean'.
+        Global means are weighted by the 'area' variable of the files if it has the
+        horizontal dimensions, else by 'gw' (Gaussian weights), else by cos(lat).
+    hist_glob : string, optional
+        Glob pattern that history file names must match. Defaults to DEFAULT_HIST_GLOB.
+    points : int array, optional
+        Flat lattice index of each clone. Defaults to None, in which case clones are
+        numbered in order.
+    coords : dict, optional
+        Parameter values of each clone, as arrays of the length of sources, by parameter
+        name. Defaults to None.
+    max_workers : int, optional
+        Maximum number of clones processed at once. Defaults to 4.
+    chunk_bytes : int, optional
+        Maximum bytes of a variable read at once. Defaults to CHUNK_BYTES.
+
+    Returns
+    -------
+    nfiles : int array
+        Number of history files read per clone
+
+    Raises
+    ------
+    RuntimeError
+        If any clone could not be processed. Failures do not interrupt the other clones;
+        the rows of failed clones are left as NaN, and the dataset is written before the
+        failures are reported.
+    '''
+    variables = list(np.atleast_1d(variables))
+    if(isinstance(reduction, str)):
+        reductions = {v: reduction for v in variables}
+    else:
+        reductions = {v: reduction.get(v, 'global_mean') for v in variables}
+    for r in reductions.values():
+        if(r not in REDUCTIONS):
+            raise RuntimeError(ERRC+'reduction must be one of {}, not {}'.format(REDUCTIONS, r)+ENDC)
+    fmt = os.path.splitext(out)[1].lower()
+    if(fmt not in ['.nc', '.npz']):
+        raise RuntimeError(ERRC+'dataset can be written as .nc or .npz, not {}'.format(fmt)+ENDC)
+    points = np.arange(len(sources)) if points is None else np.asarray(points, dtype=np.int64)
+    coords = {} if coords is None else coords
+    clash = set(coords).intersection(variables + ['point', 'time', 'nfiles'])
+    if(len(clash) > 0):
+        raise RuntimeError(ERRC+'parameter names {} clash with dataset variables'.format(
+                           [str(c) for c in sorted(clash)])+ENDC)
+
+    print('\n\n =============== AGGREGATING {} FROM {} CLONES ===============\n'.format(
+           variables, len(sources)))
+    tasks = [(find_history(source, hist_glob), variables, reductions, chunk_bytes)
+             for source in sources]
+    writer = _nc_writer(out, points, coords) if fmt == '.nc' else _npz_writer(out, points, coords)
+    failures = {}
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            for i, result in enumerate(pool.map(_reduce_clone, tasks)):
+                if('error' in result):
+                    failures[sources[i]] = result['error']
+                else:
+                    writer.write(i, result)
+    finally:
+        nfiles = writer.close()
+
+    if(len(failures) > 0):
+        msg = '\n'.join(['  {}: {}'.format(source, err) for source, err in failures.items()])
+        raise RuntimeError(ERRC+'{} of {} clones could not be aggregated:\n{}'.format(
+                           len(failures), len(sources), msg)+ENDC)
+    return nfiles
+
+
+# ------------------------------------------------------------------------------
+
+
+def _reduce_clone(task):
+    '''
+    Reads and reduces the variables of one clone's history files, in a worker process.
+    Returns a dict with keys 'nfiles', 'time', 'data' (reduced arrays by variable), and
+    'dims' (their dimension names, after time), or with key 'error'.
+    '''
+    files, variables, reductions, chunk_bytes = task
+    try:
+        data = {v: [] for v in variables}
+        dims, times = {}, []
+        for path in files:
+            reader = _open(path)
+            try:
+                weights = {}
+                for v in variables:
+                    if(v not in reader.dims):
+                        raise RuntimeError('variable {} not found in {}'.format(v, path))
+                    vdims = reader.dims[v][1:] if reader.is_record(v) else reader.dims[v]
+                    dtype = np.float32 if reader.dtype(v).itemsize <= 4 else np.float64
+                    for chunk in reader.chunks(v, chunk_bytes):
+                        reduced, dims[v] = _reduce(chunk, vdims, reductions[v], reader, weights)
+                        data[v].append(reduced.astype(dtype))
+                if('time' in reader.dims and reader.is_record('time')):
+                    times.append(np.concatenate(list(reader.chunks('time', chunk_bytes))))
+            finally:
+                reader.close()
+        return {'nfiles': len(files),
+                'time': np.concatenate(times) if len(times) > 0 else np.zeros(0),
+                'data': {v: np.concatenate(data[v]) if len(data[v]) > 0 else None
+                         for v in variables},
+                'dims': dims}
+    except Exception as e:
+        return {'error': '{}: {}'.format(type(e).__name__, e)}
+
+
+def _reduce(x, dims, reduction, reader, weights):
+    '''
+    Reduces a chunk x of shape (time, *dims), returning the reduced chunk and its dimension
+    names after time. Horizontal weights of global means are cached in weights.
+    '''
+    axes = tuple(range(1, x.ndim))
+    if(reduction == 'none'):
+        return x, tuple(dims)
+    if(reduction == 'mean'):
+        return _weighted_mean(x, axes, None), ()
+    if(reduction == 'zonal_mean'):
+        if('lon' not in dims):
+            raise RuntimeError('zonal_mean requires a lon dimension, found {}'.format(dims))
+        ax = dims.index('lon')
+        return _weighted_mean(x, (ax + 1,), None), tuple(d for d in dims if d != 'lon')
+
+    # global mean, over the trailing horizontal dimensions
+    horizontal = [h for h in _HORIZONTAL if tuple(dims[-len(h):]) == h]
+    if(len(horizontal) == 0):
+        raise RuntimeError('global_mean requires (lat, lon) or (ncol) as the last dimensions, '\
+                           'found {}'.format(dims))
+    h = horizontal[0]
+    if(h not in weights):
+        weights[h] = _horizontal_weights(reader, h)
+    return _weighted_mean(x, axes[-len(h):], weights[h]), tuple(dims[:-len(h)])
+
+
+def _weighted_mean(x, axes, w):
+    '''
+    Mean of x over axes, ignoring NaN, weighted by w (broadcast against the trailing axes)
+    '''
+    valid = np.isfinite(x)
+    w = np.ones(1) if w is None else w
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.sum(np.where(valid, x * w, 0), axis=axes) / np.sum(np.where(valid, w, 0), axis=axes)
+
+
+def _horizontal_weights(reader, h):
+    '''
+    Area weights of the horizontal dimensions h, from the 'area' or 'gw' variables of a file,
+    or from its latitudes
+    '''
+    if('area' in reader.dims and tuple(reader.dims['area']) == h):
+        return reader.array('area')
+    if(h == ('lat', 'lon')):
+        nlon = len(reader.array('lon'))
+        lat_weights = reader.array('gw') if 'gw' in reader.dims else np.cos(np.deg2rad(reader.array('lat')))
+        return lat_weights[:, None] * np.ones(nlon)
+    if('lat' in reader.dims and tuple(reader.dims['lat']) == h):
+        return np.cos(np.deg2rad(reader.array('lat')))
+    raise RuntimeError('no area, gw, or lat variable to weight the global mean')
+
+
+def _masked(x, fill):
+    '''
+    Converts a chunk to float64, with fill values replaced by NaN
+    '''
+    x = np.asarray(x)
+    y = x.astype(np.float64)
+    if(fill is not None and x.dtype.kind == 'f'):
+        y[x == fill] = np.nan
+    return y
+
+
+# ------------------------------------------------------------------------------
+
+
+def _open(path):
+    '''
+    Opens a history file with the reader for its format
+    '''
+    fmt = nc_format(path)
+    if(fmt == 'classic'):
+        return _classic_reader(path)
+    if(fmt == 'hdf5'):
+        return _netcdf4_reader(path)
+    raise RuntimeError('{} is not a NetCDF file'.format(path))
+
+
+class _classic_reader:
+    def __init__(self, path):
+        '''
+        Reads variables of a NetCDF classic format file through memory maps
+        '''
+        self.path = path
+        self.header = read_header(path)
+        self.dims = {name: tuple(var['dims']) for name, var in self.header['variables'].items()}
+
+    def is_record(self, name):
+        return self.header['variables'][name]['record']
+
+    def dtype(self, name):
+        return self.header['variables'][name]['dtype']
+
+    def chunks(self, name, chunk_bytes):
+        '''
+        Yields the variable as float64 chunks of whole time records (or as a single chunk
+        with a leading axis of length 1, if not a record variable)
+        '''
+        var = self.header['variables'][name]
+        dtype = var['dtype']
+        fill = dtype.type(var['attributes'].get('_FillValue', _DEFAULT_FILL.get(dtype.char, 0)))
+        if(not var['record']):
+            if(np.prod(var['shape'], dtype=np.int64) == 0):
+                return
+            yield _masked(np.memmap(self.path, dtype=dtype, mode='r', offset=var['begin'],
+                                    shape=var['shape']), fill)[None]
+            return
+        # record variables are interleaved; map each record separately
+        shape = var['shape'][1:]
+        row = max(int(np.prod(shape, dtype=np.int64)) * dtype.itemsize, 1)
+        step = max(1, chunk_bytes // row)
+        nrec = var['shape'][0] or 0
+        for r0 in range(0, nrec, step):
+            yield _masked(np.stack([np.memmap(self.path, dtype=dtype, mode='r', shape=shape,
+                                              offset=var['begin'] + r * self.header['recsize'])
+                                    for r in range(r0, min(r0 + step, nrec))]), fill)
+
+    def array(self, name):
+        x = np.concatenate(list(self.chunks(name, CHUNK_BYTES)))
+        return x if self.is_record(name) else x[0]
+
+    def close(self):
+        pass
+
+
+class _netcdf4_reader:
+    def __init__(self, path):
+        '''
+        Reads variables of a NetCDF-4 file with the netCDF4 package
+        '''
+        try:
+            import netCDF4
+        except ImportError:
+            raise RuntimeError('reading NetCDF-4 file {} requires the netCDF4 package'.format(path))
+        self._default_fill = netCDF4.default_fillvals
+        self.ds = netCDF4.Dataset(path)
+        self.ds.set_auto_mask(False)
+        self.dims = {name: tuple(var.dimensions) for name, var in self.ds.variables.items()}
+
+    def is_record(self, name):
+        d = self.dims[name]
+        return len(d) > 0 and self.ds.dimensions[d[0]].isunlimited()
+
+    def dtype(self, name):
+        return self.ds.variables[name].dtype
+
+    def chunks(self, name, chunk_bytes):
+        var = self.ds.variables[name]
+        fill = getattr(var, '_FillValue', self._default_fill.get(var.dtype.str[1:]))
+        if(not self.is_record(name)):
+            yield _masked(var[...], fill)[None]
+            return
+        row = max(int(np.prod(var.shape[1:], dtype=np.int64)) * var.dtype.itemsize, 1)
+        step = max(1, chunk_bytes // row)
+        for r0 in range(0, var.shape[0], step):
+            yield _masked(var[r0:r0 + step], fill)
+
+    def array(self, name):
+        x = np.concatenate(list(self.chunks(name, CHUNK_BYTES)))
+        return x if self.is_record(name) else x[0]
+
+    def close(self):
+        self.ds.close()
+
+
+# ------------------------------------------------------------------------------
+
+
+class _npz_writer:
+    def __init__(self, path, points, coords):
+        '''
+        Collects clone results, and writes them to a compressed .npz file on close()
+        '''
+        self.path, self.points, self.coords = path, points, coords
+        self.results = [None] * len(points)
+
+    def write(self, i, result):
+        self.results[i] = result
+
+    def close(self):
+        done = [r for r in self.results if r is not None]
+        ntime = max([len(r['time']) for r in done] + [0])
+        arrays = {'point': self.points,
+                  'nfiles': np.array([0 if r is None else r['nfiles'] for r in self.results])}
+        arrays.update({name: np.asarray(values) for name, values in self.coords.items()})
+        arrays['time'] = _stack([None if r is None else r['time'] for r in self.results], ntime)
+        for v in (done[0]['data'] if len(done) > 0 else []):
+            arrays[v] = _stack([None if r is None else r['data'][v] for r in self.results], ntime)
+        np.savez_compressed(self.path, **arrays)
+        return arrays['nfiles']
+
+
+class _nc_writer:
+    def __init__(self, path, points, coords):
+        '''
+        Writes clone results to a NetCDF-4 file as they arrive, along an unlimited time
+        dimension, with the parameter values of each clone as variables along 'point'
+        '''
+        try:
+            import netCDF4
+        except ImportError:
+            raise RuntimeError(ERRC+'writing {} requires the netCDF4 package; write an .npz '\
+                               'dataset instead'.format(path)+ENDC)
+        self.ds = netCDF4.Dataset(path, 'w')
+        self.ds.createDimension('point', len(points))
+        self.ds.createDimension('time', None)
+        self.ds.createVariable('point', 'i8', ('point',))[:] = points
+        for name, values in coords.items():
+            values = np.asarray(values)
+            if(values.dtype.kind in 'iufb'):
+                self.ds.createVariable(name, values.dtype, ('point',))[:] = values
+            else:
+                self.ds.createVariable(name, str, ('point',))[:] = values.astype(str).astype(object)
+        self.ds.createVariable('time', 'f8', ('point', 'time'), fill_value=np.nan)
+        self.nfiles = np.zeros(len(points), dtype=np.int32)
+
+    def write(self, i, result):
+        self.nfiles[i] = result['nfiles']
+        self.ds['time'][i, :len(result['time'])] = result['time']
+        for v, data in result['data'].items():
+            if(data is None):
+                continue
+            if(v not in self.ds.variables):
+                for d, n in zip(result['dims'][v], data.shape[1:]):
+                    if(d not in self.ds.dimensions):
+                        self.ds.createDimension(d, n)
+                self.ds.createVariable(v, data.dtype, ('point', 'time') + tuple(result['dims'][v]),
+                                       fill_value=np.nan, zlib=True, complevel=1)
+            self.ds[v][i, :len(data)] = data
+
+    def close(self):
+        self.ds.createVariable('nfiles', 'i4', ('point',))[:] = self.nfiles
+        self.ds.close()
+        return self.nfiles
+
+
+def _stack(arrays, ntime):
+    '''
+    Stacks per-clone arrays of varying length along time into one array, padded with NaN
+    '''
+    shape = next((a.shape[1:] for a in arrays if a is not None), ())
+    dtype = next((a.dtype for a in arrays if a is not None), np.float64)
+    out = np.full((len(arrays), ntime) + shape, np.nan, dtype=dtype)
+    for i, a in enumerate(arrays):
+        if(a is not None):
+            out[i, :len(a)] = a
+    return out
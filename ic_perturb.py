@@ -0,0 +1,197 @@
+import os
+import shutil
+import warnings
+import numpy as np
+from ncheader import nc_format, read_header
+
+WARNC = '\033[93m'
+ERRC  = '\033[91m'
+ENDC  = '\033[0m'
+
+# maximum bytes of a variable held in memory at once while perturbing
+CHUNK_BYTES = 2**26
+
+# default fill values of the NetCDF classic float types, by dtype character
+_DEFAULT_FILL = {'f': np.float32(9.9692099683868690e+36), 'd': 9.9692099683868690e+36}
+
+
+# ==========================================================================================
+# ==========================================================================================
+
+
+def perturb_ic(base, out, seed, variables=('T',), amplitude=1e-14, relative=True,
+               chunk_bytes=CHUNK_BYTES):
+    '''
+    Writes a copy of a NetCDF initial condition file with random perturbations applied to
+    some of its variables. Each perturbed value is x*(1 + amplitude*r) if relative, or
+    x + amplitude*r otherwise, with r uniform in [-1, 1) (as with CAM's pertlim). Fill values
+    are left unperturbed. A relative amplitude below the resolution (machine epsilon) of a
+    variable's dtype, e.g. the default 1e-14 for single precision variables, is an error, as
+    is any perturbation which leaves every value of a variable unchanged. Variables without
+    values (e.g. record variables of a file with no records) are skipped with a warning. The
+    records of streaming files, whose headers do not count them, are counted from the file
+    size.
+
+    The base file is copied, and the copy is perturbed in place, one chunk of at most
+    chunk_bytes at a time, so that peak memory does not depend on the grid size. Classic
+    format files are memory mapped at the variable offsets read from their headers; NetCDF-4
+    files are updated with the netCDF4 package, if installed.
+
+    Parameters
+    ----------
+    base : string
+        Location of the unperturbed file
+    out : string
+        Location of the perturbed file to write
+    seed : int or np.random.SeedSequence
+        Seed of the perturbations
+    variables : string list, optional
+        Variables to perturb; must be floating point. Defaults to ('T',).
+    amplitude : float, optional
+        Perturbation amplitude. Defaults to 1e-14.
+    relative : bool, optional
+        Whether amplitude is relative to each value, or absolute. Defaults to True.
+    chunk_bytes : int, optional
+        Maximum bytes of a variable perturbed at once. Defaults to CHUNK_BYTES.
+
+    Returns
+    -------
+    changed : dict
+        Number of values changed by the perturbation, by variable; None for skipped variables
+    '''
+    fmt = nc_format(base)
+    if(fmt is None):
+        raise RuntimeError(ERRC+'{} is not a NetCDF file'.format(base)+ENDC)
+    rng = np.random.default_rng(seed)
+    tmp = '{}/.{}.tmp'.format(os.path.dirname(os.path.abspath(out)), os.path.basename(out))
+    shutil.copyfile(base, tmp)
+    try:
+        if(fmt == 'classic'):
+            changed = _perturb_classic(tmp, rng, variables, amplitude, relative, chunk_bytes)
+        else:
+            changed = _perturb_netcdf4(tmp, rng, variables, amplitude, relative, chunk_bytes)
+        empty = [name for name, n in changed.items() if n is None]
+        unchanged = [name for name, n in changed.items() if n == 0]
+        if(len(unchanged) > 0):
+            raise RuntimeError(ERRC+'perturbations of amplitude {} left every value of {} '\
+                               'unchanged'.format(amplitude, ', '.join(unchanged))+ENDC)
+        os.replace(tmp, out)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    if(len(empty) > 0):
+        warnings.warn(WARNC+'variables {} of {} have no values, and were not perturbed'.format(
+                      ', '.join(empty), base)+ENDC)
+    return changed
+
+
+# ------------------------------------------------------------------------------
+
+
+def _check_variable(name, dtype, amplitude, relative):
+    '''
+    Checks that a variable is floating point, and that a relative amplitude is representable
+    in its dtype
+    '''
+    if(dtype.kind != 'f'):
+        raise RuntimeError(ERRC+'variable {} is not floating point'.format(name)+ENDC)
+    eps = np.finfo(dtype).eps
+    if(relative and amplitude < eps):
+        raise RuntimeError(ERRC+'relative amplitude {} is below the resolution of variable {} '\
+                           '({}, epsilon {:.3g}), and would leave (nearly) all of its values '\
+                           'unchanged'.format(amplitude, name, dtype.name, eps)+ENDC)
+
+
+def _perturb(x, rng, amplitude, relative, fill):
+    '''
+    Perturbs an array chunk, returning the perturbed values in its dtype, and the number of
+    values changed
+    '''
+    r = amplitude * (2 * rng.random(x.shape) - 1)
+    y = x * (1 + r) if relative else x + r
+    if(fill is not None):
+        y = np.where(x == fill, x, y)
+    y = y.astype(x.dtype)
+    return y, int(np.count_nonzero(y != x))
+
+
+def _slabs(shape, itemsize, chunk_bytes):
+    '''
+    Splits the leading axis of an array of shape into slices of at most chunk_bytes each
+    (or single rows, if a row exceeds chunk_bytes)
+    '''
+    if(len(shape) == 0):
+        return [()]
+    row = int(np.prod(shape[1:], dtype=np.int64)) * itemsize
+    step = max(1, chunk_bytes // max(row, 1))
+    return [slice(i, min(i+step, shape[0])) for i in range(0, shape[0], step)]
+
+
+def _perturb_classic(path, rng, variables, amplitude, relative, chunk_bytes):
+    '''
+    Perturbs variables of a classic format file in place through memory maps. Returns the
+    number of values changed per variable, or None for variables without values.
+    '''
+    header = read_header(path)
+    numrecs = header['numrecs']
+    records = [v for v in header['variables'].values() if v['record']]
+    if(numrecs is None and len(records) > 0):
+        # streaming files do not record the number of records; count them from the file size
+        start = min(v['begin'] for v in records)
+        numrecs = 0 if header['recsize'] == 0 else \
+                  (os.path.getsize(path) - start) // header['recsize']
+
+    changed = {}
+    for name in variables:
+        if(name not in header['variables']):
+            raise RuntimeError(ERRC+'variable {} not found in {}'.format(name, path)+ENDC)
+        var = header['variables'][name]
+        dtype = var['dtype']
+        _check_variable(name, dtype, amplitude, relative)
+        fill = var['attributes'].get('_FillValue', _DEFAULT_FILL[dtype.char])
+
+        # non-record variables are one array, and record variables are interleaved, so that
+        # each record is mapped separately
+        if(not var['record']):
+            arrays = [(var['begin'], var['shape'])]
+        else:
+            arrays = [(var['begin'] + rec * header['recsize'], var['shape'][1:])
+                      for rec in range(numrecs)]
+        if(sum(np.prod(shape, dtype=np.int64) for _, shape in arrays) == 0):
+            changed[name] = None
+            continue
+        changed[name] = 0
+        for begin, shape in arrays:
+            data = np.memmap(path, dtype=dtype, mode='r+', offset=begin, shape=shape)
+            for s in _slabs(shape, dtype.itemsize, chunk_bytes):
+                data[s], n = _perturb(np.asarray(data[s]), rng, amplitude, relative, fill)
+                changed[name] += n
+            data.flush()
+            del data
+    return changed
+
+
+def _perturb_netcdf4(path, rng, variables, amplitude, relative, chunk_bytes):
+    '''
+    Perturbs variables of a NetCDF-4 file in place with the netCDF4 package
+    '''
+    try:
+        import netCDF4
+    except ImportError:
+        raise RuntimeError(ERRC+'perturbing NetCDF-4 file {} requires the netCDF4 '\
+                           'package'.format(path)+ENDC)
+    changed = {}
+    with netCDF4.Dataset(path, 'a') as ds:
+        for name in variables:
+            var = ds.variables[name]
+            var.set_auto_maskandscale(False)
+            _check_variable(name, var.dtype, amplitude, relative)
+            fill = getattr(var, '_FillValue', netCDF4.default_fillvals[var.dtype.str[1:]])
+            if(var.size == 0):
+                changed[name] = None
+                continue
+            changed[name] = 0
+            for s in _slabs(var.shape, var.dtype.itemsize, chunk_bytes):
+                var[s], n = _perturb(np.asarray(var[s]), rng, amplitude, relative, fill)
+                changed[name] += n
+    return changed
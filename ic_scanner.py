@@ -0,0 +1,115 @@
+import os
+import re
+import struct
+import fnmatch
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from ncheader import nc_format, read_header
+
+ERRC  = '\033[91m'
+ENDC  = '\033[0m'
+
+# cache of scan results, keyed by (directory, globstr, regex, validate, required_vars),
+# holding (directory mtime_ns, files)
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+# ==========================================================================================
+# ==========================================================================================
+
+
+def scan_ics(ic_dir, globstr=None, regex=None, validate=False, required_vars=None,
+             max_workers=16):
+    '''
+    Lists the initial condition files in a directory, in a single os.scandir pass which
+    applies the glob and regex filters to file names, and does not stat each entry (file
+    types are read from the directory listing where the filesystem provides them). Files can
+    optionally be validated as NetCDF by their headers, concurrently. Results are cached by
+    the directory's modification time, so rescanning an unchanged directory costs one stat.
+
+    Parameters
+    ----------
+    ic_dir : string
+        Directory containing initial condition files. Subdirectories are ignored, as are
+        hidden files (e.g. .nfs* or editor swap files), unless globstr starts with '.', as
+        with glob.glob().
+    globstr : string, optional
+        Glob pattern that file names must match. Defaults to None.
+    regex : string, optional
+        Regular expression that file names must contain a match of (see re.search()).
+        Defaults to None.
+    validate : boolean, optional
+        Whether to keep only files which are NetCDF, by their leading magic bytes. Defaults
+        to False.
+    required_vars : string list, optional
+        Variables that each file must contain; implies validate. Headers of classic format
+        files are parsed directly (see ncheader.read_header()); NetCDF-4 files require the
+        netCDF4 package. Defaults to None.
+    max_workers : int, optional
+        Maximum number of files validated at once. Defaults to 16.
+
+    Returns
+    -------
+    ic_files : string list
+        Sorted paths of the matching files
+    '''
+    ic_dir = os.path.abspath(ic_dir)
+    required_vars = None if required_vars is None else tuple(sorted(required_vars))
+    validate = validate or required_vars is not None
+    key = (ic_dir, globstr, regex, validate, required_vars)
+    mtime = os.stat(ic_dir).st_mtime_ns
+    with _cache_lock:
+        cached = _cache.get(key)
+    if(cached is not None and cached[0] == mtime):
+        return list(cached[1])
+
+    pattern = None if regex is None else re.compile(regex)
+    hidden = globstr is not None and globstr.startswith('.')
+    with os.scandir(ic_dir) as it:
+        files = sorted(entry.path for entry in it
+                       if (hidden or not entry.name.startswith('.'))
+                       and entry.is_file()
+                       and (globstr is None or fnmatch.fnmatch(entry.name, globstr))
+                       and (pattern is None or pattern.search(entry.name) is not None))
+
+    if(validate):
+        check = lambda path: _is_valid(path, required_vars)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            files = [f for f, ok in zip(files, pool.map(check, files)) if ok]
+
+    with _cache_lock:
+        _cache[key] = (mtime, files)
+    return list(files)
+
+
+# ------------------------------------------------------------------------------
+
+
+def _is_valid(path, required_vars):
+    '''
+    Whether a file is NetCDF, and contains all required variables
+    '''
+    try:
+        fmt = nc_format(path)
+        if(fmt is None):
+            return False
+        if(required_vars is None):
+            return True
+        if(fmt == 'classic'):
+            try:
+                variables = read_header(path)['variables']
+            except (RuntimeError, struct.error):
+                # malformed or truncated header
+                return False
+        else:
+            try:
+                import netCDF4
+            except ImportError:
+                raise RuntimeError(ERRC+'checking variables of NetCDF-4 file {} requires the '\
+                                   'netCDF4 package'.format(path)+ENDC)
+            with netCDF4.Dataset(path) as ds:
+                variables = ds.variables
+        return all(v in variables for v in required_vars)
+    except (OSError, ValueError, KeyError):
+        return False
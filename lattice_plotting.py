@@ -0,0 +1,258 @@
+import numpy as np
+import matplotlib as mpl
+from matplotlib.figure import Figure
+
+# plotting is kept out of namelist_lattice so that importing it does not import matplotlib;
+# this module is only imported by namelist_lattice.vis_planes()
+mpl.rcParams['axes.xmargin'] = 0.1
+mpl.rcParams['axes.ymargin'] = 0.1
+
+# lattices with more points than this are drawn as binned 2d histograms rather than scatters
+MAX_SCATTER = 5000
+
+# colors of clone states when coloring by status; points without a clone are drawn light grey
+STATUS_COLORS = {'none': '#d9d9d9', 'pending': '#9e9ac8', 'created': '#6baed6',
+                 'submitted': '#fd8d3c', 'running': '#fdae6b', 'complete': '#31a354',
+                 'failed': '#de2d26', 'hung': '#756bb1'}
+
+
+# ==========================================================================================
+# ==========================================================================================
+
+
+def vis_planes(lattice, color=None, outfile=None, names=None, bins=40, max_scatter=MAX_SCATTER,
+               figsize=None, dpi=150, cmap='viridis'):
+    '''
+    Visualizes the lattice as a corner plot, with the projection of all points onto each
+    parameter pair plane below the diagonal, and the marginal distribution of each parameter
+    on the diagonal. Projections are computed from the lattice codes (see lazy_lattice.codes()),
+    so no points are materialized. Lattices with more than max_scatter points are drawn as
+    binned 2d histograms, and all point layers are rasterized, so that the cost of drawing
+    does not grow with the number of points.
+
+    Parameters
+    ----------
+    lattice : namelist_lattice
+        The lattice to plot
+    color : string or array, optional
+        'status' to color points by the state of their clone (see STATUS_COLORS), 'metric'
+        to color points by the metric recorded for their clone (see sequential_design), or
+        an array of values with one entry per lattice point. Points without a value (NaN)
+        are drawn grey. In histogram mode, bins are colored by the mean value of their
+        points, and clone states are drawn as a scatter of the cloned points over the
+        histogram. Defaults to None.
+    outfile : string, optional
+        File to write the figure to, in the format given by its extension (e.g. .png, .svg,
+        .pdf). The figure is drawn without a display, so this is safe on login and compute
+        nodes. Defaults to None, in which case the figure is shown interactively.
+    names : string list, optional
+        Parameters to plot. Defaults to None, in which case all are plotted.
+    bins : int, optional
+        Number of histogram bins of continuous parameters; parameters with at most this many
+        distinct values are binned exactly. Defaults to 40.
+    max_scatter : int, optional
+        Maximum number of points drawn as a scatter. Defaults to MAX_SCATTER.
+    figsize : (2,) float, optional
+        Figure size in inches. Defaults to None, in which case 2 inches per parameter are used.
+    dpi : int, optional
+        Resolution of outfile and of rasterized layers. Defaults to 150.
+    cmap : string, optional
+        Colormap of metric values and histogram densities. Defaults to 'viridis'.
+
+    Returns
+    -------
+    fig : matplotlib Figure
+    '''
+
+    # the lattice property requires 2 dimensions; 1d lattices are plotted as a histogram
+    lat = lattice._lattice
+    if(lat is None):
+        raise RuntimeError('Lattice must first be built by calling expand()')
+    names = list(lat.names) if names is None else list(np.atleast_1d(names))
+    dims = [lat.names.index(n) for n in names]
+    N = len(dims)
+    codes = lat.codes()
+    npoints = len(codes)
+    axes_ = [_axis(lat.vectors[m], bins) for m in dims]
+    pos = np.column_stack([a['centers'][a['bin'][codes[:, m]]] if npoints > max_scatter else
+                           a['position'][codes[:, m]] for a, m in zip(axes_, dims)]) \
+          if npoints > 0 else np.zeros((0, N))
+    binned = np.column_stack([a['bin'][codes[:, m]] for a, m in zip(axes_, dims)]) \
+             if npoints > 0 else np.zeros((0, N), dtype=int)
+    values, status = _colors(lattice, color, npoints)
+
+    if(figsize is None):
+        figsize = (max(2*N, 4), max(2*N, 4))
+    if(outfile is not None):
+        fig = Figure(figsize=figsize, dpi=dpi)
+    else:
+        import matplotlib.pyplot as plt
+        fig = plt.figure(figsize=figsize, dpi=dpi)
+    ax = fig.subplots(N, N, squeeze=False)
+    norm = None
+    if(values is not None and np.any(np.isfinite(values))):
+        norm = mpl.colors.Normalize(np.nanmin(values), np.nanmax(values))
+
+    for i in range(N):
+        for j in range(N):
+            if(j > i):
+                ax[i, j].axis('off')
+                continue
+            a = ax[i, j]
+            if(i == j):
+                # marginal distribution
+                counts = np.bincount(binned[:, i], minlength=len(axes_[i]['centers']))
+                a.bar(axes_[i]['centers'], counts, width=np.diff(axes_[i]['edges']),
+                      color='0.6', edgecolor='none')
+                a.set_yticks([])
+            elif(npoints > max_scatter):
+                _draw_histogram(a, axes_[j], axes_[i], binned[:, j], binned[:, i], values,
+                                norm, cmap)
+            else:
+                c = 'r' if values is None and status is None else \
+                    (status if status is not None else _map(values, norm, cmap))
+                a.scatter(pos[:, j], pos[:, i], c=c, s=12, lw=0, rasterized=True)
+            if(status is not None and npoints > max_scatter and i != j):
+                cloned = np.flatnonzero(status != STATUS_COLORS['none'])
+                a.scatter(_jitter(axes_[j], binned[cloned, j]), _jitter(axes_[i], binned[cloned, i]),
+                          c=status[cloned], s=6, lw=0, rasterized=True)
+            a.grid(True, lw=0.3)
+            _ticks(a.xaxis, axes_[j])
+            if(i != j): _ticks(a.yaxis, axes_[i])
+            if(j == 0 and i != 0):
+                a.set_ylabel(names[i])
+            elif(i != j):
+                a.set_yticklabels([])
+            if(i == N-1):
+                a.set_xlabel(names[j])
+            else:
+                a.set_xticklabels([])
+
+    if(norm is not None):
+        fig.colorbar(mpl.cm.ScalarMappable(norm=norm, cmap=cmap), ax=ax[0, N-1] if N > 1 else ax,
+                     label='metric' if isinstance(color, str) else None)
+    if(status is not None):
+        handles = [mpl.lines.Line2D([], [], ls='', marker='o', color=c, label=s)
+                   for s, c in STATUS_COLORS.items()]
+        fig.legend(handles=handles, loc='upper right', frameon=False)
+
+    if(outfile is not None):
+        fig.savefig(outfile, dpi=dpi)
+    else:
+        plt.show()
+    return fig
+
+
+# ------------------------------------------------------------------------------
+
+
+def _axis(vector, bins):
+    '''
+    Describes the plotting axis of one dimension: its tick labels, the position of each of
+    its values, the bin of each of its values, and the bin centers and edges. Non-numeric
+    dimensions, and those with at most bins distinct values, have one bin per distinct value;
+    non-numeric values are placed at integer positions.
+    '''
+    numeric = vector.dtype.kind in 'iuf'
+    unique, inverse = np.unique(vector, return_inverse=True)
+    if(numeric):
+        position = vector.astype(float)
+    else:
+        position = inverse.astype(float)
+
+    if(not numeric or len(unique) <= bins):
+        centers = unique.astype(float) if numeric else np.arange(len(unique), dtype=float)
+        if(len(centers) > 1):
+            mids = (centers[1:] + centers[:-1]) / 2
+            edges = np.concatenate([[2*centers[0] - mids[0]], mids, [2*centers[-1] - mids[-1]]])
+        else:
+            edges = centers[0] + np.array([-0.5, 0.5])
+        bin_ = inverse
+    else:
+        edges = np.linspace(position.min(), position.max(), bins+1)
+        centers = (edges[1:] + edges[:-1]) / 2
+        bin_ = np.clip(np.searchsorted(edges, position, side='right') - 1, 0, bins-1)
+    return {'numeric': numeric, 'labels': None if numeric else [str(u) for u in unique],
+            'position': position, 'bin': bin_, 'centers': centers, 'edges': edges}
+
+
+def _colors(lattice, color, npoints):
+    '''
+    Returns per-point color values (float array, or None), and per-point status colors
+    (string array, or None)
+    '''
+    if(color is None):
+        return None, None
+    if(isinstance(color, str)):
+        if(color not in ['status', 'metric']):
+            raise RuntimeError('color must be \'status\', \'metric\', or an array of values')
+        lat = lattice._lattice
+        flat, cases = lattice.clone_points()
+        selection = lat.flat_indices()
+        idx = np.searchsorted(selection, flat)
+        inside = (idx < len(selection)) & (selection[np.minimum(idx, len(selection)-1)] == flat) \
+                 if len(selection) > 0 else np.zeros(len(flat), dtype=bool)
+        records = [lattice.clone_records[case] for case in cases]
+        if(color == 'status'):
+            status = np.full(npoints, STATUS_COLORS['none'], dtype=object)
+            status[idx[inside]] = [STATUS_COLORS.get(r['state'], 'k')
+                                   for r, k in zip(records, inside) if k]
+            return None, status
+        values = np.full(npoints, np.nan)
+        values[idx[inside]] = [np.nan if r.get('metric') is None else r['metric']
+                               for r, k in zip(records, inside) if k]
+        return values, None
+    values = np.asarray(color, dtype=float)
+    if(len(values) != npoints):
+        raise RuntimeError('color has length {}, but the lattice has {} points'.format(
+                           len(values), npoints))
+    return values, None
+
+
+def _draw_histogram(a, xaxis, yaxis, xbin, ybin, values, norm, cmap):
+    '''
+    Draws the 2d histogram of points over the bins of two axes; if values are passed, bins
+    are colored by the mean of their finite values instead of by density
+    '''
+    nx, ny = len(xaxis['centers']), len(yaxis['centers'])
+    flat = ybin * nx + xbin
+    counts = np.bincount(flat, minlength=nx*ny).reshape(ny, nx)
+    if(values is None):
+        image = np.ma.masked_equal(counts, 0)
+        a.pcolormesh(xaxis['edges'], yaxis['edges'], image, cmap='Greys', rasterized=True,
+                     norm=mpl.colors.LogNorm(0.5, max(counts.max(), 2)))
+        return
+    finite = np.isfinite(values)
+    sums = np.bincount(flat[finite], weights=values[finite], minlength=nx*ny).reshape(ny, nx)
+    n = np.bincount(flat[finite], minlength=nx*ny).reshape(ny, nx)
+    a.pcolormesh(xaxis['edges'], yaxis['edges'], np.ma.masked_equal(counts, 0), cmap='Greys',
+                 vmin=0, vmax=4*max(counts.max(), 1), rasterized=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        a.pcolormesh(xaxis['edges'], yaxis['edges'], np.ma.masked_invalid(sums / n),
+                     cmap=cmap, norm=norm, rasterized=True)
+
+
+def _jitter(axis, bins):
+    '''
+    Positions points within their bins, spread so that overlaid clones remain visible
+    '''
+    width = np.diff(axis['edges'])[bins]
+    return axis['centers'][bins] + (np.random.default_rng(0).random(len(bins)) - 0.5) * 0.6 * width
+
+
+def _map(values, norm, cmap):
+    '''
+    Maps values to colors, with NaN drawn grey
+    '''
+    colors = mpl.colormaps[cmap](norm(values)) if norm is not None else np.zeros((len(values), 4))
+    colors[~np.isfinite(values)] = mpl.colors.to_rgba('0.7')
+    return colors
+
+
+def _ticks(axis, ax_):
+    '''
+    Labels the ticks of non-numeric dimensions with their values
+    '''
+    if(not ax_['numeric']):
+        axis.set_ticks(np.arange(len(ax_['labels'])))
+        axis.set_ticklabels(ax_['labels'], fontsize=6)
@@ -0,0 +1,542 @@
+import ast
+import numpy as np
+
+ERRC  = '\033[91m'
+ENDC  = '\033[0m'
+
+# number of lattice points generated at once when iterating or scanning the lattice
+CHUNKSIZE = 2**16
+# largest sub-lattice over which a constraint is tabulated ahead of the lattice scan
+MAX_TABLE_SIZE = 2**22
+
+
+# ==========================================================================================
+# ==========================================================================================
+
+
+class lattice_constraint:
+    def __init__(self, predicate, names=None):
+        '''
+        A vectorized predicate over lattice parameters. Points for which the predicate
+        evaluates to False are rejected from the lattice.
+
+        Parameters
+        ----------
+        predicate : string or callable
+            If a string, an expression over parameter names (or parameter group labels), e.g.
+            'fv3_d2_bg_k1 > fv3_d2_bg_k2'. Numpy is available in the expression as np.
+            If a callable, it receives a mapping of parameter names to value arrays and must 
+            return a boolean array of the same length.
+        names : string list, optional
+            Names of the parameters the predicate depends on. Inferred for string predicates.
+            For callables, passing names allows the constraint to be evaluated once over the
+            (much smaller) sub-lattice of those parameters, rather than over every point. 
+            Defaults to None, in which case a callable receives all parameters.
+        '''
+        self.predicate = predicate
+        if(isinstance(predicate, str)):
+            tree = ast.parse(predicate, mode='eval')
+            self.names = sorted({n.id for n in ast.walk(tree) if isinstance(n, ast.Name)} - {'np'})
+            self._code = compile(tree, '<constraint>', 'eval')
+        elif(callable(predicate)):
+            self.names = None if names is None else list(np.atleast_1d(names))
+            self._code = None
+        else:
+            raise RuntimeError(ERRC+'constraint must be a string expression or a callable'+ENDC)
+
+    def __repr__(self):
+        return 'lattice_constraint({!r})'.format(self.predicate)
+
+    def evaluate(self, columns):
+        '''
+        Evaluates the predicate
+
+        Parameters
+        ----------
+        columns : dict
+            Mapping of parameter names to (k,) value arrays
+
+        Returns
+        -------
+        mask : (k,) bool array
+        '''
+        if(self._code is not None):
+            mask = eval(self._code, {'__builtins__': {}, 'np': np}, columns)
+        else:
+            mask = self.predicate(columns)
+        k = len(next(iter(columns.values()))) if len(columns) > 0 else 0
+        return np.broadcast_to(np.asarray(mask, dtype=bool), (k,))
+
+
+# ==========================================================================================
+# ==========================================================================================
+
+
+class lazy_lattice:
+    def __init__(self, param_vectors, param_names, blocks=None, constraints=None, aliases=None):
+        '''
+        This class represents a lattice of points in parameter space without ever building
+        the full set of points. Only the per-dimension value vectors are stored, and each point
+        is addressed by a flat integer index, which is mapped to per-dimension coordinates on
+        demand via mixed-radix indexing.
+
+        Storage is columnar: each dimension keeps its native dtype, and points are represented
+        by their code in each dimension (the index of the value in that dimension's vector),
+        stored as the smallest unsigned integer type that indexes every vector. String and
+        path dimensions are therefore never copied per point, and numeric dimensions are never
+        promoted to strings (or integers to floats) by the presence of other dimensions.
+
+        Dimensions are organized into blocks. Dimensions within a block are zipped together
+        (i.e. all vectors in a block have equal length, and the k-th point of the block takes the
+        k-th value of each vector), while the lattice is the outer product of all blocks. Point
+        ordering matches that of np.meshgrid(*vectors) with default 'xy' indexing, i.e. the first
+        two blocks are swapped in significance.
+
+        Parameters
+        ----------
+        param_vectors : list of (N_i,) arrays
+            Values of each dimension
+        param_names : list of strings
+            Names of each dimension
+        blocks : list of int lists, optional
+            Indices of the dimensions belonging to each block. Defaults to None, in which case
+            each dimension is its own block (a full-factorial lattice).
+        constraints : list of lattice_constraint, optional
+            Constraints to prune the lattice with. These are applied lazily, chunk-by-chunk,
+            the first time the point selection is needed, so that rejected points are never 
+            stored. Defaults to None.
+        aliases : dict, optional
+            Additional names by which dimensions may be referenced in constraints, mapped to
+            the dimension name (e.g. parameter group labels). Defaults to None.
+        '''
+        assert len(param_vectors) == len(param_names), \
+               'number of param_vectors and param_names must match'
+
+        self.vectors = [np.asarray(v) for v in param_vectors]
+        self.names = list(param_names)
+        if(blocks is None):
+            blocks = [[i] for i in range(len(self.vectors))]
+        self.blocks = [list(b) for b in blocks]
+
+        for b in self.blocks:
+            lengths = np.unique([len(self.vectors[d]) for d in b])
+            if(len(lengths) > 1):
+                raise RuntimeError(ERRC+'dimensions {} must all have the same number of values '\
+                                   'to be zipped together'.format([str(self.names[d]) for d in b])+ENDC)
+
+        # block order by significance in the flat index (most significant first)
+        self._radix_order = list(range(len(self.blocks)))
+        if(len(self._radix_order) >= 2):
+            self._radix_order[0], self._radix_order[1] = 1, 0
+        self._radix = tuple(len(self.vectors[self.blocks[b][0]]) for b in self._radix_order)
+
+        self.aliases = {} if aliases is None else dict(aliases)
+
+        # smallest integer type of per-dimension codes, and per-dimension tables of values as
+        # python objects and their formatted labels, built on first use
+        self.code_dtype = np.min_scalar_type(max([len(v) for v in self.vectors], default=1))
+        self._values = [None] * len(self.vectors)
+        self._labels = [None] * len(self.vectors)
+
+        # flat indices of the points currently selected; None means all points
+        self._selection = None
+        self._pending = []
+        for c in ([] if constraints is None else constraints):
+            self.constrain(c)
+
+
+    # ------------------------------------------------------------------------------
+
+
+    @property
+    def size(self):
+        '''
+        Total number of points in the unfiltered lattice
+        '''
+        return int(np.prod(self._radix, dtype=np.int64)) if len(self._radix) > 0 else 0
+
+    @property
+    def dtype(self):
+        '''
+        dtype of the record arrays returned when points are materialized
+        '''
+        return self.take(np.arange(min(1, len(self)))).dtype
+
+    def __len__(self):
+        self._resolve()
+        if(self._selection is None):
+            return self.size
+        return len(self._selection)
+
+
+    # ------------------------------------------------------------------------------
+
+
+    def flat_indices(self, idx=None):
+        '''
+        Maps indices of selected points to their flat indices in the unfiltered lattice
+
+        Parameters
+        ----------
+        idx : int array, optional
+            Indices of selected points. Defaults to None, in which case all selected points
+            are returned.
+
+        Returns
+        -------
+        flat : int64 array
+        '''
+        self._resolve()
+        if(idx is None):
+            if(self._selection is None):
+                return np.arange(self.size, dtype=np.int64)
+            return self._selection
+        idx = np.asarray(idx, dtype=np.int64)
+        if(self._selection is None):
+            return idx
+        return self._selection[idx]
+
+
+    def dim_indices(self, flat):
+        '''
+        Maps flat lattice indices to the index of each point's value in each dimension vector
+
+        Parameters
+        ----------
+        flat : (k,) int array
+            Flat indices into the unfiltered lattice
+
+        Returns
+        -------
+        coords : (M, k) int array
+            Index into self.vectors[m] of the value of each of the k points in dimension m
+        '''
+        flat = np.asarray(flat, dtype=np.int64)
+        coords = np.empty((len(self.vectors), len(flat)), dtype=np.int64)
+        if(len(self.blocks) == 0):
+            return coords
+        digits = np.unravel_index(flat, self._radix)
+        for k in range(len(self._radix_order)):
+            for d in self.blocks[self._radix_order[k]]:
+                coords[d] = digits[k]
+        return coords
+
+
+    def flat_index(self, coords):
+        '''
+        Inverse of dim_indices(); maps per-dimension vector indices to flat lattice indices
+
+        Parameters
+        ----------
+        coords : (M, k) int array
+            Index into self.vectors[m] of the value of each of the k points in dimension m.
+            Only the first dimension of each block is read.
+
+        Returns
+        -------
+        flat : (k,) int64 array
+        '''
+        coords = np.asarray(coords, dtype=np.int64)
+        digits = [coords[self.blocks[b][0]] for b in self._radix_order]
+        return np.ravel_multi_index(digits, self._radix).astype(np.int64)
+
+
+    def take(self, idx):
+        '''
+        Materializes the selected points at indices idx as a record array, with each field
+        in the native dtype of its dimension
+
+        Parameters
+        ----------
+        idx : int array
+            Indices of selected points
+
+        Returns
+        -------
+        points : (k,) record array
+        '''
+        coords = self.dim_indices(self.flat_indices(idx))
+        columns = [self.vectors[m][coords[m]] for m in range(len(self.vectors))]
+        return np.rec.fromarrays(columns, names=self.names)
+
+
+    def codes(self, idx=None, structured=False):
+        '''
+        Returns the code of each selected point in each dimension (the index of its value in 
+        self.vectors[m]), without materializing any values
+
+        Parameters
+        ----------
+        idx : int array, optional
+            Indices of selected points. Defaults to None, in which case all selected points
+            are used.
+        structured : boolean, optional
+            If True, a zero-copy structured view of the codes is returned, with one field per
+            dimension name, e.g. lattice.vectors[m][codes[name]] decodes dimension m. 
+            Defaults to False.
+
+        Returns
+        -------
+        codes : (k, M) array of self.code_dtype, or (k,) structured array if structured
+        '''
+        flat = self.flat_indices(idx)
+        out = np.empty((len(flat), len(self.vectors)), dtype=self.code_dtype)
+        for start in range(0, len(flat), CHUNKSIZE):
+            out[start:start+CHUNKSIZE] = self.dim_indices(flat[start:start+CHUNKSIZE]).T
+        if(structured):
+            return out.view(np.dtype([(n, self.code_dtype) for n in self.names])).reshape(-1)
+        return out
+
+
+    def values(self, m):
+        '''
+        Returns the values of dimension m as a list of numpy scalars of the dimension's dtype,
+        so that they format (e.g. in clone names) exactly as the vector's elements do
+        '''
+        if(self._values[m] is None):
+            self._values[m] = list(self.vectors[m])
+        return self._values[m]
+
+
+    def labels(self, m):
+        '''
+        Returns the values of dimension m formatted as strings, exactly as they are written to
+        namelists and used in clone coordinates
+        '''
+        if(self._labels[m] is None):
+            self._labels[m] = [str(v) for v in self.values(m)]
+        return self._labels[m]
+
+
+    def column(self, name, idx=None):
+        '''
+        Returns the values of one dimension for selected points, without materializing
+        any other dimension
+
+        Parameters
+        ----------
+        name : string
+            Name of the dimension
+        idx : int array, optional
+            Indices of selected points. Defaults to None, in which case all selected points
+            are used.
+        '''
+        m = self.names.index(name)
+        flat = self.flat_indices(idx)
+        out = np.empty(len(flat), dtype=self.vectors[m].dtype)
+        for start in range(0, len(flat), CHUNKSIZE):
+            chunk = flat[start:start+CHUNKSIZE]
+            out[start:start+CHUNKSIZE] = self.vectors[m][self.dim_indices(chunk)[m]]
+        return out
+
+
+    # ------------------------------------------------------------------------------
+
+
+    def __getitem__(self, key):
+        '''
+        Index the lattice by parameter name (returns that column for all selected points),
+        by integer (returns a single record), or by slice, integer array, or boolean mask
+        (returns a record array)
+        '''
+        if(isinstance(key, str)):
+            return self.column(key)
+        if(isinstance(key, (int, np.integer))):
+            if(key < 0): key += len(self)
+            if(key < 0 or key >= len(self)):
+                raise IndexError('lattice index {} out of range'.format(key))
+            return self.take([key])[0]
+        if(isinstance(key, slice)):
+            return self.take(np.arange(len(self))[key])
+        key = np.asarray(key)
+        if(key.dtype == bool):
+            key = np.flatnonzero(key)
+        return self.take(key)
+
+
+    def __iter__(self):
+        for chunk in self.iter_chunks():
+            for point in chunk:
+                yield point
+
+
+    def iter_chunks(self, chunksize=CHUNKSIZE):
+        '''
+        Iterates over the selected points in chunks, materializing at most chunksize
+        points at once
+
+        Parameters
+        ----------
+        chunksize : int, optional
+            Maximum number of points per chunk. Defaults to CHUNKSIZE
+
+        Yields
+        ------
+        points : record array
+        '''
+        for start in range(0, len(self), chunksize):
+            yield self.take(np.arange(start, min(start+chunksize, len(self))))
+
+
+    def iter_values(self, chunksize=CHUNKSIZE):
+        '''
+        Iterates over the selected points as tuples of values (see values()), decoded
+        from chunks of codes
+
+        Parameters
+        ----------
+        chunksize : int, optional
+            Maximum number of points decoded at once. Defaults to CHUNKSIZE
+
+        Yields
+        ------
+        point : tuple
+        '''
+        tables = [self.values(m) for m in range(len(self.vectors))]
+        flat = self.flat_indices()
+        for start in range(0, len(flat), chunksize):
+            coords = self.dim_indices(flat[start:start+chunksize]).T.tolist()
+            for point in coords:
+                yield tuple(table[c] for table, c in zip(tables, point))
+
+
+    def materialize(self):
+        '''
+        Builds all selected points of the lattice at once
+
+        Returns
+        -------
+        points : (T,) record array
+        '''
+        return self.take(np.arange(len(self)))
+
+
+    # ------------------------------------------------------------------------------
+
+
+    def filter(self, mask):
+        '''
+        Removes points from the selection
+
+        Parameters
+        ----------
+        mask : bool array with length matching the number of selected lattice points
+        '''
+        mask = np.asarray(mask, dtype=bool)
+        if(len(mask) != len(self)):
+            raise RuntimeError(ERRC+'filter mask has length {}, but the lattice has {} '\
+                               'points'.format(len(mask), len(self))+ENDC)
+        self._selection = self.flat_indices(np.flatnonzero(mask))
+
+
+    def select(self, flat):
+        '''
+        Sets the selected points directly, discarding any pending constraints
+
+        Parameters
+        ----------
+        flat : int array
+            Flat indices of the points to select, in the unfiltered lattice
+        '''
+        self._pending = []
+        self._selection = np.asarray(flat, dtype=np.int64)
+
+
+    # ------------------------------------------------------------------------------
+
+
+    def constrain(self, constraint):
+        '''
+        Adds a constraint to the lattice. If the point selection has not yet been built,
+        the constraint is deferred and applied during the first scan of the lattice. 
+        Otherwise, it is applied chunk-by-chunk to the currently selected points.
+
+        Parameters
+        ----------
+        constraint : lattice_constraint
+        '''
+        if(constraint.names is not None):
+            for name in constraint.names:
+                if(name not in self.names and name not in self.aliases):
+                    raise RuntimeError(ERRC+'constraint {} references unknown parameter {}'.format(
+                                       constraint, name)+ENDC)
+        if(self._selection is None):
+            self._pending.append(constraint)
+            return
+        keep = [self._selection[start:start+CHUNKSIZE][self._accept(
+                self._selection[start:start+CHUNKSIZE], [constraint])]
+                for start in range(0, len(self._selection), CHUNKSIZE)]
+        self._selection = np.concatenate(keep) if len(keep) > 0 else self._selection
+
+
+    def _columns(self, coords, names=None):
+        '''
+        Builds a mapping from parameter names (and aliases) to value arrays, given (M, k)
+        dimension indices. If names is passed, only those columns are built.
+        '''
+        if(names is None):
+            names = self.names + list(self.aliases)
+        columns = {}
+        for name in names:
+            m = self.names.index(self.aliases.get(name, name))
+            columns[name] = self.vectors[m][coords[m]]
+        return columns
+
+
+    def _tabulate(self, constraint):
+        '''
+        Evaluates a constraint over the sub-lattice spanned by the blocks containing its 
+        parameters. Returns the block indices spanned, and the boolean table of shape 
+        (len(block_1), len(block_2), ...), or None if the sub-lattice is too large.
+        '''
+        if(constraint.names is None):
+            return None
+        dims = [self.names.index(self.aliases.get(n, n)) for n in constraint.names]
+        blocks = sorted({b for b in range(len(self.blocks)) for d in dims if d in self.blocks[b]})
+        shape = tuple(len(self.vectors[self.blocks[b][0]]) for b in blocks)
+        if(np.prod(shape, dtype=np.int64) > MAX_TABLE_SIZE):
+            return None
+        digits = np.indices(shape).reshape(len(shape), -1)
+        coords = np.zeros((len(self.vectors), digits.shape[1]), dtype=np.int64)
+        for k, b in enumerate(blocks):
+            for d in self.blocks[b]:
+                coords[d] = digits[k]
+        table = constraint.evaluate(self._columns(coords, constraint.names))
+        return blocks, table.reshape(shape)
+
+
+    def _accept(self, flat, constraints, tables=None):
+        '''
+        Evaluates constraints over the points at flat indices, returning a boolean mask
+        '''
+        coords = self.dim_indices(flat)
+        mask = np.ones(len(flat), dtype=bool)
+        for i, constraint in enumerate(constraints):
+            table = None if tables is None else tables[i]
+            if(table is not None):
+                blocks, table = table
+                mask &= table[tuple(coords[self.blocks[b][0]] for b in blocks)]
+            else:
+                mask &= constraint.evaluate(self._columns(coords, constraint.names))
+        return mask
+
+
+    def _resolve(self):
+        '''
+        Applies pending constraints by scanning the lattice in chunks. Constraints over a
+        small subset of the dimensions are first tabulated over that subset, so that each
+        chunk only requires a table lookup. Only the flat indices of accepted points are kept.
+        '''
+        if(len(self._pending) == 0):
+            return
+        constraints, self._pending = self._pending, []
+        tables = [self._tabulate(c) for c in constraints]
+        
+        if(self._selection is None):
+            chunks = (np.arange(start, min(start+CHUNKSIZE, self.size), dtype=np.int64)
+                      for start in range(0, self.size, CHUNKSIZE))
+        else:
+            chunks = (self._selection[start:start+CHUNKSIZE]
+                      for start in range(0, len(self._selection), CHUNKSIZE))
+        keep = [flat[self._accept(flat, constraints, tables)] for flat in chunks]
+        self._selection = np.concatenate(keep) if len(keep) > 0 else np.zeros(0, dtype=np.int64)
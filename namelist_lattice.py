@@ -1,21 +1,71 @@
 import os
-import pdb
-import glob
+import io
+import time
 import shutil
 import subprocess
 import numpy as np
 from pathlib import Path
-from os.path import expanduser
-import matplotlib.pyplot as plt
-import matplotlib as mpl
 import warnings
+from concurrent.futures import ThreadPoolExecutor
+from lazy_lattice import lazy_lattice, lattice_constraint
+
+# the modules implementing sampling, clone creation, submission, monitoring, and history
+# aggregation are imported by the methods using them, to keep the import of this module
+# (and of their dependencies, e.g. asyncio, multiprocessing, xml) cheap
 
-mpl.rcParams['axes.xmargin'] = 0.1
-mpl.rcParams['axes.ymargin'] = 0.1
 WARNC = '\033[93m'
 ERRC  = '\033[91m'
 ENDC  = '\033[0m'
 
+# journaled steps of clone creation, in order
+CLONE_STEPS = ['start', 'cloned', 'namelist', 'xml']
+
+
+# ==========================================================================================
+# ==========================================================================================
+
+
+def _xmlchange_args(changes):
+    '''
+    Builds the arguments to set several env_*.xml variables in one call to xmlchange, 
+    i.e. xmlchange A=1,B=2. If any value contains a comma, a different delimiter is
+    chosen and passed with --delimiter.
+
+    Parameters
+    ----------
+    changes : list of (name, value) tuples
+
+    Returns
+    -------
+    args : string list
+    '''
+    settings = ['{}={}'.format(name, value) for name, value in changes]
+    for delim in [',', ';', '|', '@@']:
+        if not any(delim in setting for setting in settings):
+            break
+    else:
+        raise RuntimeError(ERRC+'no usable delimiter for xmlchange settings {}'.format(settings)+ENDC)
+    args = [delim.join(settings)]
+    if(delim != ','):
+        args.extend(['--delimiter', delim])
+    return args
+
+
+def _existing_dirs(paths):
+    '''
+    Returns the subset of paths which exist, by listing each of their parent directories once.
+    Entries are not stat'ed, so a path may be returned for an existing file; callers which
+    need to distinguish should check the (few) returned paths.
+    '''
+    existing = set()
+    for parent in {os.path.dirname(path) for path in paths}:
+        try:
+            with os.scandir(parent) as it:
+                existing.update(entry.path for entry in it)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+    return existing.intersection(paths)
+
 
 # ==========================================================================================
 # ==========================================================================================
@@ -50,10 +100,24 @@ class namelist_lattice:
         self.paramgroup_mask = []
         self.paramgroup_labels = []
         self.clone_dirs = []
+        self.job_ids = {}
+        self.constraints = []
+        self.sample_blocks = []
+        self.clone_records = {}
+        self.candidate_pool = None
+        self.manifest = None
+        self.stdout = None
+        self.stdoutf = None
         self._lattice = None
+        self._monitor = None
     
     @property
     def lattice(self):
+        '''
+        The lattice as a lazy_lattice object. Points are only generated on access; index 
+        by parameter name to get that parameter's values over all points, by integer, slice,
+        or mask to get a record array of points, or call materialize() to build all points.
+        '''
         if(len(self.param_names) < 2): 
             raise RuntimeError(ERRC+"must add at least 2 dimensions to build lattice"+ENDC)
         else:
@@ -222,6 +286,232 @@ class namelist_lattice:
     # ------------------------------------------------------------------------------
 
 
+    def sample(self, names, nsamples, limits=None, values=None, method='lhs', seed=None, 
+               logspace=False, integer=False, xmlchange=False, group=False, group_labels=None):
+        '''
+        Adds N dimensions to the lattice, populated jointly by nsamples points of a space-filling
+        design (Latin hypercube, scrambled Sobol, or Halton), rather than the full-factorial 
+        product of expand(). The sampled dimensions are zipped together, so they contribute 
+        nsamples points to the lattice in total; they are still crossed with any dimensions 
+        added by expand().
+
+        Parameters
+        ----------
+        names : string or (N,) string array
+            Name of the parameters
+        nsamples : int
+            Number of points to sample
+        limits : (2,) or (N,2) float array, optional
+            Lower and upper limits of each continuous parameter. Entries may be None for
+            parameters given by values.
+        values : list of arrays, optional
+            Allowed values of each discrete parameter (e.g. strings, or parameter group values
+            if group is True), each sampled with equal probability. Entries may be None for 
+            parameters given by limits. At least one of limits or values must be passed.
+        method : string, optional
+            One of 'lhs', 'sobol' (requires scipy), or 'halton'; see samplers.unit_samples().
+            Defaults to 'lhs'.
+        seed : int, optional
+            Random seed, for reproducible designs. Defaults to None.
+        logspace : bool or (N,) bool array, optional
+            Whether to sample each continuous parameter uniformly in log10 space. Unlike 
+            expand(), the sampled values themselves (not their logarithms) are stored. 
+            Defaults to False.
+        integer : bool or (N,) bool array, optional
+            Whether each continuous parameter takes only integer values (limits inclusive).
+            Defaults to False.
+        xmlchange : boolean, optional
+            See expand()
+        group : boolean, optional
+            See expand(). If True, every parameter must be given by values.
+        group_labels : string or (N,) string array, optional
+            See expand()
+
+        Raises
+        ------
+        ValueError
+            If a parameter name, group member, or group label is repeated, or already used by
+            a dimension of the lattice
+        '''
+        
+        from samplers import unit_samples, scale_samples
+        names = list(np.atleast_1d(names))
+        N = len(names)
+        limits = [None]*N if limits is None else \
+                 ([limits] if N == 1 and np.ndim(limits) == 1 else list(limits))
+        values = [None]*N if values is None else \
+                 ([values] if N == 1 and not isinstance(values[0], (list, tuple, np.ndarray)) 
+                  else list(values))
+        logspace = np.broadcast_to(logspace, (N,))
+        integer = np.broadcast_to(integer, (N,))
+        
+        assert len(limits) == N and len(values) == N, \
+               'args \'names\', \'limits\', and \'values\' must all be of equal length'
+        for i in range(N):
+            assert (limits[i] is None) != (values[i] is None), \
+                   'either limits or values must be passed for parameter {}, not both'.format(names[i])
+        if(group):
+            assert all([v is not None for v in values]), 'values must be passed if group is True'
+            group_labels = list(np.atleast_1d(group_labels))
+            assert len(group_labels) == N and None not in group_labels, \
+                   'group_labels must be passed if group is True'
+            names = [''.join(n.split()) for n in names]
+            values = [np.array([''.join(v.split()) for v in vals]) for vals in values]
+        self._check_new_names(names, group_labels if group else None)
+        
+        # draw the design in the unit hypercube, and scale each dimension
+        u = unit_samples(nsamples, N, method, seed)
+        vectors = [scale_samples(u[:, i], limits[i], values[i], logspace[i], integer[i]) 
+                   for i in range(N)]
+        
+        self.sample_blocks.append(list(range(len(self.param_names), len(self.param_names)+N)))
+        self.param_names.extend(names)
+        self.param_vectors.extend(vectors)
+        self.xml_mask.extend([int(xmlchange)]*N)
+        self.paramgroup_mask.extend([int(group)]*N)
+        if(group):
+            self.paramgroup_labels.extend(group_labels)
+        self._build_lattice()
+    
+    
+    def _check_new_names(self, names, group_labels=None):
+        '''
+        Checks that the names (and group labels, for parameter groups) of new dimensions are 
+        unique, both among themselves and against the names, group labels, and group members
+        of the lattice, so that every dimension can be referenced by name unambiguously
+
+        Raises
+        ------
+        ValueError
+            If any name or label is repeated, or already used
+        '''
+        taken = set(self.param_names) | set(self.paramgroup_labels)
+        taken |= {p for n, g in zip(self.param_names, self.paramgroup_mask) if g 
+                  for p in n.split(',')}
+        new = [str(n) for n in names] if group_labels is None else \
+              [str(l) for l in group_labels] + [p for n in names for p in str(n).split(',')]
+        repeated = sorted({n for n in new if new.count(n) > 1})
+        if(len(repeated) > 0):
+            raise ValueError(ERRC+'parameter names or group labels {} are repeated'.format(
+                             repeated)+ENDC)
+        used = sorted(taken.intersection(new))
+        if(len(used) > 0):
+            raise ValueError(ERRC+'parameter names or group labels {} already exist in the '\
+                             'lattice'.format(used)+ENDC)
+    
+    
+    # ------------------------------------------------------------------------------
+
+
+    def refine(self, name, values):
+        '''
+        Adds values to an existing dimension of the lattice. Together with create_clones(
+        only_new=True) and submit_clone_runs(only_new=True), this allows a sweep to be refined 
+        without recreating the clones of points which already exist.
+
+        Parameters
+        ----------
+        name : string
+            Name of the parameter (or parameter group names, as passed to expand())
+        values : (N,) array
+            New values, of the same type as the existing values of the dimension. Values
+            already present in the dimension, and repeated values, are ignored.
+
+        Raises
+        ------
+        RuntimeError
+            If the values cannot be added, in which case the lattice is left unchanged
+        '''
+        
+        if(name not in self.param_names):
+            raise RuntimeError(ERRC+'parameter {} does not exist in the lattice; use expand() to '\
+                               'add new dimensions'.format(name)+ENDC)
+        m = self.param_names.index(name)
+        if(any([m in b for b in self.sample_blocks])):
+            raise RuntimeError(ERRC+'parameter {} was added by sample(), and cannot be '\
+                               'refined'.format(name)+ENDC)
+        old = self.param_vectors[m]
+        values = np.atleast_1d(values)
+        if(self.paramgroup_mask[m] == 1):
+            values = np.array([''.join(v.split()) for v in values])
+        if(values.dtype.kind != old.dtype.kind):
+            raise RuntimeError(ERRC+'new values of {} have type {}, but existing values have type '\
+                               '{}'.format(name, values.dtype, old.dtype)+ENDC)
+        values = values[~np.isin(values, old)]
+        _, first = np.unique(values, return_index=True)
+        values = values[np.sort(first)]
+        
+        # the lattice is rebuilt, and its constraints applied, before the new vector is kept, 
+        # so that a failed rebuild (e.g. of a nofill lattice, whose dimensions must stay of 
+        # equal length, or a constraint which fails on the new values) changes nothing
+        old_lattice, old_pool = self._lattice, self.candidate_pool
+        self.param_vectors[m] = np.concatenate([old, values])
+        try:
+            self._build_lattice()
+            len(self._lattice)
+        except Exception:
+            self.param_vectors[m], self._lattice = old, old_lattice
+            self.candidate_pool = old_pool
+            raise
+
+
+    # ------------------------------------------------------------------------------
+
+
+    def cloned_mask(self):
+        '''
+        Identifies lattice points which already have a clone, by coordinate identity (the 
+        values of each parameter), independent of the point's position in the lattice
+
+        Returns
+        -------
+        mask : bool array with length matching the number of lattice points
+        '''
+        
+        cloned = self._cloned_coords()
+        return np.array([tuple(str(v) for v in values) in cloned 
+                         for values in self._lattice.iter_values()], dtype=bool)
+
+
+    def clone_points(self):
+        '''
+        Maps every clone to its point in the current lattice, by coordinate identity. Clones of
+        points outside of the lattice (e.g. made before a dimension was added) are omitted.
+
+        Returns
+        -------
+        flat : (k,) int64 array
+            Flat indices of the clones' points in the unfiltered lattice (see lazy_lattice)
+        cases : (k,) string list
+            The clone case directories
+        '''
+        
+        lat = self._lattice
+        lookup = [{v: i for i, v in enumerate(lat.labels(m))} for m in range(len(lat.vectors))]
+        coords, cases = [], []
+        for case, record in self.clone_records.items():
+            if(len(record['coords']) != len(lookup)):
+                continue
+            try:
+                coords.append([lookup[m][c] for m, c in enumerate(record['coords'])])
+            except KeyError:
+                continue
+            cases.append(case)
+        coords = np.array(coords, dtype=np.int64).reshape(-1, len(lookup)).T
+        return lat.flat_index(coords), cases
+
+
+    def _cloned_coords(self):
+        '''
+        Returns a dict mapping the coordinates of every successfully created clone to its case
+        '''
+        return {tuple(record['coords']): case for case, record in self.clone_records.items()
+                if record['state'] not in ['pending', 'failed']}
+
+
+    # ------------------------------------------------------------------------------
+
+
     def filter(self, mask):
         '''
         Filters out undesired run configurations from the lattice
@@ -231,38 +521,125 @@ class namelist_lattice:
         mask : bool array with length matching the number of lattice points
         '''
         
-        mask = np.array(mask, dtype=bool)
-        self._lattice = self._lattice[mask]
+        self._lattice.filter(mask)
 
 
     # ------------------------------------------------------------------------------
 
 
-    def _build_lattice(self):
+    def constrain(self, predicate, names=None):
         '''
-        Builds the lattice and returns it as a set of M-dimensional points, where M is 
-        the total number of dimensions added with expand()
+        Constrains the lattice to points satisfying a predicate. Unlike filter(), the lattice
+        need not be built first; the predicate is evaluated during point generation, and 
+        predicates depending on only a few parameters are tabulated over just those 
+        parameters, so that rejected points are never allocated. Constraints compose, and 
+        are re-applied automatically when expand() adds dimensions.
 
-        Returns
-        -------
-        lattice : (T, M) float array
-            a array of T total M-dimensional points on the lattice
+        Parameters
+        ----------
+        predicate : string or callable
+            If a string, an expression over parameter names or parameter group labels, e.g.
+            'fv3_d2_bg_k1 > fv3_d2_bg_k2'. Numpy is available in the expression as np.
+            If a callable, it receives a mapping of parameter names to value arrays and must 
+            return a boolean array of the same length.
+        names : string or string list, optional
+            Names of the parameters a callable predicate depends on. Passing these allows the
+            predicate to be evaluated over only those dimensions. Ignored for string predicates. 
+            Defaults to None, in which case the callable receives all parameters.
+        '''
+        
+        if(self._lattice is None):
+            raise RuntimeError('Lattice must first be built by calling expand()')
+        constraint = lattice_constraint(predicate, names)
+        self._lattice.constrain(constraint)
+        self.constraints.append(constraint)
+
+
+    # ------------------------------------------------------------------------------
+
+
+    def _build_lattice(self):
+        '''
+        Builds the lattice as a lazy_lattice over the M dimensions added with expand() and
+        sample(). Only the parameter vectors are stored; points are generated on demand, so the cost
+        of this call does not scale with the total number of lattice points. Any constraints
+        added with constrain() are carried over to the new lattice, while any selection of
+        points (including the candidate pool of a sequential_design) is reset, since flat
+        indices are not preserved.
         '''
         
         if(not self.nofill):
-            grid = np.meshgrid(*self.param_vectors)
-            points = np.vstack(list(map(np.ravel, grid)))
-            self._lattice = np.core.records.fromarrays(points, names=self.param_names)
+            # each dimension is its own block, except for jointly sampled dimensions
+            sampled = {d: b for b in self.sample_blocks for d in b}
+            blocks = []
+            for i in range(len(self.param_vectors)):
+                if(i not in sampled):
+                    blocks.append([i])
+                elif(i == sampled[i][0]):
+                    blocks.append(list(sampled[i]))
         else:
-            points = np.vstack(self.param_vectors)
-            self._lattice = np.core.records.fromarrays(points, names=self.param_names)
+            blocks = [list(range(len(self.param_vectors)))]
+        aliases = dict(zip(self.paramgroup_labels, 
+                           np.array(self.param_names)[np.where(self.paramgroup_mask)]))
+        self._lattice = lazy_lattice(self.param_vectors, self.param_names, blocks, 
+                                     self.constraints, aliases)
+        self.candidate_pool = None
 
     # ------------------------------------------------------------------------------
 
 
+    def plan_clones(self, root_case, top_clone_dir=None, top_output_dir=None, clone_prefix=None,
+                    clone_sfx=None, layout='flat', shard_size=1000, export=None, 
+                    check_existing=True):
+        '''
+        Plans the clones of every lattice point without creating any: their case and output
+        directories, and the namelist settings and xml changes each applies. The plan is
+        computed vectorized over the lattice (see clone_plan), and checked for clone
+        directories which collide or are too long. Points which already have a clone in the
+        clone map of top_clone_dir (see clone_plan.relocate()) are planned at that clone's
+        location. See create_clones() for the parameters.
+
+        Parameters
+        ----------
+        layout : string, optional
+            Layout of the clone directories; see clone_plan. Defaults to 'flat'.
+        shard_size : int, optional
+            Clones per shard of the 'index' layout. Defaults to 1000.
+        export : string, optional
+            Location of a .json or .csv file to export the plan to. Defaults to None.
+        check_existing : bool, optional
+            Whether to also check that planned clones do not take the directories of existing
+            clones (in self.clone_records) of other lattice points. Defaults to True.
+
+        Returns
+        -------
+        plan : clone_plan
+        '''
+        from clone_plan import clone_plan, read_clone_map, CLONE_MAP_NAME
+        if(self._lattice is None):
+            raise RuntimeError('Lattice must first be built by calling expand()')
+        if(top_clone_dir is None):
+            top_clone_dir = '/'.join(root_case.split('/')[:-1])
+        if(clone_prefix is None):
+            clone_prefix = root_case.split('/')[-1]
+        plan = clone_plan(self, top_clone_dir, top_output_dir, clone_prefix, clone_sfx, layout,
+                          shard_size)
+        # clones of a sharded sweep are found from its clone map, whatever layout is passed
+        clone_map = '{}/{}'.format(top_clone_dir, CLONE_MAP_NAME)
+        if(os.path.isfile(clone_map)):
+            plan.relocate(read_clone_map(clone_map))
+        plan.check(existing={case: record['coords'] for case, record in self.clone_records.items()}
+                   if check_existing else None)
+        if(export is not None):
+            plan.export(export)
+        return plan
+
+
     def create_clones(self, root_case, top_clone_dir=None, top_output_dir=None, cime_dir=None,  
                       clone_prefix=None, clone_sfx=None, overwrite=False, clean_all=False, 
-                      stdout=None, resubmits=0, read_existing_clones=False):
+                      stdout=None, resubmits=0, read_existing_clones=False, max_workers=1,
+                      clone_mode='create_clone', manifest=None, resume=False, only_new=False,
+                      plan=None, plan_file=None, dry=False, layout='flat', shard_size=1000):
         '''
         clone the root_case CESM CIME case per each point on the lattice, and edit the
         namelist file at cloned_case/user_nl_{self.component} with the content of that 
@@ -315,8 +692,75 @@ class namelist_lattice:
             been created, and do not need to be made again (e.g. resubmit_hung_clone_runs). 
             Defaults to False.
             If True, then overwrite and clean_all must both be False. This is enforced.
+        max_workers : int, optional
+            Maximum number of clones to create concurrently. If greater than 1, the output of
+            CIME utilities is buffered per-clone, and written (to stdout, or the terminal) in 
+            lattice order once all clones are done. Defaults to 1, in which case clones are 
+            created serially.
+        clone_mode : string, optional
+            How clones are created. If 'create_clone', CIME's create_clone --keepexe is called
+            for every lattice point. If 'copy', create_clone is called once, for the first point,
+            and all remaining clones are produced by copying that template case directory, with
+            the case-specific fields (CASE, CASEROOT, RUNDIR, DOUT_S_ROOT) rewritten in its env 
+            xml files; see case_copy.copy_case(). This avoids the per-clone overhead of CIME's
+            cloning script. Defaults to 'create_clone'.
+        manifest : string, optional
+            Location at which to write the sweep manifest (see save()), which is updated as 
+            clones are created and submitted. Defaults to None, in which case the manifest is 
+            written to {top_clone_dir}/lattice_manifest.json.
+        resume : bool, optional
+            If True, continue a previous call to this function which did not finish. Progress 
+            of each clone through its creation steps (cloned, namelist written, xml changes 
+            applied) is journaled next to the manifest as steps complete. When resuming, clones
+            with all steps journaled are verified cheaply (their case directory and env xml 
+            files exist) and skipped, partially created clones have only their missing steps 
+            redone, and clones whose cloning step was interrupted are removed and cloned again.
+            Defaults to False.
+        only_new : bool, optional
+            If True, only points which do not yet have a clone with the same coordinates (see
+            cloned_mask()) are cloned, e.g. after the lattice is grown with refine(). Existing 
+            clones are kept, and retain their names. Use with the manifest of the existing 
+            sweep, i.e. on a lattice reopened with load(). Defaults to False.
+        plan : clone_plan, optional
+            Plan of the clones to create, as returned by plan_clones() (or by a previous call 
+            with dry=True), in which case top_clone_dir, top_output_dir, clone_prefix, and 
+            clone_sfx are taken from the plan. Defaults to None, in which case the plan is made
+            here; see plan_clones().
+        plan_file : string, optional
+            Location of a .json or .csv file to export the plan to; see clone_plan.export().
+            Defaults to None.
+        dry : bool, optional
+            If True, clones are only planned (and the plan checked and exported), and no case
+            or directory is created. Defaults to False.
+        layout : string, optional
+            Layout of the clone (and output) directories. Defaults to 'flat', in which case 
+            clones are placed directly in top_clone_dir. For large sweeps, 'hashed' or 'index'
+            shard clones into subdirectories of top_clone_dir with short names, and write a
+            file mapping each clone to its lattice coordinates at 
+            {top_clone_dir}/clone_map.json; see clone_plan. When continuing the sweep (e.g. 
+            with read_existing_clones, resume, or only_new), existing clones are found from 
+            that file, and only new clones are placed by layout.
+        shard_size : int, optional
+            Clones per shard of the 'index' layout. Defaults to 1000.
+
+        Returns
+        -------
+        plan : clone_plan
+            Only if dry is True
+        
+        Raises
+        ------
+        RuntimeError
+            If the plan is invalid (see clone_plan.check()), which is raised before any clone
+            is created, or if any clone could not be created. Failures do not interrupt
+            creation of the other clones; they are collected in self.clone_failures and
+            reported once all clones have been attempted. Successfully created clones are
+            still added to self.clone_dirs.
         '''
 
+        from clone_plan import write_clone_map, CLONE_MAP_NAME
+        from sweep_manifest import sweep_journal, MANIFEST_NAME
+        from user_nl import user_nl
         if(self._lattice is None):
             raise RuntimeError('Lattice must first be built by calling expand()')
         if(not os.path.isdir(root_case)):
@@ -325,6 +769,21 @@ class namelist_lattice:
         if(read_existing_clones):
             assert overwrite == False and clean_all == False, ERRC+'if read_existing_clones=True, '\
                                                    'must have overwrite=False, clean_all=False'+ERRC 
+        assert clone_mode in ['create_clone', 'copy'], \
+               'clone_mode must be one of \'create_clone\' or \'copy\''
+        
+        # plan every clone up front; this fails before any directory is touched if clones 
+        # would collide, or their paths are too long
+        if(plan is None):
+            plan = self.plan_clones(root_case, top_clone_dir, top_output_dir, clone_prefix, 
+                                    clone_sfx, layout, shard_size, export=plan_file, 
+                                    check_existing=not (overwrite or read_existing_clones))
+        elif(plan_file is not None):
+            plan.export(plan_file)
+        top_clone_dir, top_output_dir = plan.top_clone_dir, plan.top_output_dir
+        if(dry):
+            print('\n\n =============== PLANNED {} CLONES ===============\n'.format(len(plan)))
+            return plan
        
         # open file for stdout if specified
         if(stdout is not None):
@@ -336,24 +795,16 @@ class namelist_lattice:
             self.stdout = None
             self.stdoutf = None
         
-        params = self._lattice.dtype.names
-
-        # build list of parameter names which abbreviates each parameter group with 
-        # its assocaited label
-        print_params = np.array(params)
-        print_params[np.where(self.paramgroup_mask)] = self.paramgroup_labels
-
-        # build list of all parameter names, expanding parameter groups
-        all_params = np.hstack([np.array(params)[np.where(1-np.array(self.paramgroup_mask))], 
-                                np.ravel([s.split(',') for s in 
-                                np.array(self.param_names)[np.where(self.paramgroup_mask)]])]) 
+        if(manifest is None):
+            manifest = '{}/{}'.format(top_clone_dir if top_clone_dir is not None else 
+                                      os.path.dirname(root_case), MANIFEST_NAME)
+        self.manifest = manifest
+        journal = sweep_journal('{}_journal.jsonl'.format(os.path.splitext(manifest)[0]))
+        progress = journal.read() if resume else {}
+        
+        # parse the root case namelist once; each clone's namelist is rendered from it
+        root_nl = user_nl.read('{}/user_nl_{}'.format(root_case, self.component))
         
-        # enforce defaults
-        if(top_clone_dir is None):
-            top_clone_dir = '/'.join(root_case.split('/')[:-1])
-        if(clone_prefix is None):
-            clone_prefix = root_case.split('/')[-1]
-
         # clean clone and output dirs if user specified
         if(clean_all):
             clonedir_exist = os.path.isdir(top_clone_dir)
@@ -376,149 +827,350 @@ class namelist_lattice:
                 print('creating {}'.format(top_output_dir))
                 Path(top_output_dir).mkdir(parents=True) 
              
-        print('\n\n =============== CREATING {} CLONES ===============\n'.format(len(self._lattice)))
+        if(only_new):
+            print('\n\n =============== CREATING {} NEW CLONES ===============\n'.format(
+                   len(self._lattice) - int(np.sum(self.cloned_mask()))))
+        else:
+            print('\n\n =============== CREATING {} CLONES ===============\n'.format(len(self._lattice)))
 
-        # clone the root case per lattice point
-        for i in range(len(self._lattice)):
+        # determine the clone location per lattice point; existing case and output directories
+        # are found by listing each (shard) directory once, rather than by a stat per clone
+        clones = []
+        cloned = self._cloned_coords()
+        existing = _existing_dirs(plan.cases.tolist() + 
+                                  ([] if plan.outputs is None else plan.outputs.tolist()))
+        for i in range(len(plan)):
+            entry = plan.entry(i)
+            new_case, new_case_out = entry['case'], entry['output']
             
-            values = self._lattice[i]
+            # if only creating new points, skip those with a clone of the same coordinates
+            coords = entry['coords']
+            if(only_new and coords in cloned):
+                self.clone_records[cloned[coords]]['point'] = entry['point']
+                continue
             
-            # build list of values which replaces commas in parameter groups with underscores
-            # and removes '+' in scientific notaiton for numbers >= 1e5
-            # (for safer directory, file naming)
-            print_values = list(values)
-            for j in range(len(print_values)):
-                if isinstance(print_values[j], str):
-                    print_values[j] = print_values[j].replace(',', '_') 
-                elif isinstance(print_values[j], int) or isinstance(print_values[j], int):
-                    if(print_values[j] >= 1e5):
-                        print_values[j] = '%e' % print_values[j]
-                        print_values[j] = print_values[j].replace('+', '')
- 
-            # set clone directory suffix
-            if clone_sfx is None:
-                sfx = '__'.join(['{}_{}'.format(print_params[j], print_values[j]) 
-                                 for j in range(len(values))])
-            else: 
-                clone_sfx = np.atleast_1d(clone_sfx)
-                if(len(clone_sfx) != 1 and len(clone_sfx) != len(self._lattice)):
-                    raise RuntimeError('clone_sfx must be a single string, or length of'\
-                                       'clone_sfx must match number of lattice points')
-                if(len(clone_sfx) > 1):
-                    sfx = clone_sfx[i]
-                else:
-                    sfx = clone_sfx[0]
-
-            new_case = '{}/{}__{}'.format(top_clone_dir, clone_prefix, sfx)
-            new_case_out = '{}/{}__{}'.format(top_output_dir, clone_prefix, sfx)
+            self.clone_records[new_case] = {'output': new_case_out, 'point': entry['point'], 
+                                            'coords': list(coords), 'state': 'pending'}
         
             # if reading existing clones, append case to self.clon_dirs and continue to next case iteration
             # (skip all else; cloning, namelist editing etc.)
             if(read_existing_clones):
                 print('--------------- READ existing case {} ---------------'.format(new_case)) 
                 self.clone_dirs.append(new_case)
+                self.clone_records[new_case]['state'] = 'created'
                 continue
             
-            print('\n --------------- creating clone with {} = {} ---------------\n'.format(
-                   print_params, values))
+            # if resuming, check journaled progress of this clone
+            steps = set()
+            if(resume):
+                steps = self._verify_progress(new_case, progress.get(new_case, set()))
+                if(steps >= set(CLONE_STEPS)):
+                    print('--------------- SKIP completed case {} ---------------'.format(new_case)) 
+                    self.clone_dirs.append(new_case)
+                    self.clone_records[new_case]['state'] = 'created'
+                    continue
             
             # check that this clone does not already exist; if so, handle
-            if(os.path.isdir(new_case) and overwrite == False):
+            if(new_case in existing and os.path.isdir(new_case) and overwrite == False and 
+               'cloned' not in steps):
                 raise RuntimeError('clone at {} already exists!'.format(new_case)) 
-            if(os.path.isdir(new_case_out) and overwrite == False):
+            if(new_case_out in existing and os.path.isdir(new_case_out) and overwrite == False and 
+               'start' not in steps):
                 raise RuntimeError('output at {} already exists!'.format(new_case_out)) 
-            if(os.path.isdir(new_case) and overwrite == True):
+            if(new_case in existing and os.path.isdir(new_case) and overwrite == True):
                 print('overwrite option set to True; overwriting existing case at ' +
                        WARNC + '{}'.format(new_case) + ENDC)
                 shutil.rmtree(new_case)
-            if(os.path.isdir(new_case_out) and overwrite == True):
+            if(new_case_out in existing and os.path.isdir(new_case_out) and overwrite == True):
                 print('overwrite option set to True; overwriting existing output at ' +
                       WARNC + '{}'.format(new_case_out) + ENDC)
                 shutil.rmtree(new_case_out)
-
-            # call the cloning script
-            if(top_output_dir is not None):
-                cmd = '{}/create_clone --case {} --clone {} --cime-output-root {} --keepexe'.format(
-                       cime_dir, new_case, root_case, top_output_dir)
-            else:
-                cmd = '{}/create_clone --case {} --clone {} --keepexe'.format(
-                       cime_dir, new_case, root_case)
-            # pipe output to file if specified
-            if(self.stdout is not None):
-                subprocess.run(cmd.split(' '), stdout=self.stdoutf)
-            else:
-                subprocess.run(cmd.split(' ')) 
-            self.clone_dirs.append(new_case)
-
-            # --- set clone resubmissions ---
-            print('Setting RESUBMIT={}'.format(resubmits))
-            os.chdir(new_case)
-            subprocess.run('{}/xmlchange RESUBMIT={}'.format(new_case, resubmits).split(' '), 
-                           stdout=self.stdoutf)
-            
-            # --- edit the user_nl_{component} file ---
             
-            # purge current occurences of the parameters present in the lattice
-            with open('{}/user_nl_{}'.format(new_case, self.component), 'r+') as f: 
-                entries = f.readlines()
-                f.seek(0)
-                for e in entries:
-                    param = ''.join(e.split()).split('=')[0]
-                    if(param not in all_params): 
-                        f.write(e)
-                f.truncate()
-                nl = f.read()
+            clones.append((new_case, entry, steps))
+        
+        # map sharded clones to their coordinates, and create the shards
+        clone_map = '{}/{}'.format(top_clone_dir, CLONE_MAP_NAME)
+        if(plan.layout != 'flat' or os.path.isfile(clone_map)):
+            write_clone_map(clone_map, self._lattice.names, self.clone_records)
+        for shard in {os.path.dirname(case) for case, _, _ in clones}:
+            os.makedirs(shard, exist_ok=True)
+        if(plan.outputs is not None):
+            for shard in {os.path.dirname(entry['output']) for _, entry, _ in clones}:
+                os.makedirs(shard, exist_ok=True)
+        
+        if(read_existing_clones):
+            self.save()
+            return
+        
+        # clone the root case per lattice point, either serially with output streamed 
+        # directly, or concurrently with output buffered per-clone
+        self.clone_failures = {}
+        xml_stats = []
+        clone_args = (root_case, cime_dir, root_nl, resubmits, journal)
+        
+        # in copy mode, the first clone is created by CIME and serves as the template for the rest
+        template = None
+        if(clone_mode == 'copy' and len(clones) > 0):
+            new_case, entry, steps = clones.pop(0)
+            try:
+                xml_stats.append(self._create_clone(new_case, entry, *clone_args, done=steps))
+            except Exception as e:
+                self.clone_records[new_case]['state'] = 'failed'
+                self.save()
+                raise RuntimeError(ERRC+'failed to create template clone {}: {}'.format(
+                                   new_case, e)+ENDC)
+            self.clone_dirs.append(new_case)
+            self.clone_records[new_case]['state'] = 'created'
+            template = entry
+        
+        if(max_workers == 1):
+            for new_case, entry, steps in clones:
+                try:
+                    xml_stats.append(self._create_clone(new_case, entry, *clone_args, 
+                                                        template=template, done=steps))
+                    self.clone_dirs.append(new_case)
+                    self.clone_records[new_case]['state'] = 'created'
+                except Exception as e:
+                    self.clone_failures[new_case] = e
+                    self.clone_records[new_case]['state'] = 'failed'
+        else:
+            outs = [io.StringIO() for _ in clones]
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                futures = [pool.submit(self._create_clone, new_case, entry, *clone_args, 
+                                       out=out, template=template, done=steps)
+                           for (new_case, entry, steps), out in zip(clones, outs)]
             
-            # write new parameter choices
-            with open('{}/user_nl_{}'.format(new_case, self.component), 'a') as f:
-                if not nl.endswith('\n'):
-                    f.write('\n')
-                f.write('! Following entries written by CESM_namelist_automator\n')
-                
-                for j in range(len(params)):
-                    
-                    # ---------- IS PARAMETER GROUP
-                    if(self.paramgroup_mask[j] == 1):
-                        group_params = params[j].split(',')
-                        group_values = values[j].split(',')
-                        
-                        if(self.xml_mask[j] == 1):
-                            # write all parameter choices in this group to env_run.xml via xmlchange
-                            os.chdir(new_case)
-                            for k in range(len(group_params)):
-                                xmlcmd = '{}/xmlchange {}={}'.format(
-                                         new_case, group_params[k], group_values[k])
-                                # pipe output to file if specified
-                                if(self.stdout is not None):
-                                    subprocess.run(xmlcmd.split(' '), stdout=self.stdoutf)
-                                else:
-                                    subprocess.run(cmd.split(' '))
-                        else:
-                            # write all parameter choices in this group to user_nl_{self.component}
-                            for k in range(len(group_params)):
-                                f.write('{} = {}\n'.format(group_params[k], group_values[k]))
-                    
-                    # ---------- IS SINGLE PARAMETER
-                    else: 
-                        if(self.xml_mask[j] == 1):
-                            # write parameter choice to env_run.xml via xmlchange
-                            os.chdir(new_case)
-                            xmlcmd = '{}/xmlchange {}={}'.format(new_case, params[j], values[j])
-                            # pipe output to file if specified
-                            if(self.stdout is not None):
-                                subprocess.run(xmlcmd.split(' '), stdout=self.stdoutf)
-                            else:
-                                subprocess.run(xmlcmd.split(' '))                    
-                        
-                        else:
-                            # write parameter choice to user_nl_{self.component}
-                            f.write('{} = {}\n'.format(params[j], values[j]))
+            # report output and collect clones in lattice order
+            for (new_case, entry, steps), out, future in zip(clones, outs, futures):
+                if(self.stdoutf is not None):
+                    self.stdoutf.write(out.getvalue())
+                    self.stdoutf.flush()
+                else:
+                    print(out.getvalue(), end='')
+                if(future.exception() is not None):
+                    self.clone_failures[new_case] = future.exception()
+                    self.clone_records[new_case]['state'] = 'failed'
+                else:
+                    xml_stats.append(future.result())
+                    self.clone_dirs.append(new_case)
+                    self.clone_records[new_case]['state'] = 'created'
+
+        # report subprocess savings from batching xmlchange calls. The savings are not 
+        # measured; they are extrapolated by assuming each unbatched call would have taken
+        # as long as the batched call, which is dominated by the startup of xmlchange
+        ncreated = len(xml_stats)
+        xml_stats = [stat for stat in xml_stats if stat is not None]
+        if(len(xml_stats) > 0):
+            nsettings, seconds = np.sum(xml_stats, axis=0)
+            estimate = np.sum([(n-1)*t for n,t in xml_stats])
+            print('\nxmlchange: {} subprocesses for {} clones ({} if unbatched); {:.2f} s spent, '\
+                  'an estimated ~{:.2f} s saved ({:.2f} s per clone, extrapolated from the '\
+                  'batched call times)'.format(len(xml_stats), ncreated, int(nsettings), seconds, 
+                  estimate, estimate/len(xml_stats)))
+        
+        self.save()
+        if(len(self.clone_failures) > 0):
+            msg = '\n'.join(['  {}: {}'.format(case, err) for case, err in self.clone_failures.items()])
+            raise RuntimeError(ERRC+'{} of {} clones failed:\n{}'.format(
+                               len(self.clone_failures), ncreated+len(self.clone_failures), 
+                               msg)+ENDC)
+
+
+    # ------------------------------------------------------------------------------
+
+
+    def _verify_progress(self, new_case, steps):
+        '''
+        Checks journaled clone creation steps against the case directory, without calling 
+        CIME. A clone whose cloning step was started but not completed is removed. Returns 
+        the set of steps which are complete.
+        '''
+        steps = set(steps)
+        if('cloned' in steps and not all([os.path.isfile('{}/{}'.format(new_case, f)) for f in 
+                                          ['env_case.xml', 'env_run.xml']])):
+            steps = {'start'}
+        if('namelist' in steps and not os.path.isfile('{}/user_nl_{}'.format(new_case, self.component))):
+            steps.discard('namelist')
+        if('start' in steps and 'cloned' not in steps and os.path.isdir(new_case)):
+            print('removing partially cloned case at ' + WARNC + '{}'.format(new_case) + ENDC)
+            shutil.rmtree(new_case)
+        return steps
+
+
+    def _call(self, cmd, cwd=None, out=None):
+        '''
+        Calls a CIME utility, raising subprocess.CalledProcessError on failure.
+
+        Parameters
+        ----------
+        cmd : string list
+            The command and its arguments
+        cwd : string, optional
+            Directory to run the command from. Defaults to None, in which case the 
+            command is run from the current directory.
+        out : file-like, optional
+            If passed, stdout and stderr of the command are captured and written here. 
+            Defaults to None, in which case stdout is sent to self.stdoutf (or the terminal
+            if no stdout file was given).
+        '''
+        if(out is None):
+            subprocess.run(cmd, cwd=cwd, stdout=self.stdoutf, check=True)
+        else:
+            result = subprocess.run(cmd, cwd=cwd, stdout=subprocess.PIPE, 
+                                    stderr=subprocess.STDOUT, text=True)
+            out.write(result.stdout)
+            result.check_returncode()
+
+
+    def _create_clone(self, new_case, entry, root_case, cime_dir, root_nl, resubmits, journal, 
+                      out=None, template=None, done=()):
+        '''
+        Clones the root case for a single lattice point, sets RESUBMIT and any xmlchange
+        parameters, and edits the user_nl_{self.component} file. Does not change the working
+        directory of the process, so that clones may be created concurrently. See 
+        create_clones() for the parameters; entry is the plan of the clone (see
+        clone_plan.entry()), root_nl is the parsed user_nl file of the root case, journal is
+        the sweep_journal to record completed steps to, out is passed to self._call(),
+        template, if passed, is the plan entry of an existing clone to copy in place of 
+        calling create_clone,
+        and done is the set of steps already completed for this clone by a previous call,
+        which are skipped.
+
+        All env_*.xml changes (RESUBMIT, and every xmlchange-flagged parameter or parameter
+        group member) are applied in one call to xmlchange, rather than one call each.
+
+        Returns
+        -------
+        nsettings : int
+            Number of settings applied with xmlchange
+        seconds : float
+            Wall time of the xmlchange call
+        None is returned in place of (nsettings, seconds) if the xml changes were already
+        applied.
+        '''
+
+        from case_copy import copy_case
+        def log(msg):
+            if(out is None): print(msg)
+            else: out.write(msg + '\n')
+
+        log('\n --------------- creating clone with {} = {} ---------------\n'.format(
+             [str(n) for n in self._lattice.names], [str(v) for v in entry['values']]))
+        if('start' not in done):
+            journal.record(new_case, 'start')
+        
+        # the output root of the clone is the directory containing its output directory
+        output_root = None if entry['output'] is None else os.path.dirname(entry['output'])
+        
+        # call the cloning script, or copy the template clone
+        if('cloned' in done):
+            log('resuming partially created clone {}; done: {}'.format(new_case, sorted(done)))
+        elif(template is not None):
+            log('copying template case {}'.format(template['case']))
+            copy_case(template['case'], new_case, None if output_root is None else 
+                      os.path.dirname(template['output']), output_root)
+            journal.record(new_case, 'cloned')
+        else:
+            cmd = ['{}/create_clone'.format(cime_dir), '--case', new_case, '--clone', root_case]
+            if(output_root is not None):
+                cmd.extend(['--cime-output-root', output_root])
+            cmd.append('--keepexe')
+            self._call(cmd, out=out)
+            journal.record(new_case, 'cloned')
+
+        # --- collect env_*.xml changes, starting with the clone resubmissions ---
+        log('Setting RESUBMIT={}'.format(resubmits))
+        xml_changes = [('RESUBMIT', resubmits)]
+        
+        # --- parameter choices were sorted into user_nl_{component} and env_*.xml changes 
+        #     when planned ---
+        xml_changes.extend(entry['xml_changes'])
+        nl_settings = entry['nl_settings']
+
+        # --- write user_nl_{component}, rendered from the pre-parsed root case namelist ---
+        if('namelist' not in done):
+            root_nl.write('{}/user_nl_{}'.format(new_case, self.component), nl_settings)
+            journal.record(new_case, 'namelist')
+
+        # --- apply all env_*.xml changes with a single call to xmlchange ---
+        if('xml' in done):
+            return None
+        t0 = time.time()
+        self._call(['{}/xmlchange'.format(new_case)] + _xmlchange_args(xml_changes), 
+                   cwd=new_case, out=out)
+        dt = time.time() - t0
+        journal.record(new_case, 'xml')
+        log('xmlchange: {} settings applied in 1 call ({:.2f} s); an estimated ~{:.2f} s saved '\
+            'over {} separate calls (extrapolated from this call)'.format(len(xml_changes), dt, 
+            (len(xml_changes)-1)*dt, len(xml_changes)))
+        return len(xml_changes), dt
+
+
+    # ------------------------------------------------------------------------------
+
 
+    def dedup_clones(self, store=None, mode='hardlink', include=None, exclude=None,
+                     min_size=4096, readonly=True, dry=False, extra_dirs=None):
+        '''
+        Replaces files with identical content across all clones (e.g. SourceMods, input 
+        files, and case scripts) with hardlinks or symlinks into a shared store, by content 
+        hash, and prints a report of the bytes saved. See dedup.dedup_files(); files which 
+        are modified in place by CIME (env_*.xml, namelists under Buildconf and CaseDocs, 
+        CaseStatus, ...) are excluded by default, and shared files are made read-only.
 
+        Parameters
+        ----------
+        store : string, optional
+            Directory of the shared store. Defaults to None, in which case .shared_files under
+            the common parent of all clones is used.
+        mode : string, optional
+            'hardlink' or 'symlink'. Defaults to 'hardlink'.
+        include : string list, optional
+            Glob patterns of files to consider. Defaults to None, meaning all files.
+        exclude : string list, optional
+            Glob patterns of files to skip. Defaults to None, in which case 
+            dedup.DEFAULT_EXCLUDE is used; pass [] to skip no files.
+        min_size : int, optional
+            Files smaller than this many bytes are skipped. Defaults to 4096.
+        readonly : bool, optional
+            Whether to remove write permissions from shared files. Defaults to True.
+        dry : bool, optional
+            If True, only report the savings. Defaults to False.
+        extra_dirs : string list, optional
+            Further directories to deduplicate along with the clones, e.g. directories of
+            per-member input files. Defaults to None.
+
+        Returns
+        -------
+        report : dict
+            See dedup.dedup_files()
+        '''
+        
+        from dedup import dedup_files, DEFAULT_EXCLUDE
+        if(len(self.clone_dirs) == 0):
+            raise RuntimeError('Clone cases must first be created by calling create_clones()')
+        if(exclude is None):
+            exclude = DEFAULT_EXCLUDE
+        roots = list(self.clone_dirs) + ([] if extra_dirs is None else list(extra_dirs))
+        if(store is None):
+            store = '{}/.shared_files'.format(os.path.commonpath([os.path.abspath(os.path.dirname(c)) 
+                                                                  for c in self.clone_dirs]))
+        
+        print('\n\n =============== DEDUPLICATING {} CLONES ==============='.format(len(roots)))
+        report = dedup_files(roots, store, mode, include, exclude, min_size, readonly, dry)
+        print('{}{} files replaced by {}s to {} shared files in {}, saving {:.2f} GB'.format(
+              'DRY: ' if dry else '', report['files'], mode, report['objects'], store, 
+              report['bytes_saved'] / 1e9))
+        return report
+    
+    
     # ------------------------------------------------------------------------------
 
 
-    def submit_clone_runs(self, dry=False):
+    def submit_clone_runs(self, dry=False, max_concurrent=None, max_queued=None, 
+                          queue_cmd=None, poll_interval=30, array=False, 
+                          array_dir=None, array_kwargs=None, only_new=False, retries=0, 
+                          retry_delay=30):
         '''
         Submit runs of the cloned cases created by self.create_clones()
 
@@ -527,14 +1179,64 @@ class namelist_lattice:
         dry : boolean
             Whether or not to do a dry run, which just prints the location of each
             submission script which is about to be called. Defaults to False.
+        max_concurrent : int, optional
+            If passed, submissions are made asynchronously, with at most this many case.submit
+            calls running at once (see submission.submit_async()), and the job ids reported by 
+            each submission are recorded in self.job_ids. Defaults to None, in which case 
+            clones are submitted serially, unless max_queued is passed.
+        max_queued : int, optional
+            Maximum number of jobs to allow in the scheduler queue at once. Further submissions
+            wait until queued jobs drop below this number. Implies asynchronous submission, with
+            max_concurrent defaulting to 4. Defaults to None, in which case the queue is not
+            checked.
+        queue_cmd : string, optional
+            Command listing the user's queued jobs, one per line, used with max_queued. 
+            Defaults to None, in which case submission.DEFAULT_QUEUE_CMD 
+            ('squeue -h -u $USER') is used.
+        poll_interval : float, optional
+            Seconds between queue checks while the queue is full. Defaults to 30.
+        array : boolean, optional
+            If True, all clones are submitted as a Slurm job array (or a few arrays, for very
+            large lattices), with a generated script dispatching each array task to its clone 
+            directory, so that the scheduler sees a handful of submissions rather than one per 
+            clone. See submission.submit_array(). If dry, the scripts are written but not 
+            submitted. Defaults to False.
+        array_dir : string, optional
+            Directory in which to write job array scripts and task logs. Defaults to None, in
+            which case the parent directory of the first clone is used.
+        array_kwargs : dict, optional
+            Further keyword arguments to submission.submit_array(), e.g. max_array_size,
+            max_parallel, directives, submit_cmd. Defaults to None.
+        only_new : boolean, optional
+            If True, only clones which have not yet been submitted are submitted (e.g. those
+            created by create_clones(only_new=True)). Defaults to False.
+        retries : int, optional
+            With asynchronous submission, the number of times a failed case.submit (e.g. one
+            rejected by a throttled scheduler) is retried. Defaults to 0.
+        retry_delay : float, optional
+            Seconds to wait before each retry. Defaults to 30.
         '''
         
         if(len(self.clone_dirs) == 0):
             raise RuntimeError('Clone cases must first be created by calling expand()')
+        
+        clones = self.clone_dirs
+        if(only_new):
+            clones = [c for c in clones if self.clone_records.get(c, {}).get('state') == 'created']
+            print('{} of {} clones not yet submitted'.format(len(clones), len(self.clone_dirs)))
+            if(len(clones) == 0):
+                return
+        
+        if(array):
+            self._submit_array(clones, array_dir, 'lattice', dry, array_kwargs)
+            return
+        if(not dry and (max_concurrent is not None or max_queued is not None)):
+            self._submit_async(clones, max_concurrent, max_queued, queue_cmd, poll_interval, 
+                               retries, retry_delay)
+            return
             
-        for clone in self.clone_dirs:
+        for clone in clones:
             
-            os.chdir(clone)
             submit = '{}/case.submit'.format(clone)
             
             print('\n\n=============== submitting job from {} ===============\n'.format(submit))
@@ -543,21 +1245,95 @@ class namelist_lattice:
             else:
                 # pipe output to file if specified
                 if(self.stdout is not None):
-                    subprocess.run(submit, stdout=self.stdoutf)
+                    subprocess.run(submit, cwd=clone, stdout=self.stdoutf)
                 else:
-                    subprocess.run(submit)
+                    subprocess.run(submit, cwd=clone)
+                self._set_state(clone, 'submitted')
+        self.save()
     
 
+    def _submit_async(self, clones, max_concurrent, max_queued, queue_cmd, poll_interval, 
+                      retries=0, retry_delay=30):
+        '''
+        Submits clones with submission.submit_async(), writes the output of each submission
+        in clone order, and records job ids in self.job_ids. Failed submissions are reported
+        once all clones have been attempted. See submit_clone_runs() for the parameters.
+        '''
+        
+        from submission import submit_async, DEFAULT_QUEUE_CMD
+        if(queue_cmd is None):
+            queue_cmd = DEFAULT_QUEUE_CMD
+        if(max_concurrent is None):
+            max_concurrent = 4
+        print('\n\n=============== submitting {} jobs ({} at once{}) ===============\n'.format(
+               len(clones), max_concurrent, 
+               '' if max_queued is None else ', at most {} queued'.format(max_queued)))
+        
+        results = submit_async(clones, max_concurrent, max_queued, queue_cmd, poll_interval,
+                               retries=retries, retry_delay=retry_delay)
+        
+        failures = []
+        for result in results:
+            header = '\n=============== submitted job from {}/case.submit ===============\n'.format(
+                      result['clone'])
+            if(self.stdoutf is not None):
+                self.stdoutf.write(header + result['output'])
+                self.stdoutf.flush()
+            else:
+                print(header + result['output'], end='')
+            if(result['returncode'] != 0):
+                failures.append(result)
+            else:
+                self.job_ids.setdefault(result['clone'], []).extend(result['job_ids'])
+                self._set_state(result['clone'], 'submitted')
+        self.save()
+        
+        if(len(failures) > 0):
+            msg = '\n'.join(['  {}: exit status {} after {} attempt{}'.format(r['clone'], 
+                             r['returncode'], r['attempts'], 's' if r['attempts'] > 1 else '') 
+                             for r in failures])
+            raise RuntimeError(ERRC+'{} of {} submissions failed:\n{}'.format(
+                               len(failures), len(results), msg)+ENDC)
+
+
+    def _submit_array(self, clones, array_dir, name, dry, array_kwargs):
+        '''
+        Submits clones as job arrays with submission.submit_array(), and records the array 
+        task job id of each clone in self.job_ids. See submit_clone_runs() for the parameters.
+        '''
+        
+        from submission import submit_array
+        if(array_dir is None):
+            array_dir = os.path.dirname(clones[0])
+        arrays = submit_array(clones, array_dir, name, dry=dry, 
+                              **({} if array_kwargs is None else array_kwargs))
+        for arr in arrays:
+            print('\n\n=============== {}job array of {} clones from {} (index {}) '\
+                  '===============\n'.format('DRY: ' if dry else 'submitted ', len(arr['clones']), 
+                  arr['script'], arr['index']))
+            if(self.stdoutf is not None):
+                self.stdoutf.write(arr['output'])
+            else:
+                print(arr['output'], end='')
+            if(arr['job_id'] is not None):
+                for i, clone in enumerate(arr['clones']):
+                    self.job_ids.setdefault(clone, []).append('{}_{}'.format(arr['job_id'], i))
+                    self._set_state(clone, 'submitted')
+        self.save()
+
+
     # ------------------------------------------------------------------------------
 
 
-    def resubmit_hung_clone_runs(self, dry=False):
+    def resubmit_hung_clone_runs(self, dry=False, array=False, array_dir=None, array_kwargs=None):
         '''
         Resubmit runs of any cloned cases created by self.create_clones() for which
-        './xmlquery RESUBMIT' does not currently return 0. This is meant to be used in 
-        instances where a job crashed due to an error thrown by the job scheduler, and 
-        not the model. In these cases, we may end up with some clones having finished 
-        all of the requested resubmits, while other have not. This funciton identifies
+        RESUBMIT is not currently 0. RESUBMIT is read directly from each clone's 
+        env_run.xml, concurrently across clones (see case_scanner.scan_cases()), rather
+        than by xmlquery. This is meant to be used in instances where a job crashed due 
+        to an error thrown by the job scheduler, and not the model. In these cases, we 
+        may end up with some clones having finished all of the requested resubmits, 
+        while other have not. This funciton identifies
         those incomplete runs and submits them again. 
 
         It is up to the user to ensure that no cases for which RESUBMIT > 0 are currently
@@ -576,17 +1352,28 @@ class namelist_lattice:
         dry : boolean
             Whether or not to do a dry run, which just prints the location of each
             resubmission script which is about to be called. Defaults to False.
+        array : boolean, optional
+            If True, the clones needing resubmission are submitted together as a job array; see
+            submit_clone_runs(). Defaults to False.
+        array_dir : string, optional
+            See submit_clone_runs().
+        array_kwargs : dict, optional
+            See submit_clone_runs().
         '''
         
         if(len(self.clone_dirs) == 0):
             raise RuntimeError('Clone cases must first be created by calling expand()')
         
+        # read RESUBMIT from every clone's env_run.xml concurrently
+        from case_scanner import scan_cases
+        status = scan_cases(self.clone_dirs)
+        
+        hung = []
         for clone in self.clone_dirs:
             
-            os.chdir(clone)
-            resub_query = ['{}/xmlquery'.format(clone), 'RESUBMIT']
-            resubs = subprocess.check_output(resub_query)
-            resubs = int(resubs.split()[-1])
+            if(status[clone] is None or 'RESUBMIT' not in status[clone]):
+                raise RuntimeError(ERRC+'could not read RESUBMIT from {}/env_run.xml'.format(clone)+ENDC)
+            resubs = int(status[clone]['RESUBMIT'])
             
             # If RESUBMIT is zero, then there is nothing to do
             if(resubs == 0):
@@ -598,49 +1385,251 @@ class namelist_lattice:
             
             print('\n\n=============== resubmitting job from {} with RESUBMIT={} ===============\n'.format(
                                                                                             submit, resubs))
-            if(dry):
+            if(array):
+                hung.append(clone)
+            elif(dry):
                 print('DRY: {}'.format(submit))
             else:
                 if(self.stdout is not None):
-                    subprocess.run(submit, stdout=self.stdoutf)
+                    subprocess.run(submit, cwd=clone, stdout=self.stdoutf)
                 else:
-                    subprocess.run(submit)
+                    subprocess.run(submit, cwd=clone)
+                self._set_state(clone, 'submitted')
+        
+        self.save()
+        if(array and len(hung) > 0):
+            self._submit_array(hung, array_dir, 'resubmit', dry, array_kwargs)
 
 
     # ------------------------------------------------------------------------------
 
 
-    def vis_planes(self):
+    def monitor_clone_runs(self, interval=None, count=None, queue_cmd=None, 
+                           max_workers=16):
+        '''
+        Reports where the runs of all clones stand: the number of clones pending, queued, 
+        running (with their model time), failed, and complete. Every clone's CaseStatus, run
+        directory log, and env_run.xml are checked concurrently, and the scheduler is queried
+        once; see run_monitor. Logs are read incrementally across calls, so repeated calls 
+        (or watching, with interval) only read what the runs appended since.
+
+        Parameters
+        ----------
+        interval : float, optional
+            If passed, the report is refreshed every interval seconds until all clones are 
+            complete or failed (or count reports were made). Defaults to None, in which case
+            a single report is made.
+        count : int, optional
+            Maximum number of reports, with interval. Defaults to None.
+        queue_cmd : string or False, optional
+            Command listing the user's jobs, one per line, as job id, job name, and job 
+            state; see run_monitor. Defaults to None, in which case 
+            run_monitor.DEFAULT_STATUS_CMD is used. If False, the scheduler is not queried.
+        max_workers : int, optional
+            Maximum number of clones checked at once. Defaults to 16.
+
+        Returns
+        -------
+        status : dict
+            State of each clone, by clone; see run_monitor.poll()
         '''
-        Visualizes the lattice as a GTC, with a subplot per parameter pair
-        This function is probbaly broken right now btw
+        
+        if(len(self.clone_dirs) == 0):
+            raise RuntimeError('Clone cases must first be created by calling expand()')
+        
+        from run_monitor import run_monitor, DEFAULT_STATUS_CMD
+        queue_cmd = DEFAULT_STATUS_CMD if queue_cmd is None else (queue_cmd or None)
+        if(self._monitor is None or self._monitor.cases != self.clone_dirs):
+            self._monitor = run_monitor(self.clone_dirs, self.job_ids, queue_cmd, max_workers)
+        self._monitor.queue_cmd, self._monitor.max_workers = queue_cmd, max_workers
+        if(interval is None):
+            status = self._monitor.poll()
+            print(self._monitor.report())
+            return status
+        return self._monitor.watch(interval, count)
+
+
+    # ------------------------------------------------------------------------------
+
+
+    def aggregate_clone_history(self, variables, out, reduction='global_mean', 
+                                hist_glob=None, outputs=False, max_workers=4, chunk_bytes=None):
         '''
+        Extracts variables (or reductions of them, e.g. global or zonal means) from the 
+        history files of every clone into one dataset, whose leading dimension is the clone, 
+        carrying the flat lattice index ('point') and parameter values of each clone. Clones 
+        are read in a process pool, in chunks; see history_aggregate.aggregate_history().
 
-        N = len(self.param_names)
-        f, ax = plt.subplots(N, N, figsize=(10,10))
+        Parameters
+        ----------
+        variables : string list
+            Names of the variables to extract
+        out : string
+            Location of the dataset to write, ending in .nc (requires the netCDF4 package) or
+            .npz
+        reduction : string or dict, optional
+            Reduction of all variables, or reductions by variable; one of 'none', 'mean', 
+            'global_mean', or 'zonal_mean'. Defaults to 'global_mean'.
+        hist_glob : string, optional
+            Glob pattern that history file names must match. Defaults to None, in which case 
+            history_aggregate.DEFAULT_HIST_GLOB ('*.h0.*.nc') is used.
+        outputs : bool, optional
+            If True, history files are found in the clone output directories recorded by 
+            create_clones(), rather than in the run and archive directories set in each 
+            clone's env_run.xml. Defaults to False.
+        max_workers : int, optional
+            Maximum number of clones read at once. Defaults to 4.
+        chunk_bytes : int, optional
+            Maximum bytes of a variable read at once. Defaults to None, in which case 
+            history_aggregate.CHUNK_BYTES (2**26) is used.
+
+        Returns
+        -------
+        nfiles : int array
+            Number of history files read per clone, in the order of self.clone_dirs
+        '''
         
-        # remove diagonal and upper traingle
-        for i in range(N):
-            remove_right = N-i
-            for j in range(remove_right):
-                ax[i, N-(j+1)].axis('off')
+        if(len(self.clone_dirs) == 0):
+            raise RuntimeError('Clone cases must first be created by calling expand()')
+        from history_aggregate import aggregate_history, DEFAULT_HIST_GLOB, CHUNK_BYTES
+        hist_glob = DEFAULT_HIST_GLOB if hist_glob is None else hist_glob
+        chunk_bytes = CHUNK_BYTES if chunk_bytes is None else chunk_bytes
+        missing = [c for c in self.clone_dirs if c not in self.clone_records]
+        if(len(missing) > 0):
+            raise RuntimeError(ERRC+'no lattice point recorded for {} clones, e.g. {}'.format(
+                               len(missing), missing[0])+ENDC)
+        records = [self.clone_records[c] for c in self.clone_dirs]
+        if(outputs and any([r['output'] is None for r in records])):
+            raise RuntimeError(ERRC+'clones were created without top_output_dir'+ENDC)
+        
+        # parameter values, and flat index in the current lattice, of each clone, by
+        # coordinate identity; recorded points go stale once the lattice is refined
+        flat, cases = self.clone_points()
+        flat = dict(zip(cases, flat))
+        outside = [c for c in self.clone_dirs if c not in flat]
+        if(len(outside) > 0):
+            raise RuntimeError(ERRC+'{} clones are not points of the current lattice, e.g. '\
+                               '{}'.format(len(outside), outside[0])+ENDC)
+        points = np.array([flat[c] for c in self.clone_dirs], dtype=np.int64)
+        codes = self._lattice.dim_indices(points)
+        coords = {name: self._lattice.vectors[m][codes[m]] 
+                  for m, name in enumerate(self._lattice.names)}
+        sources = [r['output'] for r in records] if outputs else self.clone_dirs
+        return aggregate_history(sources, variables, out, reduction, hist_glob, points, coords,
+                                 max_workers, chunk_bytes)
 
-        # populate lower triangle
-        for i in range(N):
-            num_plots = i
-            for j in range(num_plots):
-                v1 = self.lattice[self.param_names[j]]
-                v2 = self._lattice[self.param_names[i]]
-                ax[i, j].plot(v1, v2, '.r', ms=10)
-                ax[i, j].grid(True)
-                if(j == 0):
-                    ax[i,j].set_ylabel(self.param_names[i])
-                else:
-                    ax[i, j].set_yticklabels([])
-                if(i == N-1):
-                    ax[i,j].set_xlabel(self.param_names[j])
-                else:
-                    ax[i, j].set_xticklabels([])
-                    
-        plt.tight_layout()
-        plt.show()
+
+    # ------------------------------------------------------------------------------
+
+
+    def _set_state(self, clone, state):
+        '''
+        Records the state of a clone in self.clone_records, if the clone is known
+        '''
+        if(clone in self.clone_records):
+            self.clone_records[clone]['state'] = state
+
+
+    def save(self, path=None):
+        '''
+        Writes a manifest of the sweep: the lattice definition (parameter vectors, xmlchange and
+        group flags, string constraints, and the selected points), and, per clone, its case and 
+        output locations, lattice point, coordinates, state, and job ids. The sweep can be 
+        reopened with load() without touching the clone directories.
+
+        Parameters
+        ----------
+        path : string, optional
+            Location of the manifest. Defaults to None, in which case self.manifest is used,
+            as set by create_clones() or load(). If neither is set, nothing is written.
+        '''
+        
+        from sweep_manifest import write_manifest, vector_to_json
+        if(path is None):
+            path = self.manifest
+        if(path is None):
+            return
+        
+        selection = None
+        if(self._lattice is not None and self._lattice._selection is not None):
+            selection = self._lattice.flat_indices()
+        callables = [c for c in self.constraints if not isinstance(c.predicate, str)]
+        if(len(callables) > 0):
+            warnings.warn(WARNC+'{} callable constraints cannot be saved to the manifest; the '\
+                          'selected points are saved instead'.format(len(callables))+ENDC)
+        
+        write_manifest(path, {
+            'component': self.component,
+            'nofill': self.nofill,
+            'param_names': list(self.param_names),
+            'param_vectors': [vector_to_json(v) for v in self.param_vectors],
+            'xml_mask': list(self.xml_mask),
+            'paramgroup_mask': list(self.paramgroup_mask),
+            'paramgroup_labels': list(self.paramgroup_labels),
+            'constraints': [c.predicate for c in self.constraints if isinstance(c.predicate, str)],
+            'sample_blocks': self.sample_blocks,
+            'selection': selection,
+            'candidate_pool': self.candidate_pool,
+            'clones': [dict(record, case=case, job_ids=self.job_ids.get(case, []))
+                       for case, record in self.clone_records.items()]})
+    
+    
+    @classmethod
+    def load(cls, path):
+        '''
+        Reopens a sweep from a manifest written by save() (or automatically by create_clones()).
+        The lattice, clone directories, clone states and job ids are restored, so that e.g. 
+        submit_clone_runs() and resubmit_hung_clone_runs() can be called directly.
+
+        Parameters
+        ----------
+        path : string
+            Location of the manifest
+
+        Returns
+        -------
+        lattice : namelist_lattice
+        '''
+        
+        from sweep_manifest import read_manifest, vector_from_json
+        m = read_manifest(path)
+        obj = cls(m['component'], m['nofill'])
+        obj.param_names = list(m['param_names'])
+        obj.param_vectors = [vector_from_json(v) for v in m['param_vectors']]
+        obj.xml_mask = list(m['xml_mask'])
+        obj.paramgroup_mask = list(m['paramgroup_mask'])
+        obj.paramgroup_labels = list(m['paramgroup_labels'])
+        obj.constraints = [lattice_constraint(c) for c in m['constraints']]
+        obj.sample_blocks = m.get('sample_blocks', [])
+        if(len(obj.param_names) > 0):
+            obj._build_lattice()
+            if(m['selection'] is not None):
+                obj._lattice.select(m['selection'])
+        if(m.get('candidate_pool') is not None):
+            obj.candidate_pool = np.array(m['candidate_pool'], dtype=np.int64)
+        
+        for record in m['clones']:
+            record = dict(record)
+            case = record.pop('case')
+            job_ids = record.pop('job_ids')
+            obj.clone_records[case] = record
+            if(len(job_ids) > 0):
+                obj.job_ids[case] = job_ids
+            if(record['state'] not in ['pending', 'failed']):
+                obj.clone_dirs.append(case)
+        obj.manifest = path
+        return obj
+
+
+    # ------------------------------------------------------------------------------
+
+
+    def vis_planes(self, **kwargs):
+        '''
+        Visualizes the lattice as a corner plot, with a subplot per parameter pair. Large 
+        lattices are drawn as binned histograms, and points may be colored by clone status or
+        metric. See lattice_plotting.vis_planes() for the arguments; matplotlib is only 
+        imported when this is called.
+        '''
+        from lattice_plotting import vis_planes
+        return vis_planes(self, **kwargs)
@@ -0,0 +1,177 @@
+import struct
+import numpy as np
+
+ERRC  = '\033[91m'
+ENDC  = '\033[0m'
+
+# leading bytes of NetCDF classic (CDF-1), 64-bit offset (CDF-2), 64-bit data (CDF-5), and
+# NetCDF-4 (HDF5) files
+CLASSIC_MAGIC = {b'CDF\x01': 1, b'CDF\x02': 2, b'CDF\x05': 5}
+HDF5_MAGIC = b'\x89HDF\r\n\x1a\n'
+
+# header tags, and big-endian numpy types of the NetCDF external types
+_NC_DIMENSION, _NC_VARIABLE, _NC_ATTRIBUTE = 0x0A, 0x0B, 0x0C
+NC_TYPES = {1: '>i1', 2: 'S1', 3: '>i2', 4: '>i4', 5: '>f4', 6: '>f8',
+            7: '>u1', 8: '>u2', 9: '>u4', 10: '>i8', 11: '>u8'}
+
+# bytes read at a time while parsing a header
+_READ_SIZE = 2**16
+
+
+# ==========================================================================================
+# ==========================================================================================
+
+
+def nc_format(path):
+    '''
+    Identifies the format of a NetCDF file from its leading bytes, without any NetCDF library
+
+    Parameters
+    ----------
+    path : string
+        Location of the file
+
+    Returns
+    -------
+    fmt : string
+        'classic' (CDF-1, CDF-2, or CDF-5), 'hdf5' (NetCDF-4), or None if the file is
+        neither
+    '''
+    with open(path, 'rb') as f:
+        head = f.read(8)
+    if(head[:4] in CLASSIC_MAGIC):
+        return 'classic'
+    if(head == HDF5_MAGIC):
+        return 'hdf5'
+    return None
+
+
+def read_header(path):
+    '''
+    Parses the header of a NetCDF classic format file (CDF-1, CDF-2, or CDF-5), reading only
+    as many bytes of the file as the header occupies
+
+    Parameters
+    ----------
+    path : string
+        Location of the file
+
+    Returns
+    -------
+    header : dict
+        With keys 'version' (1, 2, or 5), 'numrecs', 'dims' (dict of dimension lengths by
+        name, in file order, with the record dimension having length None), 'attributes'
+        (global attributes by name), 'recsize' (bytes per record, over all record variables),
+        and 'variables', a dict by name of dicts with keys 'dims' (dimension names), 'shape'
+        (with the current number of records for record variables), 'dtype' (big-endian numpy
+        dtype), 'attributes', 'record' (whether the variable is a record variable), 'vsize',
+        and 'begin' (byte offset of the variable's data, or of its first record)
+    '''
+    with open(path, 'rb') as f:
+        r = _reader(f)
+        magic = r.read(4)
+        if(magic not in CLASSIC_MAGIC):
+            raise RuntimeError(ERRC+'{} is not a NetCDF classic format file'.format(path)+ENDC)
+        version = CLASSIC_MAGIC[magic]
+        size = 8 if version == 5 else 4
+        r.size = size
+
+        numrecs = r.nonneg()
+        if(numrecs in (-1, 2**(8*size) - 1)):
+            # streaming (all bits set, read as -1 in 32-bit headers)
+            numrecs = None
+
+        dims = []
+        for _ in range(r.list_length(_NC_DIMENSION)):
+            name = r.name()
+            dims.append((name, r.nonneg()))
+        attributes = r.attributes()
+
+        variables = {}
+        for _ in range(r.list_length(_NC_VARIABLE)):
+            name = r.name()
+            dimids = [r.nonneg() for _ in range(r.nonneg())]
+            vatts = r.attributes()
+            nc_type = r.int32()
+            vsize = r.nonneg()
+            begin = r.uint64() if version > 1 else r.int32()
+            record = len(dimids) > 0 and dims[dimids[0]][1] == 0
+            shape = [dims[d][1] for d in dimids]
+            if(record):
+                shape[0] = numrecs
+            variables[name] = {'dims': [dims[d][0] for d in dimids], 'shape': tuple(shape),
+                               'dtype': np.dtype(NC_TYPES[nc_type]), 'attributes': vatts,
+                               'record': record, 'vsize': vsize, 'begin': begin}
+
+    # record variables are interleaved per record; a single record variable is not padded
+    records = [v for v in variables.values() if v['record']]
+    if(len(records) == 1):
+        recsize = int(np.prod(records[0]['shape'][1:], dtype=np.int64)) * records[0]['dtype'].itemsize
+    else:
+        recsize = sum(v['vsize'] for v in records)
+    return {'version': version, 'numrecs': numrecs,
+            'dims': {name: (None if length == 0 else length) for name, length in dims},
+            'attributes': attributes, 'recsize': recsize, 'variables': variables}
+
+
+# ------------------------------------------------------------------------------
+
+
+class _reader:
+    def __init__(self, f):
+        '''
+        Sequential big-endian reader over a file, fetching _READ_SIZE bytes at a time
+        '''
+        self.f = f
+        self.buf = b''
+        self.pos = 0
+        self.size = 4
+
+    def read(self, n):
+        while(len(self.buf) - self.pos < n):
+            chunk = self.f.read(_READ_SIZE)
+            if(len(chunk) == 0):
+                raise RuntimeError(ERRC+'truncated NetCDF header'+ENDC)
+            self.buf = self.buf[self.pos:] + chunk
+            self.pos = 0
+        out = self.buf[self.pos:self.pos+n]
+        self.pos += n
+        return out
+
+    def int32(self):
+        return struct.unpack('>i', self.read(4))[0]
+
+    def uint64(self):
+        return struct.unpack('>Q', self.read(8))[0]
+
+    def nonneg(self):
+        return self.uint64() if self.size == 8 else self.int32()
+
+    def padded(self, n):
+        data = self.read(n)
+        self.read((-n) % 4)
+        return data
+
+    def name(self):
+        return self.padded(self.nonneg()).decode('utf-8')
+
+    def list_length(self, tag):
+        found, n = self.int32(), self.nonneg()
+        if(found not in (0, tag)):
+            raise RuntimeError(ERRC+'malformed NetCDF header: expected tag {}, found {}'.format(
+                               tag, found)+ENDC)
+        return n
+
+    def attributes(self):
+        atts = {}
+        for _ in range(self.list_length(_NC_ATTRIBUTE)):
+            name = self.name()
+            dtype = np.dtype(NC_TYPES[self.int32()])
+            n = self.nonneg()
+            data = self.padded(n * dtype.itemsize)
+            if(dtype.kind == 'S'):
+                atts[name] = data.decode('utf-8', errors='replace')
+            else:
+                values = np.frombuffer(data, dtype=dtype)
+                atts[name] = values[0].item() if n == 1 else values.astype(dtype.newbyteorder('='))
+        return atts
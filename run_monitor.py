@@ -0,0 +1,332 @@
+import os
+import re
+import sys
+import time
+import shlex
+import fnmatch
+import subprocess
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from case_scanner import read_env_xml
+
+ERRC  = '\033[91m'
+ENDC  = '\033[0m'
+
+# states of a clone run, in the order they are summarized
+RUN_STATES = ['pending', 'queued', 'running', 'failed', 'complete']
+
+# command listing the user's jobs, one per line, as: job id, job name, job state
+DEFAULT_STATUS_CMD = 'squeue -h -u $USER -o \'%i %j %T\''
+# scheduler job states of queued jobs; any other state of a listed job counts as running
+QUEUED_JOB_STATES = ['PENDING', 'PD', 'CONFIGURING', 'CF', 'REQUEUED', 'RQ', 'SUSPENDED', 'S']
+
+# run directory logs reporting model time, newest first by name; the coupler (cpl), driver
+# (drv), or mediator (med) log, depending on the model version
+MODEL_LOGS = ['cpl.log.*', 'drv.log.*', 'med.log.*']
+
+# CaseStatus events, e.g. '2024-01-01 00:00:00: case.run starting 1234', and model dates
+# of the run logs, e.g. 'tStamp_write: model date =   00010102       0 wall clock = ...'
+_EVENT = re.compile(r'^\S+ \S+: (case\.\w+|st_archive) (starting|success|error)', re.MULTILINE)
+_MODEL_DATE = re.compile(r'model date =\s*(\d+)\s+(\d+)')
+
+# days before each month in the 365 day (noleap) calendar
+_MONTH_DAYS = np.cumsum([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+
+# ==========================================================================================
+# ==========================================================================================
+
+
+class run_monitor:
+    def __init__(self, cases, job_ids=None, queue_cmd=DEFAULT_STATUS_CMD, max_workers=16):
+        '''
+        This class monitors the runs of many CIME cases. Each call to poll() checks every case
+        concurrently, reading its CaseStatus file, the model log in its run directory, and
+        RESUBMIT from env_run.xml, and runs the scheduler command once for all cases. Files
+        are read incrementally: only bytes appended since the previous poll are read, by
+        tracking an offset per file, so polling an unchanged sweep costs about one stat per
+        file.
+
+        Parameters
+        ----------
+        cases : string list
+            Case directories
+        job_ids : dict, optional
+            Scheduler job ids (string lists) by case, e.g. namelist_lattice.job_ids. Cases
+            without job ids are matched to jobs by job name (CIME names jobs {job}.{case
+            name}). Defaults to None.
+        queue_cmd : string, optional
+            Command listing the user's jobs, one per line, as job id, job name, and job state,
+            separated by whitespace. Environment variables are expanded. Defaults to
+            DEFAULT_STATUS_CMD. If None, the scheduler is not queried, and the state of each
+            case is read from its files only.
+        max_workers : int, optional
+            Maximum number of cases checked at once. Defaults to 16.
+        '''
+        self.cases = list(cases)
+        self.job_ids = {} if job_ids is None else job_ids
+        self.queue_cmd = queue_cmd
+        self.max_workers = max_workers
+        self.status = {}
+        self._offsets = {}
+        self._tracked = {case: {'event': None, 'log': None, 'model_date': None}
+                         for case in self.cases}
+
+
+    # ------------------------------------------------------------------------------
+
+
+    def poll(self):
+        '''
+        Checks the state of every case
+
+        Returns
+        -------
+        status : dict
+            By case, in the order of cases, dicts with keys 'state' (one of RUN_STATES),
+            'event' (last CaseStatus event, e.g. 'case.run success'), 'job_state' (scheduler
+            state, or None if the case has no listed job), 'model_date' (latest model date
+            in the run log, as 'yyyymmdd sssss', or None), 'model_days' (model days
+            simulated since RUN_STARTDATE, or None), and 'resubmit' (RESUBMIT, or None)
+        '''
+        jobs = None if self.queue_cmd is None else _list_jobs(self.queue_cmd)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            self.status = dict(zip(self.cases, pool.map(lambda case: self._check(case, jobs),
+                                                        self.cases)))
+        return self.status
+
+
+    def summary(self, status=None):
+        '''
+        Counts the cases in each state
+
+        Parameters
+        ----------
+        status : dict, optional
+            As returned by poll(). Defaults to None, in which case the last poll is used.
+
+        Returns
+        -------
+        counts : dict
+            Number of cases per state, in the order of RUN_STATES, and 'model_days', the
+            (min, median, max) model days of the running cases, or None
+        '''
+        status = self.status if status is None else status
+        counts = {state: 0 for state in RUN_STATES}
+        for s in status.values():
+            counts[s['state']] += 1
+        days = [s['model_days'] for s in status.values()
+                if s['state'] == 'running' and s['model_days'] is not None]
+        counts['model_days'] = None if len(days) == 0 else \
+                               (float(np.min(days)), float(np.median(days)), float(np.max(days)))
+        return counts
+
+
+    def report(self, status=None, failed=10):
+        '''
+        Formats a summary of the cases' states, with the model time of running cases, and
+        the failed cases
+
+        Parameters
+        ----------
+        status : dict, optional
+            As returned by poll(). Defaults to None, in which case the last poll is used.
+        failed : int, optional
+            Maximum number of failed cases listed. Defaults to 10.
+
+        Returns
+        -------
+        report : string
+        '''
+        status = self.status if status is None else status
+        counts = self.summary(status)
+        lines = ['=============== {} runs at {} ==============='.format(
+                 len(status), time.strftime('%Y-%m-%d %H:%M:%S'))]
+        lines.extend(['  {:<10s}{:>7d}'.format(state, counts[state]) for state in RUN_STATES])
+        if(counts['model_days'] is not None):
+            lines.append('  model days of running cases: min {:.1f}, median {:.1f}, '\
+                         'max {:.1f}'.format(*counts['model_days']))
+        failures = [case for case, s in status.items() if s['state'] == 'failed']
+        for case in failures[:failed]:
+            lines.append(ERRC + '  failed: {} ({})'.format(case, status[case]['event']) + ENDC)
+        if(len(failures) > failed):
+            lines.append(ERRC + '  ... and {} more'.format(len(failures) - failed) + ENDC)
+        return '\n'.join(lines)
+
+
+    def watch(self, interval=60, count=None, out=None):
+        '''
+        Polls and reports repeatedly, redrawing the report in place on a terminal, until
+        every case is complete or failed, or count polls were made
+
+        Parameters
+        ----------
+        interval : float, optional
+            Seconds between polls. Defaults to 60.
+        count : int, optional
+            Maximum number of polls. Defaults to None, for no limit.
+        out : file-like, optional
+            Where to write reports. Defaults to None, in which case sys.stdout is used.
+
+        Returns
+        -------
+        status : dict
+            As returned by the last poll()
+        '''
+        out = sys.stdout if out is None else out
+        refresh = '\033[2J\033[H' if out.isatty() else '\n'
+        n = 0
+        while True:
+            self.poll()
+            n += 1
+            out.write(refresh + self.report() + '\n')
+            out.flush()
+            counts = self.summary()
+            if(counts['complete'] + counts['failed'] == len(self.cases) or
+               (count is not None and n >= count)):
+                return self.status
+            time.sleep(interval)
+
+
+    # ------------------------------------------------------------------------------
+
+
+    def _check(self, case, jobs):
+        '''
+        Checks the state of one case
+        '''
+        tracked = self._tracked.setdefault(case, {'event': None, 'log': None, 'model_date': None})
+
+        # last event of CaseStatus
+        text = self._read_new('{}/CaseStatus'.format(case))
+        events = _EVENT.findall(text)
+        if(len(events) > 0):
+            event = ' '.join(events[-1])
+            if(event != tracked['event'] and event == 'case.run starting'):
+                # a new run segment may write a new log
+                tracked['log'] = None
+            tracked['event'] = event
+        event = tracked['event']
+
+        try:
+            env = read_env_xml('{}/env_run.xml'.format(case))
+        except (OSError, SyntaxError):
+            env = {}
+
+        # latest model date of the run log
+        if(event is not None and event.startswith(('case.run', 'st_archive')) and
+           env.get('RUNDIR') is not None):
+            if(tracked['log'] is None):
+                tracked['log'] = _newest_log(env['RUNDIR'])
+            if(tracked['log'] is not None):
+                dates = _MODEL_DATE.findall(self._read_new(tracked['log']))
+                if(len(dates) > 0):
+                    tracked['model_date'] = '{} {}'.format(*dates[-1])
+
+        # scheduler state, by job id, or by job name
+        job_state = None
+        if(jobs is not None):
+            ids = self.job_ids.get(case, [])
+            name = os.path.basename(os.path.normpath(case))
+            for job_id, job_name, state in jobs:
+                if(job_id in ids or job_name == name or job_name.endswith('.' + name)):
+                    job_state = state
+                    if(state not in QUEUED_JOB_STATES):
+                        break
+
+        resubmit = env.get('RESUBMIT')
+        if(job_state is not None):
+            state = 'queued' if job_state in QUEUED_JOB_STATES else 'running'
+        elif(event is None):
+            state = 'pending'
+        elif(event.endswith('error')):
+            state = 'failed'
+        elif(event == 'case.run starting'):
+            # a run whose job has left the queue without reporting success has died
+            state = 'failed' if (jobs is not None and case in self.job_ids) else 'running'
+        elif(event in ['case.run success', 'st_archive starting', 'st_archive success']):
+            state = 'complete' if resubmit == 0 else 'queued' if jobs is None else 'pending'
+        else:
+            state = 'queued' if jobs is None else 'pending'
+
+        return {'state': state, 'event': event, 'job_state': job_state,
+                'model_date': tracked['model_date'],
+                'model_days': _model_days(tracked['model_date'], env.get('RUN_STARTDATE')),
+                'resubmit': resubmit}
+
+
+    def _read_new(self, path):
+        '''
+        Reads the complete lines appended to a file since the last read. The offset is reset
+        if the file shrank (e.g. was replaced).
+        '''
+        offset = self._offsets.get(path, 0)
+        try:
+            with open(path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if(size < offset):
+                    offset = 0
+                if(size == offset):
+                    return ''
+                f.seek(offset)
+                data = f.read(size - offset)
+        except OSError:
+            return ''
+        end = data.rfind(b'\n') + 1
+        self._offsets[path] = offset + end
+        return data[:end].decode('utf-8', errors='replace')
+
+
+# ------------------------------------------------------------------------------
+
+
+def _list_jobs(queue_cmd):
+    '''
+    Runs queue_cmd, returning (job id, job name, job state) per listed job
+    '''
+    result = subprocess.run(shlex.split(os.path.expandvars(queue_cmd)), stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, text=True)
+    if(result.returncode != 0):
+        raise RuntimeError(ERRC+'queue command \'{}\' failed with exit status {}'.format(
+                           queue_cmd, result.returncode)+ENDC)
+    jobs = []
+    for line in result.stdout.splitlines():
+        fields = line.split()
+        if(len(fields) > 0):
+            jobs.append((fields + ['', ''])[:3])
+    return jobs
+
+
+def _newest_log(rundir):
+    '''
+    Location of the newest model log in a run directory, or None
+    '''
+    try:
+        with os.scandir(rundir) as it:
+            names = [entry.name for entry in it]
+    except OSError:
+        return None
+    for pattern in MODEL_LOGS:
+        logs = sorted(fnmatch.filter(names, pattern))
+        if(len(logs) > 0):
+            return '{}/{}'.format(rundir, logs[-1])
+    return None
+
+
+def _model_days(model_date, start_date):
+    '''
+    Model days between RUN_STARTDATE ('yyyy-mm-dd') and a model date ('yyyymmdd sssss') in the
+    noleap calendar, or None if either is unknown
+    '''
+    if(model_date is None or start_date is None):
+        return None
+    try:
+        ymd, seconds = model_date.split()
+        y, m, d = int(ymd[:-4]), int(ymd[-4:-2]), int(ymd[-2:])
+        y0, m0, d0 = [int(v) for v in str(start_date).split('-')]
+    except ValueError:
+        return None
+    if(not (1 <= m <= 12 and 1 <= m0 <= 12)):
+        return None
+    days = lambda y, m, d: 365*y + _MONTH_DAYS[m-1] + d
+    return float(days(y, m, d) - days(y0, m0, d0) + int(seconds) / 86400)
@@ -0,0 +1,122 @@
+import numpy as np
+
+ERRC  = '\033[91m'
+ENDC  = '\033[0m'
+
+SAMPLERS = ['lhs', 'sobol', 'halton']
+
+
+# ==========================================================================================
+# ==========================================================================================
+
+
+def unit_samples(n, d, method='lhs', seed=None):
+    '''
+    Generates n space-filling samples of the d-dimensional unit hypercube [0, 1)^d
+
+    Parameters
+    ----------
+    n : int
+        Number of samples
+    d : int
+        Number of dimensions
+    method : string, optional
+        One of 'lhs' (Latin hypercube), 'sobol' (scrambled Sobol sequence; requires scipy),
+        or 'halton' (Halton sequence, randomly shifted if seed is given). Defaults to 'lhs'.
+    seed : int, optional
+        Seed for the random number generator. Defaults to None, in which case samples are
+        not reproducible (and the Halton sequence is not shifted).
+
+    Returns
+    -------
+    u : (n, d) float array
+    '''
+    if(method not in SAMPLERS):
+        raise RuntimeError(ERRC+'sampling method must be one of {}'.format(SAMPLERS)+ENDC)
+    rng = np.random.default_rng(seed)
+
+    if(method == 'lhs'):
+        # one sample in each of n strata per dimension, with strata shuffled independently
+        strata = np.argsort(rng.random((n, d)), axis=0)
+        return (strata + rng.random((n, d))) / n
+
+    if(method == 'halton'):
+        u = np.empty((n, d))
+        index = np.arange(1, n+1)
+        for k, base in enumerate(_primes(d)):
+            u[:, k] = _radical_inverse(index, base)
+        if(seed is not None):
+            u = (u + rng.random(d)) % 1.0
+        return u
+
+    try:
+        from scipy.stats import qmc
+    except ImportError:
+        raise RuntimeError(ERRC+'sampling method \'sobol\' requires scipy; use \'lhs\' or '\
+                           '\'halton\' instead'+ENDC)
+    return qmc.Sobol(d, scramble=True, seed=seed).random(n)
+
+
+def scale_samples(u, limits=None, values=None, logspace=False, integer=False):
+    '''
+    Maps unit samples of one dimension onto parameter values
+
+    Parameters
+    ----------
+    u : (n,) float array
+        Unit samples in [0, 1)
+    limits : (2,) float array, optional
+        Lower and upper limits of a continuous dimension. Integer dimensions include both
+        limits.
+    values : (M,) array, optional
+        Allowed values of a discrete dimension (e.g. strings or parameter group values). Each
+        value covers an equal share of the unit interval. Used if limits is None.
+    logspace : bool, optional
+        Whether to sample a continuous dimension uniformly in log10 space. Defaults to False.
+    integer : bool, optional
+        Whether a continuous dimension takes only integer values. Defaults to False.
+
+    Returns
+    -------
+    samples : (n,) array
+    '''
+    if(limits is None):
+        values = np.asarray(values)
+        return values[np.minimum((u * len(values)).astype(int), len(values)-1)]
+
+    lo, hi = limits
+    if(integer):
+        return np.minimum(np.floor(lo + u * (hi - lo + 1)), hi).astype(int)
+    if(logspace):
+        return 10**(np.log10(lo) + u * (np.log10(hi) - np.log10(lo)))
+    return lo + u * (hi - lo)
+
+
+# ------------------------------------------------------------------------------
+
+
+def _primes(n):
+    '''
+    Returns the first n prime numbers
+    '''
+    primes = []
+    candidate = 2
+    while len(primes) < n:
+        if all(candidate % p for p in primes if p*p <= candidate):
+            primes.append(candidate)
+        candidate += 1
+    return primes
+
+
+def _radical_inverse(index, base):
+    '''
+    Van der Corput radical inverse of integer indices in the given base, vectorized
+    '''
+    index = np.array(index, dtype=np.int64)
+    result = np.zeros(len(index))
+    scale = 1.0 / base
+    while np.any(index > 0):
+        result += (index % base) * scale
+        index //= base
+        scale /= base
+    return result
@@ -0,0 +1,390 @@
+import math
+import warnings
+import numpy as np
+from lazy_lattice import lazy_lattice
+
+ERRC  = '\033[91m'
+WARNC = '\033[93m'
+ENDC  = '\033[0m'
+
+ACQUISITIONS = ['ei', 'lcb']
+
+# hyperparameter grids searched when fitting the surrogate; length scales are relative to
+# the unit hypercube of encoded parameters, and noise is relative to the metric variance
+LENGTH_SCALES = [0.05, 0.1, 0.2, 0.4, 0.8, 1.6]
+NOISE_LEVELS = [1e-6, 1e-3, 1e-2, 1e-1]
+
+
+# ==========================================================================================
+# ==========================================================================================
+
+
+class sequential_design:
+    def __init__(self, lattice, metric, minimize=True, seed=None):
+        '''
+        This class drives a sequential (adaptive) tuning campaign over a namelist_lattice.
+        Rather than cloning every lattice point, the lattice serves as a pool of candidate
+        configurations; after each batch of runs completes, a scalar metric is computed per
+        clone, a Gaussian process surrogate of the metric is fit over the parameter space,
+        and the next batch of points is chosen by an acquisition function. The chosen points
+        are selected in the lattice, so that they are cloned and submitted by the usual
+        create_clones(only_new=True) and submit_clone_runs(only_new=True) calls, e.g.
+
+            design = sequential_design(lattice, metric)
+            for i in range(nrounds):
+                design.observe()
+                design.next_batch(8)
+                lattice.create_clones(root_case, top_clone_dir, ..., only_new=True)
+                lattice.submit_clone_runs(only_new=True)
+                # ... wait for runs to complete ...
+
+        Metric values are stored in the clone records, and so are saved to the sweep manifest
+        and restored by namelist_lattice.load().
+
+        The candidate pool is the lattice's selection when the first design over it is made,
+        e.g. after filter(), or the whole (constrained) lattice if no points were filtered
+        out. It is kept in the lattice (and its manifest) as candidate_pool, since each batch
+        replaces the selection with the clones and proposed points.
+
+        Parameters
+        ----------
+        lattice : namelist_lattice
+            The lattice of candidate points. Dense candidate pools of continuous parameters
+            are cheaply built with namelist_lattice.sample(), since only chosen points are
+            ever cloned.
+        metric : callable
+            Called as metric(case, output) with the clone case directory and output directory
+            (or None) of each created clone, returning the scalar metric of its run, or None
+            if it is not available (e.g. the run has not finished). Non-finite values mark
+            failed runs, which are excluded from the fit.
+        minimize : boolean, optional
+            Whether the metric is minimized (True) or maximized (False). Defaults to True.
+        seed : int, optional
+            Random seed for candidate subsampling and the initial design. Defaults to None.
+        '''
+        if(lattice._lattice is None):
+            raise RuntimeError(ERRC+'Lattice must first be built by calling expand() or '\
+                               'sample()'+ENDC)
+        self.lattice = lattice
+        self.metric = metric
+        self.minimize = minimize
+        self.rng = np.random.default_rng(seed)
+        lat = lattice._lattice
+        if(lattice.candidate_pool is None and len(lat) < lat.size):
+            lattice.candidate_pool = lat.flat_indices().copy()
+
+
+    # ------------------------------------------------------------------------------
+
+
+    def observe(self):
+        '''
+        Evaluates the metric for each created clone without a recorded value, stores new
+        values in the clone records, and saves the sweep manifest
+
+        Returns
+        -------
+        metrics : dict
+            Recorded metric values by clone case
+        '''
+
+        new = 0
+        for case, record in self.lattice.clone_records.items():
+            if(record['state'] in ['pending', 'failed'] or record.get('metric') is not None):
+                continue
+            value = self.metric(case, record['output'])
+            if(value is not None):
+                record['metric'] = float(value)
+                new += 1
+        print('{} new metric values observed'.format(new))
+        self.lattice.save()
+        return self.metrics()
+
+
+    def metrics(self):
+        '''
+        Returns the recorded metric values by clone case
+        '''
+        return {case: record['metric'] for case, record in self.lattice.clone_records.items()
+                if record.get('metric') is not None}
+
+
+    def best(self):
+        '''
+        Returns the best observed clone
+
+        Returns
+        -------
+        case : string
+            Case directory of the best clone, or None if no finite metric has been observed
+        value : float
+            Its metric value
+        '''
+        metrics = {c: v for c, v in self.metrics().items() if np.isfinite(v)}
+        if(len(metrics) == 0):
+            return None, None
+        pick = min if self.minimize else max
+        case = pick(metrics, key=metrics.get)
+        return case, metrics[case]
+
+
+    # ------------------------------------------------------------------------------
+
+
+    def propose(self, n, acquisition='ei', n_candidates=4096, xi=0.01, kappa=2.0):
+        '''
+        Proposes the next batch of lattice points to run. Until at least two finite metric
+        values are observed, points are chosen to fill the space (each maximizing its distance
+        to all clones and previously chosen points). Otherwise, a Gaussian process is fit to
+        the observed metrics, and points are chosen one at a time by maximizing the
+        acquisition function, with each chosen point added to the surrogate at its predicted
+        value before choosing the next ("kriging believer"), so that a batch spreads out
+        rather than stacking at a single optimum.
+
+        Parameters
+        ----------
+        n : int
+            Number of points to propose
+        acquisition : string, optional
+            'ei' (expected improvement) or 'lcb' (lower confidence bound on the metric, or
+            upper bound if maximizing). Defaults to 'ei'.
+        n_candidates : int, optional
+            Maximum number of candidate points scored; larger pools are randomly subsampled.
+            Defaults to 4096.
+        xi : float, optional
+            Expected improvement margin, in units of the metric's standard deviation.
+            Defaults to 0.01.
+        kappa : float, optional
+            Number of standard deviations of the confidence bound. Defaults to 2.
+
+        Returns
+        -------
+        flat : (n,) int64 array
+            Flat indices of the proposed points in the unfiltered lattice (see lazy_lattice).
+            Fewer than n are returned if the candidate pool is exhausted.
+        '''
+
+        if(acquisition not in ACQUISITIONS):
+            raise RuntimeError(ERRC+'acquisition must be one of {}'.format(ACQUISITIONS)+ENDC)
+
+        lat = self.lattice._lattice
+        encoding = [_encoding(v) for v in lat.vectors]
+        taken, observed, y = self._clone_points()
+        candidates = self._candidates(lat, n_candidates, taken)
+        if(len(candidates) == 0):
+            raise RuntimeError(ERRC+'no unevaluated lattice points remain'+ENDC)
+
+        X = _encode(lat, encoding, candidates)
+        finite = np.isfinite(y)
+        Xo, y = _encode(lat, encoding, observed)[finite], y[finite]
+        if(not self.minimize):
+            y = -y
+
+        chosen = []
+        if(len(y) < 2):
+            # space-filling initial design
+            Xt = _encode(lat, encoding, taken)
+            dmin = np.full(len(X), np.inf) if len(Xt) == 0 else \
+                   np.min(_sqdist(X, Xt), axis=1)
+            for _ in range(min(n, len(X))):
+                if(np.all(np.isinf(dmin))):
+                    j = int(self.rng.integers(len(X)))
+                else:
+                    j = int(np.argmax(dmin))
+                chosen.append(j)
+                dmin = np.minimum(dmin, _sqdist(X, X[j:j+1])[:, 0])
+                dmin[chosen] = -np.inf
+        else:
+            gp = _gp(Xo, y)
+            for _ in range(min(n, len(X))):
+                mu, sd = gp.predict(X)
+                if(acquisition == 'ei'):
+                    imp = gp.y.min() - mu - xi * gp.scale
+                    z = imp / sd
+                    score = imp * _norm_cdf(z) + sd * np.exp(-0.5*z**2) / np.sqrt(2*np.pi)
+                else:
+                    score = -(mu - kappa * sd)
+                score[chosen] = -np.inf
+                j = int(np.argmax(score))
+                chosen.append(j)
+                gp = gp.condition(X[j], mu[j])
+
+        return candidates[chosen]
+
+
+    def next_batch(self, n, **kwargs):
+        '''
+        Proposes the next batch of points (see propose()), and selects them in the lattice
+        along with all existing clones, so that create_clones(only_new=True) clones exactly
+        the proposed points
+
+        Parameters
+        ----------
+        n : int
+            Number of points to propose
+        **kwargs
+            Further arguments to propose()
+
+        Returns
+        -------
+        points : (n,) record array
+            The proposed points
+        '''
+
+        lat = self.lattice._lattice
+        flat = self.propose(n, **kwargs)
+        taken, _, _ = self._clone_points()
+        selection = np.union1d(taken, flat)
+        lat.select(selection)
+        points = lat.take(np.searchsorted(selection, flat))
+
+        print('\n\n =============== proposed {} points ===============\n'.format(len(points)))
+        for point in points:
+            print(point)
+        self.lattice.save()
+        return points
+
+
+    # ------------------------------------------------------------------------------
+
+
+    def _clone_points(self):
+        '''
+        Maps clones to lattice points by coordinate identity
+
+        Returns
+        -------
+        taken : int64 array
+            Flat indices of all created clones in the lattice
+        observed : int64 array
+            Flat indices of clones with a recorded metric
+        y : float array
+            Their metric values
+        '''
+        flat, cases = self.lattice.clone_points()
+        records = [self.lattice.clone_records[case] for case in cases]
+        created = np.array([r['state'] not in ['pending', 'failed'] for r in records], dtype=bool)
+        metric = np.array([r.get('metric') is not None for r in records], dtype=bool) & created
+        y = np.array([r['metric'] for r, m in zip(records, metric) if m], dtype=float)
+        return np.unique(flat[created]), flat[metric], y
+
+
+    def _candidates(self, lat, n_candidates, taken):
+        '''
+        Draws up to n_candidates points without clones from the candidate pool, under the
+        lattice's current constraints
+        '''
+        pool = lazy_lattice(lat.vectors, lat.names, lat.blocks, aliases=lat.aliases)
+        if(self.lattice.candidate_pool is not None):
+            pool.select(self.lattice.candidate_pool)
+        for c in self.lattice.constraints:
+            pool.constrain(c)
+        if(len(pool) > n_candidates):
+            flat = np.sort(pool.flat_indices(self.rng.choice(len(pool), n_candidates, replace=False)))
+        else:
+            flat = pool.flat_indices()
+        return flat[~np.isin(flat, taken)]
+
+
+# ==========================================================================================
+# ==========================================================================================
+
+
+class _gp:
+    def __init__(self, X, y, length_scale=None, noise=None):
+        '''
+        Minimal Gaussian process regressor with a squared exponential kernel on standardized
+        targets. If length_scale and noise are not given, they are chosen from LENGTH_SCALES
+        and NOISE_LEVELS by maximum marginal likelihood.
+        '''
+        self.X, self.y = X, y
+        self.mean = y.mean()
+        self.scale = y.std() if y.std() > 0 else 1.0
+        t = (y - self.mean) / self.scale
+        d2 = _sqdist(X, X)
+
+        if(length_scale is None):
+            best = -np.inf
+            for ls in LENGTH_SCALES:
+                for nz in NOISE_LEVELS:
+                    fit = _gp_factor(d2, t, ls * np.sqrt(X.shape[1]), nz)
+                    if(fit is not None and np.isfinite(fit[2]) and fit[2] > best):
+                        best, length_scale, noise = fit[2], ls * np.sqrt(X.shape[1]), nz
+            if(length_scale is None):
+                # no fit succeeded; fall back to the first length scale, with the largest
+                # noise, under which the kernel matrix is best conditioned
+                warnings.warn(WARNC+'no surrogate hyperparameters fit the observed metrics; '\
+                              'using length scale {} and noise {}'.format(LENGTH_SCALES[0],
+                              NOISE_LEVELS[-1])+ENDC)
+                length_scale, noise = LENGTH_SCALES[0] * np.sqrt(X.shape[1]), NOISE_LEVELS[-1]
+        self.length_scale, self.noise = length_scale, noise
+        fit = _gp_factor(d2, t, length_scale, noise)
+        if(fit is None):
+            raise RuntimeError(ERRC+'the surrogate kernel matrix is not positive definite '\
+                               '(length scale {}, noise {})'.format(length_scale, noise)+ENDC)
+        self.L, self.alpha, _ = fit
+
+    def predict(self, Xs):
+        '''
+        Returns the posterior mean and standard deviation at points Xs
+        '''
+        Ks = np.exp(-0.5 * _sqdist(Xs, self.X) / self.length_scale**2)
+        mu = Ks @ self.alpha
+        v = np.linalg.solve(self.L, Ks.T)
+        var = np.maximum(1 + self.noise - np.sum(v**2, axis=0), 1e-12)
+        return mu * self.scale + self.mean, np.sqrt(var) * self.scale
+
+    def condition(self, x, value):
+        '''
+        Returns the process with an added observation, keeping the hyperparameters
+        '''
+        return _gp(np.vstack([self.X, x]), np.append(self.y, value), self.length_scale, self.noise)
+
+
+def _gp_factor(d2, t, length_scale, noise):
+    '''
+    Cholesky factor, weights, and log marginal likelihood of a GP fit, or None if the
+    kernel matrix is not positive definite
+    '''
+    K = np.exp(-0.5 * d2 / length_scale**2) + noise * np.eye(len(t))
+    try:
+        L = np.linalg.cholesky(K)
+    except np.linalg.LinAlgError:
+        return None
+    alpha = np.linalg.solve(L.T, np.linalg.solve(L, t))
+    return L, alpha, -0.5 * t @ alpha - np.sum(np.log(np.diag(L)))
+
+
+# ------------------------------------------------------------------------------
+
+
+def _encoding(vector):
+    '''
+    Tabulates the numeric features of each value of a dimension vector. Numeric dimensions
+    are scaled to [0, 1]; others (strings, parameter groups) are one-hot encoded.
+    '''
+    if(vector.dtype.kind in 'iuf'):
+        v = vector.astype(float)
+        span = v.max() - v.min()
+        return ((v - v.min()) / span if span > 0 else np.zeros(len(v)))[:, None]
+    _, inverse = np.unique(vector, return_inverse=True)
+    return np.eye(inverse.max() + 1)[inverse] / np.sqrt(2)
+
+
+def _encode(lat, encoding, flat):
+    '''
+    Builds the (k, p) feature matrix of lattice points at flat indices
+    '''
+    coords = lat.dim_indices(flat)
+    return np.hstack([encoding[m][coords[m]] for m in range(len(encoding))])
+
+
+def _sqdist(A, B):
+    '''
+    Squared Euclidean distances between the rows of A and B
+    '''
+    return np.maximum(np.sum(A**2, 1)[:, None] + np.sum(B**2, 1)[None, :] - 2 * A @ B.T, 0)
+
+
+def _norm_cdf(z):
+    return 0.5 * (1 + np.vectorize(math.erf)(z / np.sqrt(2)))
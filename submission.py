@@ -0,0 +1,309 @@
+import os
+import re
+import shlex
+import subprocess
+
+ERRC  = '\033[91m'
+ENDC  = '\033[0m'
+
+# job id reports of CIME's case.submit, and of sbatch/qsub-like commands
+JOBID_PATTERNS = [re.compile(r'Submitted job id is\s+(\S+)'),
+                  re.compile(r'Submitted job \S+ with id\s+(\S+)'),
+                  re.compile(r'Submitted batch job\s+(\S+)')]
+
+DEFAULT_QUEUE_CMD = 'squeue -h -u $USER'
+
+# Slurm directives of a case's .case.run which are replaced in array scripts
+_ARRAY_REPLACED = re.compile(r'^#SBATCH\s+(--job-name|-J|--output|-o|--error|-e|--array|-a)\b')
+
+
+# ==========================================================================================
+# ==========================================================================================
+
+
+def parse_job_ids(output):
+    '''
+    Extracts scheduler job ids from the output of a submission command
+
+    Parameters
+    ----------
+    output : string
+        stdout of case.submit, sbatch, etc.
+
+    Returns
+    -------
+    job_ids : string list
+        Unique job ids, in the order they were reported
+    '''
+    job_ids = []
+    for line in output.splitlines():
+        for pattern in JOBID_PATTERNS:
+            m = pattern.search(line)
+            if(m is not None):
+                if(m.group(1) not in job_ids):
+                    job_ids.append(m.group(1))
+                break
+    return job_ids
+
+
+def submit_async(clones, max_concurrent=4, max_queued=None, queue_cmd=DEFAULT_QUEUE_CMD,
+                 poll_interval=30, submit_args=None, retries=0, retry_delay=30):
+    '''
+    Submits runs of several cases concurrently with asyncio, running case.submit from each
+    case directory. At most max_concurrent submissions are in progress at once, and, if
+    max_queued is given, a submission is only started once the number of jobs in the
+    scheduler queue (as counted by queue_cmd) plus the submissions in progress is below
+    max_queued. Submissions start as slots free up. Failed submissions (e.g. rejected by a
+    throttled scheduler) are retried up to retries times, retry_delay seconds apart.
+
+    Parameters
+    ----------
+    clones : string list
+        Case directories to submit
+    max_concurrent : int, optional
+        Maximum number of case.submit calls running at once. Defaults to 4.
+    max_queued : int, optional
+        Maximum number of jobs allowed in the scheduler queue. Defaults to None, in which
+        case the queue is not checked.
+    queue_cmd : string, optional
+        Command whose stdout has one line per queued job. Environment variables are expanded.
+        Defaults to DEFAULT_QUEUE_CMD.
+    poll_interval : float, optional
+        Seconds to wait between queue checks while the queue is full. Defaults to 30.
+    submit_args : string list, optional
+        Additional arguments passed to case.submit. Defaults to None.
+    retries : int, optional
+        Number of times a failed submission is retried. Retries hold their concurrency slot,
+        and wait for room in the queue again if max_queued is given. Defaults to 0.
+    retry_delay : float, optional
+        Seconds to wait before each retry. Defaults to 30.
+
+    Returns
+    -------
+    results : list of dicts
+        Per-clone results, in the order of clones, with keys 'clone', 'returncode' (of the
+        last attempt; None if case.submit could not be run), 'output' (of all attempts), 
+        'job_ids' (reported by the last attempt), and 'attempts'
+    '''
+    # asyncio is imported on use, to keep it out of the import of namelist_lattice
+    import asyncio
+    return asyncio.run(_submit_all(list(clones), max_concurrent, max_queued, queue_cmd,
+                                   poll_interval, [] if submit_args is None else list(submit_args),
+                                   retries, retry_delay))
+
+
+# ------------------------------------------------------------------------------
+
+
+async def _queue_count(queue_cmd):
+    '''
+    Counts the non-empty lines of output of queue_cmd
+    '''
+    import asyncio
+    cmd = shlex.split(os.path.expandvars(queue_cmd))
+    proc = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE,
+                                                stderr=asyncio.subprocess.DEVNULL)
+    stdout, _ = await proc.communicate()
+    if(proc.returncode != 0):
+        raise RuntimeError(ERRC+'queue command \'{}\' failed with exit status {}'.format(
+                           queue_cmd, proc.returncode)+ENDC)
+    return len([l for l in stdout.decode().splitlines() if l.strip()])
+
+
+async def _submit_all(clones, max_concurrent, max_queued, queue_cmd, poll_interval, submit_args,
+                      retries, retry_delay):
+    import asyncio
+
+    slots = asyncio.Semaphore(max_concurrent)
+    queue_lock = asyncio.Lock()
+    in_progress = [0]
+
+    async def wait_for_queue():
+        async with queue_lock:
+            while True:
+                # submissions in progress are counted as of before the queue is listed, since
+                # those finishing meanwhile may be missing from the listing
+                pending = in_progress[0]
+                if(await _queue_count(queue_cmd) + pending < max_queued):
+                    in_progress[0] += 1
+                    return
+                await asyncio.sleep(poll_interval)
+
+    async def submit_once(clone):
+        if(max_queued is not None):
+            await wait_for_queue()
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                       '{}/case.submit'.format(clone), *submit_args, cwd=clone,
+                       stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
+            stdout, _ = await proc.communicate()
+            return proc.returncode, stdout.decode(errors='replace')
+        except OSError as e:
+            return None, str(e)
+        finally:
+            if(max_queued is not None):
+                in_progress[0] -= 1
+
+    async def submit(clone):
+        async with slots:
+            outputs = []
+            for attempt in range(retries + 1):
+                if(attempt > 0):
+                    await asyncio.sleep(retry_delay)
+                returncode, output = await submit_once(clone)
+                outputs.append(output)
+                if(returncode == 0):
+                    break
+            return {'clone': clone, 'returncode': returncode, 'output': ''.join(outputs),
+                    'job_ids': parse_job_ids(output), 'attempts': attempt + 1}
+
+    return await asyncio.gather(*[submit(clone) for clone in clones])
+
+
+# ------------------------------------------------------------------------------
+
+
+def case_directives(case, prefix='#SBATCH'):
+    '''
+    Reads the batch directives from a case's .case.run script, as written by case.setup,
+    omitting the job name, output, error, and array settings
+
+    Parameters
+    ----------
+    case : string
+        Case directory
+    prefix : string, optional
+        Directive prefix. Defaults to '#SBATCH'.
+
+    Returns
+    -------
+    directives : string list
+    '''
+    with open('{}/.case.run'.format(case)) as f:
+        return [l.rstrip('\n') for l in f if l.startswith(prefix) and not _ARRAY_REPLACED.match(l)]
+
+
+def write_array_script(clones, path, name, directives=(), max_parallel=None, 
+                       submit_args=('--no-batch',)):
+    '''
+    Writes a Slurm job array script with one array task per case, and its index file, 
+    listing the case directories one per line in array task order, next to the script as 
+    {script name}.index. Each task changes to the case directory on the line of the index
+    selected by its SLURM_ARRAY_TASK_ID and runs case.submit with submit_args, which by 
+    default runs the model within the array task's allocation. Resubmissions made by CIME
+    at the end of each run are submitted as ordinary individual jobs.
+
+    Parameters
+    ----------
+    clones : string list
+        Case directories, indexed by array task id
+    path : string
+        Location of the script to write
+    name : string
+        Job name of the array
+    directives : string list, optional
+        Batch directives (full lines, e.g. '#SBATCH --nodes=2') to include. Defaults to none.
+    max_parallel : int, optional
+        Maximum number of array tasks to run at once. Defaults to None, in which case there is 
+        no limit.
+    submit_args : string list, optional
+        Arguments to case.submit. Defaults to ('--no-batch',).
+
+    Returns
+    -------
+    index : string
+        Location of the index file
+    '''
+    for clone in clones:
+        if('\n' in clone):
+            raise RuntimeError(ERRC+'case directory {!r} cannot be listed in a job array '\
+                               'index'.format(clone)+ENDC)
+    index = '{}.index'.format(os.path.splitext(os.path.abspath(path))[0])
+    array = '0-{}'.format(len(clones)-1)
+    if(max_parallel is not None):
+        array += '%{}'.format(max_parallel)
+    log = '{}/{}.%A_%a.out'.format(os.path.dirname(os.path.abspath(path)), name)
+
+    lines = ['#!/bin/bash']
+    lines.extend(directives)
+    lines.extend(['#SBATCH --job-name={}'.format(name),
+                  '#SBATCH --array={}'.format(array),
+                  '#SBATCH --output={}'.format(log),
+                  '',
+                  '# generated by CESM_namelist_automator; one array task per case, by line',
+                  '# of the index file',
+                  'INDEX={}'.format(shlex.quote(index)),
+                  'CASE=$(sed -n "$((SLURM_ARRAY_TASK_ID + 1))p" "$INDEX")',
+                  'if [ -z "$CASE" ]; then',
+                  '  echo "array task $SLURM_ARRAY_TASK_ID has no case in $INDEX" >&2',
+                  '  exit 1',
+                  'fi',
+                  'echo "array task $SLURM_ARRAY_TASK_ID running $CASE"',
+                  'cd "$CASE" && ./case.submit {}'.format(' '.join(submit_args)),
+                  ''])
+    with open(index, 'w') as f:
+        f.write(''.join('{}\n'.format(c) for c in clones))
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines))
+    os.chmod(path, 0o755)
+    return index
+
+
+def submit_array(clones, script_dir, name, submit_cmd='sbatch', max_array_size=1000, 
+                 max_parallel=None, directives=None, dry=False):
+    '''
+    Submits cases as one or more Slurm job arrays, rather than one job per case. Cases are
+    split into arrays of at most max_array_size tasks, each with a generated script and 
+    index file (see write_array_script()).
+
+    Parameters
+    ----------
+    clones : string list
+        Case directories to submit
+    script_dir : string
+        Directory in which to write the array scripts, and their task logs
+    name : string
+        Job name prefix of the arrays
+    submit_cmd : string, optional
+        Command used to submit each script. Defaults to 'sbatch'.
+    max_array_size : int, optional
+        Maximum number of tasks per array; should not exceed the scheduler's MaxArraySize.
+        Defaults to 1000.
+    max_parallel : int, optional
+        Maximum number of tasks per array to run at once. Defaults to None.
+    directives : string list, optional
+        Batch directives for the array scripts. Defaults to None, in which case they are
+        read from the first case with case_directives().
+    dry : boolean, optional
+        If True, the scripts are written but not submitted. Defaults to False.
+
+    Returns
+    -------
+    arrays : list of dicts
+        Per-array results, with keys 'script', 'index', 'clones', 'output', and 'job_id' 
+        (None if dry, or if no id was reported)
+    '''
+    if(directives is None):
+        directives = case_directives(clones[0])
+    os.makedirs(script_dir, exist_ok=True)
+
+    arrays = []
+    for start in range(0, len(clones), max_array_size):
+        members = list(clones[start:start+max_array_size])
+        array_name = '{}.{}'.format(name, start // max_array_size)
+        script = '{}/{}.sh'.format(script_dir, array_name)
+        index = write_array_script(members, script, array_name, directives, max_parallel)
+        
+        output, job_id = '', None
+        if(not dry):
+            result = subprocess.run(shlex.split(submit_cmd) + [script], stdout=subprocess.PIPE, 
+                                    stderr=subprocess.STDOUT, text=True)
+            output = result.stdout
+            if(result.returncode != 0):
+                raise RuntimeError(ERRC+'submission of job array {} failed with exit status {}:'\
+                                   '\n{}'.format(script, result.returncode, output)+ENDC)
+            job_ids = parse_job_ids(output)
+            job_id = job_ids[0] if len(job_ids) > 0 else None
+        arrays.append({'script': script, 'index': index, 'clones': members, 'output': output, 
+                       'job_id': job_id})
+    return arrays
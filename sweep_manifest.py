@@ -0,0 +1,143 @@
+import os
+import json
+import tempfile
+import threading
+import numpy as np
+
+ERRC  = '\033[91m'
+ENDC  = '\033[0m'
+
+MANIFEST_VERSION = 1
+MANIFEST_NAME = 'lattice_manifest.json'
+
+
+# ==========================================================================================
+# ==========================================================================================
+
+
+def write_manifest(path, manifest):
+    '''
+    Atomically writes a sweep manifest as compact JSON
+
+    Parameters
+    ----------
+    path : string
+        Location of the manifest
+    manifest : dict
+        Manifest content; see namelist_lattice.save()
+    '''
+    manifest = dict(manifest, version=MANIFEST_VERSION)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                               prefix='.{}.'.format(os.path.basename(path)))
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f, separators=(',', ':'), default=_to_json)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def read_manifest(path):
+    '''
+    Reads a sweep manifest
+
+    Parameters
+    ----------
+    path : string
+        Location of the manifest
+
+    Returns
+    -------
+    manifest : dict
+    '''
+    with open(path) as f:
+        manifest = json.load(f)
+    if(manifest.get('version') != MANIFEST_VERSION):
+        raise RuntimeError(ERRC+'manifest {} has version {}, expected {}'.format(
+                           path, manifest.get('version'), MANIFEST_VERSION)+ENDC)
+    return manifest
+
+
+def vector_to_json(vector):
+    '''
+    Converts a parameter vector to a JSON-serializable dict, preserving its dtype
+    '''
+    vector = np.asarray(vector)
+    return {'dtype': vector.dtype.str, 'values': vector.tolist()}
+
+
+def vector_from_json(d):
+    '''
+    Inverse of vector_to_json()
+    '''
+    return np.array(d['values'], dtype=np.dtype(d['dtype']))
+
+
+# ------------------------------------------------------------------------------
+
+
+def _to_json(obj):
+    '''
+    Converts numpy scalars and arrays for JSON serialization
+    '''
+    if(isinstance(obj, (np.generic, np.ndarray))):
+        return obj.tolist()
+    raise TypeError('object of type {} is not JSON serializable'.format(type(obj).__name__))
+
+
+# ==========================================================================================
+# ==========================================================================================
+
+
+class sweep_journal:
+    def __init__(self, path):
+        '''
+        An append-only journal of per-clone progress through clone creation, with one JSON 
+        record per line. Each record names a case and a completed step; a 'start' record 
+        marks that work on a case began, and resets any steps recorded for it previously.
+        Records are flushed as they are written, so that the journal reflects all completed
+        steps if the process is killed.
+
+        Parameters
+        ----------
+        path : string
+            Location of the journal
+        '''
+        self.path = path
+        self._lock = threading.Lock()
+
+    def read(self):
+        '''
+        Reads the journal
+
+        Returns
+        -------
+        steps : dict
+            Set of recorded steps per case. Empty if the journal does not exist.
+        '''
+        steps = {}
+        if(not os.path.isfile(self.path)):
+            return steps
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # partially written final record
+                    continue
+                if(record['step'] == 'start'):
+                    steps[record['case']] = {'start'}
+                else:
+                    steps.setdefault(record['case'], set()).add(record['step'])
+        return steps
+
+    def record(self, case, step):
+        '''
+        Appends a record of a completed step for a case
+        '''
+        line = json.dumps({'case': case, 'step': step}, separators=(',', ':')) + '\n'
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(line)
+                f.flush()
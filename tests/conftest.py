@@ -0,0 +1,50 @@
+import re
+import sys
+import pathlib
+import pytest
+
+ROOT = pathlib.Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+from fake_case import SCRIPTS, make_root_case, fake_env
+
+
+# =============================================================================
+# =============================================================================
+
+
+@pytest.fixture
+def fake_cime(tmp_path, monkeypatch):
+    '''
+    Points the stand-in CIME scripts and scheduler (see benchmarks/fake_case.py) at a fresh
+    fake job queue, and returns the location of the stand-in scripts
+    '''
+    env = fake_env(str(tmp_path / 'queue'), latency=0.0, job_seconds=60.0)
+    for name in ['FAKE_CIME_QUEUE', 'FAKE_CIME_LATENCY', 'FAKE_CIME_JOB_SECONDS', 'PATH']:
+        monkeypatch.setenv(name, env[name])
+    return SCRIPTS
+
+
+@pytest.fixture
+def root_case(tmp_path, fake_cime):
+    '''
+    A fake root case at {tmp_path}/cases/root, with output under {tmp_path}/output
+    '''
+    (tmp_path / 'cases').mkdir()
+    case = str(tmp_path / 'cases' / 'root')
+    make_root_case(case, str(tmp_path / 'output'), component='cam', bulk_kb=8)
+    return case
+
+
+@pytest.fixture
+def env_entries():
+    '''
+    Returns a function reading the values of every entry of the env xml files of a case, 
+    by entry id
+    '''
+    def read(case):
+        entries = {}
+        for xml in sorted(pathlib.Path(case).glob('env_*.xml')):
+            entries.update(re.findall(r'<entry id="([^"]+)" value="([^"]*)"', xml.read_text()))
+        return entries
+    return read
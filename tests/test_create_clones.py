@@ -0,0 +1,261 @@
+import os
+import csv
+import json
+import re
+import warnings
+import numpy as np
+import pytest
+from namelist_lattice import namelist_lattice, _xmlchange_args
+
+
+# =============================================================================
+# =============================================================================
+
+
+def test_xmlchange_args_delimiter():
+    assert _xmlchange_args([('A', 1), ('B', 'x')]) == ['A=1,B=x']
+    assert _xmlchange_args([('A', 1), ('B', 'x,y')]) == ['A=1;B=x,y', '--delimiter', ';']
+    assert _xmlchange_args([('A', 'a;b'), ('B', 'x,y')]) == ['A=a;b|B=x,y', '--delimiter', '|']
+
+
+def test_xml_changes_batched(root_case, tmp_path, fake_cime, env_entries, monkeypatch):
+    '''
+    Every xml change of a clone, including RESUBMIT and values containing the default 
+    delimiter, is applied by one call to xmlchange
+    '''
+    nl = namelist_lattice(component='cam')
+    nl.expand('clubb_c1', values=[[1.0, 2.0]])
+    nl.expand('STOP_N', values=[[5, 10]], xmlchange=True)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        nl.expand('PROJECT', values=[['p1,a', 'p2,b']], xmlchange=True)
+
+    calls = []
+    call = nl._call
+    def spy(cmd, cwd=None, out=None):
+        calls.append(cmd)
+        return call(cmd, cwd, out)
+    monkeypatch.setattr(nl, '_call', spy)
+    nl.create_clones(root_case, top_clone_dir=str(tmp_path / 'clones'), cime_dir=fake_cime,
+                     resubmits=2, clone_prefix='c')
+
+    assert len(nl.clone_dirs) == 8
+    xmlchanges = [cmd for cmd in calls if cmd[0].endswith('/xmlchange')]
+    assert len(xmlchanges) == 8
+    for cmd in xmlchanges:
+        assert cmd[-2:] == ['--delimiter', ';']
+        assert [s.split('=')[0] for s in cmd[1].split(';')] == ['RESUBMIT', 'STOP_N', 'PROJECT']
+    for clone in nl.clone_dirs:
+        record = nl.clone_records[clone]
+        entries = env_entries(clone)
+        assert entries['RESUBMIT'] == '2'
+        assert entries['STOP_N'] == record['coords'][1]
+        assert entries['PROJECT'] == record['coords'][2]
+        with open('{}/user_nl_cam'.format(clone)) as f:
+            assert 'clubb_c1 = {}'.format(record['coords'][0]) in f.read()
+
+
+@pytest.mark.parametrize('layout', ['flat', 'index'])
+def test_copy_mode_matches_create_clone(root_case, tmp_path, fake_cime, env_entries, layout):
+    '''
+    Clones copied from a template case have the same env xml settings and batch job names 
+    as clones made by create_clone, with the case-specific fields rewritten
+    '''
+    clones = {}
+    for mode in ['create_clone', 'copy']:
+        nl = namelist_lattice(component='cam')
+        nl.expand('clubb_c1', values=[[1.0, 2.0, 3.0]])
+        nl.expand('STOP_N', values=[[5, 10]], xmlchange=True)
+        top, out = tmp_path / mode / 'clones', tmp_path / mode / 'output'
+        nl.create_clones(root_case, top_clone_dir=str(top), top_output_dir=str(out), 
+                         cime_dir=fake_cime, clone_prefix='c', clone_mode=mode, layout=layout)
+        assert len(nl.clone_dirs) == 6
+        clones[mode] = nl.clone_dirs
+
+        for clone in nl.clone_dirs:
+            name = os.path.basename(clone)
+            output_root = os.path.dirname(nl.clone_records[clone]['output'])
+            entries = env_entries(clone)
+            assert entries['CASE'] == name
+            assert entries['CASEROOT'] == clone
+            assert entries['CIME_OUTPUT_ROOT'] == output_root
+            assert entries['RUNDIR'] == '{}/{}/run'.format(output_root, name)
+            assert entries['DOUT_S_ROOT'] == '{}/archive/{}'.format(output_root, name)
+            assert entries == env_entries('{}/LockedFiles'.format(clone)) | entries
+            with open('{}/.case.run'.format(clone)) as f:
+                assert '#SBATCH --job-name=run.{}\n'.format(name) in f.read()
+            with open('{}/user_nl_cam'.format(clone)) as f:
+                assert 'clubb_c1 = {}'.format(nl.clone_records[clone]['coords'][0]) in f.read()
+
+    # clones of the same point agree in every entry but those naming their location
+    for created, copied in zip(clones['create_clone'], clones['copy']):
+        a, b = env_entries(created), env_entries(copied)
+        assert set(a) == set(b)
+        assert a == {k: v.replace('/copy/', '/create_clone/') for k, v in b.items()}
+
+
+def test_aggregate_after_refine(root_case, tmp_path, fake_cime, monkeypatch):
+    '''
+    Clones are aggregated with their points and parameter values in the refined lattice,
+    rather than the points recorded when they were created
+    '''
+    import history_aggregate
+    nl = namelist_lattice(component='cam')
+    nl.expand('clubb_c1', values=[[1.0, 3.0]])
+    nl.expand('STOP_N', values=[[5, 10]], xmlchange=True)
+    nl.create_clones(root_case, top_clone_dir=str(tmp_path / 'clones'), cime_dir=fake_cime,
+                     clone_prefix='c')
+    nl.refine('clubb_c1', [2.0])
+
+    calls = []
+    monkeypatch.setattr(history_aggregate, 'aggregate_history',
+                        lambda sources, *args: calls.append((sources,) + args))
+    nl.aggregate_clone_history(['T'], str(tmp_path / 'agg.npz'))
+    sources, points, coords = calls[0][0], calls[0][5], calls[0][6]
+
+    assert sources == nl.clone_dirs
+    records = [nl.clone_records[c] for c in nl.clone_dirs]
+    assert [r['point'] for r in records] != points.tolist()
+    codes = nl.lattice.dim_indices(points)
+    for i, record in enumerate(records):
+        assert [str(coords['clubb_c1'][i]), str(coords['STOP_N'][i])] == record['coords']
+        assert [nl.lattice.labels(m)[codes[m][i]] for m in range(2)] == record['coords']
+
+
+def test_sharded_clones_found_from_clone_map(root_case, tmp_path, fake_cime):
+    '''
+    Clones of a sharded sweep are found again from its clone map, whatever layout is passed
+    when the sweep is continued
+    '''
+    def lattice():
+        nl = namelist_lattice(component='cam')
+        nl.expand('clubb_c1', values=[[1.0, 2.0]])
+        nl.expand('STOP_N', values=[[5, 10]], xmlchange=True)
+        return nl
+    kwargs = {'top_clone_dir': str(tmp_path / 'clones'), 'top_output_dir': str(tmp_path / 'out'),
+              'cime_dir': fake_cime, 'clone_prefix': 'c'}
+    nl = lattice()
+    nl.create_clones(root_case, layout='hashed', **kwargs)
+    assert os.path.isfile(str(tmp_path / 'clones' / 'clone_map.json'))
+
+    reread = lattice()
+    reread.create_clones(root_case, read_existing_clones=True, **kwargs)
+    assert sorted(reread.clone_dirs) == sorted(nl.clone_dirs)
+    for clone in nl.clone_dirs:
+        assert reread.clone_records[clone]['output'] == nl.clone_records[clone]['output']
+        assert reread.clone_records[clone]['coords'] == nl.clone_records[clone]['coords']
+
+    # new points of a grown lattice are placed by the layout passed, and mapped
+    grown = namelist_lattice.load(nl.manifest)
+    grown.refine('clubb_c1', [3.0])
+    grown.create_clones(root_case, layout='index', only_new=True, **kwargs)
+    assert set(nl.clone_dirs) < set(grown.clone_dirs)
+    new = sorted(set(grown.clone_dirs) - set(nl.clone_dirs))
+    assert len(new) == 2 and all(os.path.isdir(c) for c in new)
+    assert all(re.fullmatch(r'c__\d+', os.path.basename(c)) for c in new)
+    again = lattice()
+    again.refine('clubb_c1', [3.0])
+    again.create_clones(root_case, read_existing_clones=True, **kwargs)
+    assert sorted(again.clone_dirs) == sorted(grown.clone_dirs)
+
+
+def test_resume_after_failures(root_case, tmp_path, fake_cime, env_entries, monkeypatch):
+    '''
+    A call to create_clones() which fails partway is resumed from its journal, redoing only
+    the steps not completed; a reopened sweep then clones only the points added by refine()
+    '''
+    def lattice():
+        nl = namelist_lattice(component='cam')
+        nl.expand('clubb_c1', values=[[1.0, 2.0, 3.0]])
+        nl.expand('STOP_N', values=[[5]], xmlchange=True)
+        return nl
+    def spy(nl, fail=()):
+        calls = []
+        call = nl._call
+        def spied(cmd, cwd=None, out=None):
+            calls.append(cmd)
+            if(any(f in ' '.join(cmd) for f in fail)):
+                raise RuntimeError('failed {}'.format(cmd[0]))
+            return call(cmd, cwd, out)
+        monkeypatch.setattr(nl, '_call', spied)
+        return calls
+    kwargs = {'top_clone_dir': str(tmp_path / 'clones'), 'cime_dir': fake_cime, 
+              'clone_prefix': 'c', 'resubmits': 1}
+    clone = lambda value: str(tmp_path / 'clones' / 'c__clubb_c1_{}__STOP_N_5'.format(value))
+
+    # the clone at 2.0 fails while cloning, and the clone at 3.0 at its xml changes
+    nl = lattice()
+    spy(nl, fail=['--case {}'.format(clone(2.0)), '{}/xmlchange'.format(clone(3.0))])
+    with pytest.raises(RuntimeError, match='2 of 3 clones failed'):
+        nl.create_clones(root_case, **kwargs)
+    assert sorted(nl.clone_failures) == [clone(2.0), clone(3.0)]
+    assert nl.clone_dirs == [clone(1.0)]
+    assert [nl.clone_records[clone(v)]['state'] for v in [1.0, 2.0, 3.0]] == \
+           ['created', 'failed', 'failed']
+
+    resumed = lattice()
+    calls = spy(resumed)
+    resumed.create_clones(root_case, resume=True, **kwargs)
+    assert sorted(resumed.clone_dirs) == [clone(v) for v in [1.0, 2.0, 3.0]]
+    assert [os.path.basename(cmd[0]) for cmd in calls] == ['create_clone', 'xmlchange', 
+                                                          'xmlchange']
+    assert calls[0][2] == clone(2.0) and calls[2][0] == '{}/xmlchange'.format(clone(3.0))
+    for value in [1.0, 2.0, 3.0]:
+        assert env_entries(clone(value))['RESUBMIT'] == '1'
+        with open('{}/user_nl_cam'.format(clone(value))) as f:
+            assert 'clubb_c1 = {}'.format(value) in f.read()
+
+    # a reopened, refined sweep creates only its new point
+    grown = namelist_lattice.load(resumed.manifest)
+    assert sorted(grown.clone_dirs) == sorted(resumed.clone_dirs)
+    grown.refine('clubb_c1', [4.0])
+    calls = spy(grown)
+    grown.create_clones(root_case, only_new=True, **kwargs)
+    assert [cmd[2] for cmd in calls if cmd[0].endswith('/create_clone')] == [clone(4.0)]
+    assert len(grown.clone_dirs) == 4 and not np.any(~grown.cloned_mask())
+
+
+def test_plan_clones(root_case, tmp_path):
+    '''
+    Plans are checked for colliding and over-long clone directories before any clone is
+    created, and exported with the settings of every clone
+    '''
+    nl = namelist_lattice(component='cam')
+    nl.expand('clubb_c1', values=[[1.0, 2.0]])
+    nl.expand('STOP_N', values=[[5, 10]], xmlchange=True)
+    top = str(tmp_path / 'clones')
+    with pytest.raises(RuntimeError, match='1 clone directories are shared') as e:
+        nl.plan_clones(root_case, top_clone_dir=top, clone_sfx=['same']*4)
+    assert '{}/root__same'.format(top) in str(e.value)
+    with pytest.raises(RuntimeError, match='4 clone directory names exceed 255'):
+        nl.plan_clones(root_case, top_clone_dir=top, clone_prefix='c'*250)
+    with pytest.raises(RuntimeError, match='4 clone paths exceed 256'):
+        nl.plan_clones(root_case, top_clone_dir='/'.join([top] + ['d'*50]*5), layout='index')
+    with pytest.raises(RuntimeError, match='4 run directory paths exceed 256'):
+        nl.plan_clones(root_case, top_clone_dir=top, top_output_dir='/'.join([top] + ['d'*50]*5), 
+                       layout='index')
+    # a clone of one point may not be replaced by a clone of another
+    case = '{}/c__clubb_c1_1.0__STOP_N_5'.format(top)
+    nl.clone_records[case] = {'output': None, 'point': 0, 'coords': ['2.0', '5'], 
+                              'state': 'created'}
+    with pytest.raises(RuntimeError, match='1 clone directories belong to existing clones'):
+        nl.plan_clones(root_case, top_clone_dir=top, clone_prefix='c')
+    nl.plan_clones(root_case, top_clone_dir=top, clone_prefix='c', check_existing=False)
+    nl.clone_records = {}
+
+    for fmt in ['json', 'csv']:
+        path = str(tmp_path / 'plan.{}'.format(fmt))
+        plan = nl.plan_clones(root_case, top_clone_dir=top, top_output_dir=str(tmp_path / 'out'),
+                              clone_prefix='c', export=path)
+        with open(path) as f:
+            rows = json.load(f) if fmt == 'json' else list(csv.DictReader(f))
+        assert len(rows) == len(plan) == 4
+        for i, row in enumerate(rows):
+            entry = plan.entry(i)
+            assert (row['case'], row['output']) == (entry['case'], entry['output'])
+            assert int(row['point']) == entry['point']
+            coords = row['coords'] if fmt == 'json' else row
+            assert (coords['clubb_c1'], coords['STOP_N']) == entry['coords']
+            assert row['namelist'] == 'clubb_c1 = {}\n'.format(entry['coords'][0])
+            assert row['xmlchange'] == 'STOP_N={}'.format(entry['coords'][1])
+    assert not os.path.exists(top)
@@ -0,0 +1,26 @@
+import os
+from namelist_lattice import namelist_lattice
+
+
+# =============================================================================
+# =============================================================================
+
+
+def test_dedup_keeps_generated_namelists_private(root_case, tmp_path, fake_cime):
+    '''
+    Namelists generated under Buildconf and CaseDocs, which case.submit rewrites in place,
+    stay private, writable copies in deduplicated clones
+    '''
+    nl = namelist_lattice(component='cam')
+    nl.expand('clubb_c1', values=[[1.0, 2.0, 3.0]])
+    nl.create_clones(root_case, top_clone_dir=str(tmp_path / 'clones'), cime_dir=fake_cime,
+                     clone_prefix='c')
+    report = nl.dedup_clones(min_size=1)
+
+    assert report['files'] > 0
+    for clone in nl.clone_dirs:
+        assert os.stat('{}/SourceMods/src.cam/README'.format(clone)).st_nlink > 1
+        for path in ['Buildconf/camconf/atm_in', 'CaseDocs/atm_in']:
+            path = '{}/{}'.format(clone, path)
+            assert os.stat(path).st_nlink == 1
+            assert os.access(path, os.W_OK)
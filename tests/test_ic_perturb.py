@@ -0,0 +1,118 @@
+import struct
+import warnings
+import numpy as np
+import pytest
+
+from ic_perturb import perturb_ic
+from ncheader import read_header
+
+
+def write_classic(path, dims, variables, numrecs=0, streaming=False):
+    '''
+    Writes a 64-bit offset (CDF-2) NetCDF file of float variables, without attributes.
+    dims maps dimension names to lengths (None for the record dimension), and variables maps
+    names to (dimension names, array); record variables have numrecs records.
+    '''
+    def name(s):
+        b = s.encode()
+        return struct.pack('>i', len(b)) + b + b'\0' * (-len(b) % 4)
+
+    dnames = list(dims)
+    arrays = {v: np.asarray(a, dtype=np.asarray(a).dtype.newbyteorder('>'))
+              for v, (_, a) in variables.items()}
+    record = {v: len(d) > 0 and dims[d[0]] is None for v, (d, _) in variables.items()}
+    nbytes = {v: a[0:1].nbytes if record[v] else a.nbytes for v, a in arrays.items()}
+    vsize = {v: n + (-n % 4) for v, n in nbytes.items()}
+
+    def header(begins):
+        h = b'CDF\x02' + struct.pack('>I', 2**32 - 1 if streaming else numrecs)
+        h += struct.pack('>ii', 0x0A, len(dims))
+        h += b''.join(name(d) + struct.pack('>i', n or 0) for d, n in dims.items())
+        h += struct.pack('>iiii', 0, 0, 0x0B, len(variables))
+        for v, (vdims, _) in variables.items():
+            h += name(v) + struct.pack('>i', len(vdims))
+            h += b''.join(struct.pack('>i', dnames.index(d)) for d in vdims)
+            h += struct.pack('>iiii', 0, 0, {'f': 5, 'd': 6}[arrays[v].dtype.char], vsize[v])
+            h += struct.pack('>Q', begins[v])
+        return h
+
+    begins, offset = {}, len(header({v: 0 for v in variables}))
+    for v in [v for v in variables if not record[v]]:
+        begins[v], offset = offset, offset + vsize[v]
+    for v in [v for v in variables if record[v]]:
+        begins[v], offset = offset, offset + vsize[v]
+    with open(path, 'wb') as f:
+        f.write(header(begins))
+        for v in [v for v in variables if not record[v]]:
+            f.write(arrays[v].tobytes().ljust(vsize[v], b'\0'))
+        for rec in range(numrecs):
+            for v in [v for v in variables if record[v]]:
+                f.write(arrays[v][rec].tobytes().ljust(vsize[v], b'\0'))
+
+
+def read_variable(path, name):
+    var = read_header(path)['variables'][name]
+    with open(path, 'rb') as f:
+        f.seek(var['begin'])
+        return np.frombuffer(f.read(int(np.prod(var['shape'])) * var['dtype'].itemsize),
+                             dtype=var['dtype']).reshape(var['shape'])
+
+
+# -----------------------------------------------------------------------------
+
+
+def test_perturb_float32_amplitude(tmp_path):
+    base, out = str(tmp_path / 'base.nc'), str(tmp_path / 'out.nc')
+    T = np.linspace(200, 300, 60, dtype=np.float32).reshape(6, 10)
+    write_classic(base, {'lat': 6, 'lon': 10}, {'T': (['lat', 'lon'], T)})
+
+    # the default amplitude cannot be represented in single precision
+    with pytest.raises(RuntimeError, match='below the resolution of variable T'):
+        perturb_ic(base, out, seed=1)
+    assert not list(tmp_path.glob('out.nc*'))
+    # nor can absolute perturbations far below the spacing of the values
+    with pytest.raises(RuntimeError, match='left every value of T unchanged'):
+        perturb_ic(base, out, seed=1, amplitude=1e-10, relative=False)
+
+    changed = perturb_ic(base, out, seed=1, amplitude=1e-5)
+    assert 0 < changed['T'] <= T.size
+    perturbed = read_variable(out, 'T')
+    assert not np.array_equal(perturbed, T)
+    assert np.allclose(perturbed, T, rtol=1e-5, atol=0)
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_perturb_record_variables(tmp_path, streaming):
+    base, out = str(tmp_path / 'base.nc'), str(tmp_path / 'out.nc')
+    T = np.linspace(200, 300, 3*4*5).reshape(3, 4, 5)
+    PS = np.full((4, 5), 1e5)
+    variables = {'T': (['time', 'lat', 'lon'], T), 'PS': (['lat', 'lon'], PS)}
+    write_classic(base, {'time': None, 'lat': 4, 'lon': 5}, variables, numrecs=3,
+                  streaming=streaming)
+
+    changed = perturb_ic(base, out, seed=2, variables=('T', 'PS'), amplitude=1e-12)
+    assert changed == {'T': T.size, 'PS': PS.size}
+    header = read_header(out)
+    recsize = header['recsize']
+    var = header['variables']['T']
+    with open(out, 'rb') as f:
+        data = f.read()
+    for rec in range(3):
+        x = np.frombuffer(data, dtype=var['dtype'], count=20,
+                          offset=var['begin'] + rec*recsize).reshape(4, 5)
+        assert not np.array_equal(x, T[rec])
+        assert np.allclose(x, T[rec], rtol=1e-12, atol=0)
+
+
+def test_perturb_reports_skipped(tmp_path):
+    base, out = str(tmp_path / 'base.nc'), str(tmp_path / 'out.nc')
+    T = np.ones((0, 4))
+    PS = np.full(4, 1e5)
+    write_classic(base, {'time': None, 'ncol': 4},
+                  {'T': (['time', 'ncol'], T), 'PS': (['ncol'], PS)}, numrecs=0)
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        changed = perturb_ic(base, out, seed=3, variables=('T', 'PS'))
+    assert changed == {'T': None, 'PS': PS.size}
+    assert any('variables T of' in str(w.message) for w in caught)
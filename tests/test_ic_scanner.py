@@ -0,0 +1,22 @@
+from ic_scanner import scan_ics
+
+
+# =============================================================================
+# =============================================================================
+
+
+def test_scan_skips_hidden_files(tmp_path):
+    '''
+    Hidden files (e.g. NFS placeholders and editor swap files) are not initial conditions,
+    unless the glob pattern asks for them
+    '''
+    names = ['ic.0001.nc', 'ic.0002.nc', '.nfs0000000012345678', '.ic.0001.nc.swp', '.ic.0003.nc']
+    for name in names:
+        (tmp_path / name).write_bytes(b'CDF\x01')
+    (tmp_path / 'sub.nc').mkdir()
+
+    path = lambda *names: [str(tmp_path / name) for name in names]
+    assert scan_ics(str(tmp_path)) == path('ic.0001.nc', 'ic.0002.nc')
+    assert scan_ics(str(tmp_path), globstr='*.nc') == path('ic.0001.nc', 'ic.0002.nc')
+    assert scan_ics(str(tmp_path), regex=r'ic\.\d+') == path('ic.0001.nc', 'ic.0002.nc')
+    assert scan_ics(str(tmp_path), globstr='.*.nc') == path('.ic.0003.nc')
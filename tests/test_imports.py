@@ -0,0 +1,33 @@
+import sys
+import pathlib
+import subprocess
+
+ROOT = pathlib.Path(__file__).parent.parent.absolute()
+# modules needed only by some methods, which importing the package modules must not load
+LAZY = ['asyncio', 'multiprocessing', 'xml', 'matplotlib', 'case_copy', 'dedup', 'clone_plan',
+        'user_nl', 'samplers', 'case_scanner', 'sweep_manifest', 'submission', 'run_monitor',
+        'history_aggregate', 'lattice_plotting', 'ic_scanner', 'ic_perturb', 'ncheader']
+
+
+# =============================================================================
+# =============================================================================
+
+
+def imported(module):
+    '''
+    Top-level names of the modules loaded by importing module in a fresh interpreter
+    '''
+    code = 'import sys; sys.path.insert(0, {!r}); import {}; '\
+           'print(" ".join(sorted(sys.modules)))'.format(str(ROOT), module)
+    modules = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, check=True,
+                             text=True).stdout.split()
+    return {m.split('.')[0] for m in modules}
+
+
+def test_lazy_imports():
+    '''
+    Importing namelist_lattice or ensembler does not import the modules only needed by some 
+    methods
+    '''
+    for module in ['namelist_lattice', 'ensembler']:
+        assert sorted(imported(module) & set(LAZY)) == []
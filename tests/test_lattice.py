@@ -0,0 +1,163 @@
+import importlib.util
+import warnings
+import numpy as np
+import pytest
+from namelist_lattice import namelist_lattice
+
+
+# =============================================================================
+# =============================================================================
+
+
+def test_refine():
+    nl = namelist_lattice()
+    nl.expand(['a', 'b'], values=[[1, 2], [10, 20]])
+    nl.refine('a', [2, 3, 3, 4])
+    assert nl.param_vectors[0].tolist() == [1, 2, 3, 4]
+    assert len(nl.lattice) == 8
+
+
+def test_refine_failure_leaves_lattice_unchanged():
+    '''
+    A refinement whose lattice cannot be rebuilt leaves the vectors and lattice as they were
+    '''
+    nl = namelist_lattice(nofill=True)
+    nl.expand(['a', 'b'], values=[[1, 2], [10, 20]])
+    lattice = nl.lattice
+    with pytest.raises(RuntimeError, match='same number of values'):
+        nl.refine('a', [3])
+    assert nl.param_vectors[0].tolist() == [1, 2]
+    assert nl.lattice is lattice and len(nl.lattice) == 2
+
+    def predicate(p):
+        if(np.any(p['a'] > 2)):
+            raise ValueError('a out of range')
+        return p['a'] < p['b']
+    nl = namelist_lattice()
+    nl.expand(['a', 'b'], values=[[1, 2], [10, 20]])
+    nl.constrain(predicate, names=['a', 'b'])
+    lattice = nl.lattice
+    with pytest.raises(ValueError, match='a out of range'):
+        nl.refine('a', [3])
+    assert nl.param_vectors[0].tolist() == [1, 2]
+    assert nl.lattice is lattice and len(nl.lattice) == 4
+
+
+@pytest.mark.parametrize('method', ['lhs', 'sobol', 'halton'])
+def test_sample(method):
+    '''
+    Sampled dimensions are zipped into nsamples points within their limits, which are 
+    crossed with expanded dimensions, and are reproducible given a seed
+    '''
+    def lattice(seed):
+        nl = namelist_lattice()
+        nl.expand('a', values=[[1, 2]])
+        nl.sample(['x', 'y', 'n', 's'], 8, limits=[[-1, 1], [1e-3, 1e3], [1, 4], None], 
+                  values=[None, None, None, ["'u'", "'v'"]], logspace=[False, True, False, False], 
+                  integer=[False, False, True, False], method=method, seed=seed)
+        return nl
+    if(method == 'sobol' and importlib.util.find_spec('scipy') is None):
+        with pytest.raises(RuntimeError, match='requires scipy'):
+            lattice(0)
+        return
+    nl = lattice(0)
+    x, y, n, s = nl.param_vectors[1:]
+    assert nl.sample_blocks == [[1, 2, 3, 4]] and len(nl.lattice) == 2*8
+    assert np.all((x >= -1) & (x < 1)) and np.all((y >= 1e-3) & (y < 1e3))
+    assert n.dtype.kind == 'i' and np.all((n >= 1) & (n <= 4))
+    assert set(s) <= {"'u'", "'v'"}
+    # the sampled dimensions are not crossed with each other
+    pairs = list(zip(nl.lattice.column('x'), nl.lattice.column('y')))
+    assert sorted(pairs) == sorted(list(zip(x, y))*2)
+    assert all(np.array_equal(v, w) for v, w in zip(nl.param_vectors, lattice(0).param_vectors))
+    assert not np.array_equal(x, lattice(1).param_vectors[1])
+    if(method == 'lhs'):
+        # one sample in each of nsamples strata of every continuous dimension
+        assert sorted(np.floor((x + 1) / 2 * 8).astype(int)) == list(range(8))
+        assert sorted(np.floor((np.log10(y) + 3) / 6 * 8).astype(int)) == list(range(8))
+
+
+def test_sample_rejects_repeated_names():
+    '''
+    Names and group labels of sampled dimensions may not repeat, or reuse those of existing 
+    dimensions, parameter groups, or group members
+    '''
+    nl = namelist_lattice()
+    nl.expand('a', values=[[1, 2]])
+    nl.sample('p1,p2', 3, values=[['1,2', '3,4']], group=True, group_labels='g', seed=0)
+    invalid = [(['b', 'b'], {'limits': [[0, 1], [0, 1]]}),
+               ('a', {'limits': [0, 1]}),
+               ('g', {'limits': [0, 1]}),
+               ('p2', {'limits': [0, 1]}),
+               (['q1,q2', 'q3,q4'], {'values': [['1,2'], ['3,4']], 'group': True, 
+                                     'group_labels': ['h', 'h']}),
+               ('q1,q2', {'values': [['1,2']], 'group': True, 'group_labels': 'a'}),
+               ('q1,q2', {'values': [['1,2']], 'group': True, 'group_labels': 'g'}),
+               ('q1,p1', {'values': [['1,2']], 'group': True, 'group_labels': 'h'}),
+               ('q1,q1', {'values': [['1,2']], 'group': True, 'group_labels': 'h'})]
+    for names, kwargs in invalid:
+        with pytest.raises(ValueError):
+            nl.sample(names, 3, seed=0, **kwargs)
+    assert nl.param_names == ['a', 'p1,p2'] and nl.paramgroup_labels == ['g']
+    assert len(nl.lattice) == 6
+
+
+def test_clone_names(root_case, tmp_path):
+    '''
+    Clone names format each value as its numpy scalar does, so that they match the names of
+    clones made by earlier versions: float32 values by their shortest repr, and integers
+    (including those of 1e5 or more) in full
+    '''
+    nl = namelist_lattice(component='cam')
+    nl.expand('a', values=[[100000, 2]])
+    nl.expand('b', values=[np.array([0.1], dtype=np.float32)])
+    nl.expand('c', values=[[0.1, 1e-7]])
+    plan = nl.plan_clones(root_case, top_clone_dir=str(tmp_path / 'clones'), clone_prefix='c')
+    names = [plan.entry(i)['case'].split('/')[-1] for i in range(len(nl.lattice))]
+    assert sorted(names) == ['c__a_100000__b_0.1__c_0.1', 'c__a_100000__b_0.1__c_1e-07',
+                             'c__a_2__b_0.1__c_0.1', 'c__a_2__b_0.1__c_1e-07']
+    assert plan.entry(0)['coords'] == ('100000', '0.1', '0.1')
+
+
+def test_manifest_round_trip(tmp_path):
+    '''
+    A sweep reopened from its manifest has the same lattice, constraints, sampled blocks,
+    selection, and clone records as the sweep which saved it
+    '''
+    nl = namelist_lattice(component='cam')
+    nl.expand('a', values=[[1, 2, 3]])
+    nl.expand('STOP_N', values=[np.array([5, 10], dtype=np.int32)], xmlchange=True)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        nl.expand('p1,p2', values=['1,2', '3,4'], group=True, group_labels='g')
+    nl.sample(['x', 'y'], 4, limits=[[0, 1], [1, 100]], logspace=[False, True], seed=0)
+    nl.constrain('a < 3')
+    nl.filter(nl.lattice.column('STOP_N') == 5)
+    points = nl.lattice.flat_indices()
+    codes = nl.lattice.dim_indices(points)
+    coords = lambda i: [nl.lattice.labels(m)[codes[m][i]] for m in range(len(codes))]
+    nl.clone_records = {'c0': {'output': 'o0', 'point': int(points[0]), 'state': 'submitted',
+                               'coords': coords(0)},
+                        'c1': {'output': 'o1', 'point': int(points[1]), 'state': 'pending',
+                               'coords': coords(1), 'metric': 0.5}}
+    nl.job_ids = {'c0': ['101']}
+    path = str(tmp_path / 'manifest.json')
+    nl.save(path)
+
+    loaded = namelist_lattice.load(path)
+    assert loaded.manifest == path and loaded.component == 'cam'
+    assert loaded.param_names == nl.param_names
+    for v, w in zip(loaded.param_vectors, nl.param_vectors):
+        assert v.dtype == w.dtype and np.array_equal(v, w)
+    assert (loaded.xml_mask, loaded.paramgroup_mask, loaded.paramgroup_labels) == \
+           (nl.xml_mask, nl.paramgroup_mask, nl.paramgroup_labels)
+    assert [c.predicate for c in loaded.constraints] == ['a < 3']
+    assert loaded.sample_blocks == nl.sample_blocks == [[3, 4]]
+    assert np.array_equal(loaded.lattice.flat_indices(), points)
+    assert len(loaded.lattice) == len(nl.lattice) == 2*1*2*4
+    assert loaded.clone_records == nl.clone_records
+    assert loaded.job_ids == nl.job_ids and loaded.clone_dirs == ['c0']
+
+    # the constraints are re-applied when the reopened lattice is rebuilt
+    loaded.refine('a', [0])
+    assert len(loaded.lattice) == 3*2*2*4
@@ -0,0 +1,153 @@
+import os
+import re
+import pytest
+from fake_case import make_root_case
+from namelist_lattice import namelist_lattice
+from run_monitor import run_monitor, _model_days
+
+
+# =============================================================================
+# =============================================================================
+
+
+@pytest.fixture
+def cases(tmp_path):
+    '''
+    Two fake cases, c0 and c1, with output under {tmp_path}/output
+    '''
+    (tmp_path / 'cases').mkdir()
+    cases = [str(tmp_path / 'cases' / 'c{}'.format(i)) for i in range(2)]
+    for case in cases:
+        make_root_case(case, str(tmp_path / 'output'), component='cam', bulk_kb=1)
+    return cases
+
+
+@pytest.fixture
+def jobs(tmp_path):
+    '''
+    Returns a function setting the jobs listed by the queue command, and the command
+    '''
+    path = tmp_path / 'jobs'
+    path.write_text('')
+    def set_jobs(*lines):
+        path.write_text(''.join(line + '\n' for line in lines))
+    set_jobs.cmd = 'cat {}'.format(path)
+    return set_jobs
+
+
+def append(path, text):
+    with open(path, 'a') as f:
+        f.write(text)
+
+
+def rundir(case):
+    return '{}/output/{}/run'.format(os.path.dirname(os.path.dirname(case)),
+                                     os.path.basename(case))
+
+
+def set_resubmit(case, n):
+    path = '{}/env_run.xml'.format(case)
+    with open(path) as f:
+        text = f.read()
+    with open(path, 'w') as f:
+        f.write(re.sub(r'id="RESUBMIT" value="\d+"', 'id="RESUBMIT" value="{}"'.format(n), text))
+
+
+# -----------------------------------------------------------------------------
+
+
+def test_model_days():
+    assert _model_days('00010111 43200', '0001-01-01') == 10.5
+    assert _model_days('00020101 0', '0001-01-01') == 365.0
+    assert _model_days('00010301 0', '0001-02-01') == 28.0
+    assert _model_days(None, '0001-01-01') is None
+    assert _model_days('00011301 0', '0001-01-01') is None
+
+
+def test_state_transitions(cases, jobs):
+    c0, c1 = cases
+    monitor = run_monitor(cases, job_ids={c0: ['101']}, queue_cmd=jobs.cmd)
+    states = lambda: {case: s['state'] for case, s in monitor.poll().items()}
+    assert states() == {c0: 'pending', c1: 'pending'}
+
+    # c0 is matched by job id, c1 by job name
+    jobs('101 run.c0 PENDING', '102 run.c1 PD')
+    assert states() == {c0: 'queued', c1: 'queued'}
+
+    jobs('101 run.c0 RUNNING', '102 run.c1 RUNNING')
+    for case in cases:
+        append('{}/CaseStatus'.format(case), '2024-01-01 00:00:00: case.run starting 10\n')
+    status = monitor.poll()
+    assert [status[case]['state'] for case in cases] == ['running', 'running']
+    assert status[c0]['event'] == 'case.run starting'
+    assert status[c0]['job_state'] == 'RUNNING'
+
+    # c0 succeeds with no resubmissions left; c1 fails
+    jobs()
+    append('{}/CaseStatus'.format(c0), '2024-01-01 01:00:00: case.run success \n')
+    append('{}/CaseStatus'.format(c1), '2024-01-01 01:00:00: case.run error \n')
+    assert states() == {c0: 'complete', c1: 'failed'}
+    assert monitor.summary()['complete'] == 1
+    assert 'failed: {} (case.run error)'.format(c1) in monitor.report()
+
+    # a run whose job left the queue without reporting success has died, if the job is known
+    append('{}/CaseStatus'.format(c0), '2024-01-02 00:00:00: case.run starting 11\n')
+    assert states()[c0] == 'failed'
+    # a successful segment with resubmissions left waits for its next job
+    append('{}/CaseStatus'.format(c0), '2024-01-02 01:00:00: case.run success \n')
+    set_resubmit(c0, 1)
+    assert states()[c0] == 'pending'
+
+
+def test_incremental_reads(cases):
+    c0, _ = cases
+    monitor = run_monitor([c0], queue_cmd=None)
+    status = '{}/CaseStatus'.format(c0)
+    log = '{}/cpl.log.1234'.format(rundir(c0))
+    partial = 'tStamp_write: model date =   00010104   43200'
+    append(status, '2024-01-01 00:00:00: case.run starting 10\n')
+    append(log, 'tStamp_write: model date =   00010103       0 wall clock = 1\n' + partial)
+
+    # the partial last line is left unread, until it is completed
+    s = monitor.poll()[c0]
+    assert (s['state'], s['model_date'], s['model_days']) == ('running', '00010103 0', 2.0)
+    assert monitor._offsets[log] == os.path.getsize(log) - len(partial)
+    append(log, ' wall clock = 2\n')
+    s = monitor.poll()[c0]
+    assert (s['model_date'], s['model_days']) == ('00010104 43200', 3.5)
+    assert monitor._offsets[log] == os.path.getsize(log)
+
+    # unchanged files are not read again; the last values are kept
+    assert monitor.poll()[c0]['model_date'] == '00010104 43200'
+    assert monitor._read_new(log) == ''
+
+    # a file which shrank (was replaced) is read from its start
+    with open(status, 'w') as f:
+        f.write('2024-01-03 00:00:00: case.run error \n')
+    assert monitor.poll()[c0]['state'] == 'failed'
+
+    # a new run segment reads the newest log
+    append(status, '2024-01-04 00:00:00: case.run starting 12\n')
+    append('{}/cpl.log.5678'.format(rundir(c0)),
+           'tStamp_write: model date =   00010111       0 wall clock = 3\n')
+    assert monitor.poll()[c0]['model_days'] == 10.0
+
+
+def test_monitor_clone_runs(cases, jobs, capsys):
+    c0, c1 = cases
+    nl = namelist_lattice(component='cam')
+    nl.clone_dirs = list(cases)
+    append('{}/CaseStatus'.format(c0), '2024-01-01 00:00:00: case.run starting 10\n')
+
+    # without the scheduler, states are read from the case files only
+    status = nl.monitor_clone_runs(queue_cmd=False)
+    assert nl._monitor.queue_cmd is None
+    assert [status[case]['state'] for case in cases] == ['running', 'pending']
+    assert '2 runs' in capsys.readouterr().out
+
+    # the monitor, and its read offsets, are kept across calls
+    monitor = nl._monitor
+    jobs('7 run.c1 PENDING')
+    status = nl.monitor_clone_runs(queue_cmd=jobs.cmd)
+    assert nl._monitor is monitor
+    assert [status[case]['state'] for case in cases] == ['running', 'queued']
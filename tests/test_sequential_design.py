@@ -0,0 +1,75 @@
+import warnings
+import numpy as np
+import pytest
+import sequential_design as sd
+from namelist_lattice import namelist_lattice
+
+
+# =============================================================================
+# =============================================================================
+
+
+def observed(nl, values):
+    '''
+    Records created clones with metrics at the lattice points of values of the first
+    parameter (the only one in 1-D lattices)
+    '''
+    labels = nl._lattice.labels(0)
+    for i, (label, metric) in enumerate(values.items()):
+        nl.clone_records['c{}'.format(i)] = {'output': None, 'point': labels.index(label),
+                                            'coords': [label], 'state': 'created',
+                                            'metric': metric}
+
+
+def test_propose_1d():
+    nl = namelist_lattice()
+    nl.expand('a', values=[np.round(np.linspace(0, 1, 11), 6)])
+    design = sd.sequential_design(nl, lambda case, output: None, seed=0)
+
+    # space-filling, then surrogate-guided
+    first = design.propose(3)
+    assert len(np.unique(first)) == 3
+    observed(nl, {'0.0': 1.0, '0.5': 0.1, '1.0': 1.0})
+    proposed = design.propose(2)
+    assert len(proposed) == 2
+    assert not np.any(np.isin(proposed, [0, 5, 10]))
+
+
+def test_gp_falls_back_to_initial_length_scale(monkeypatch):
+    '''
+    If no hyperparameters fit, the surrogate warns and uses the first length scale
+    '''
+    factor = sd._gp_factor
+    monkeypatch.setattr(sd, '_gp_factor', lambda *args: factor(*args)[:2] + (np.nan,))
+    X, y = np.array([[0.0], [0.5], [1.0]]), np.array([1.0, 0.0, 1.0])
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        gp = sd._gp(X, y)
+    assert gp.length_scale == sd.LENGTH_SCALES[0] and gp.noise == sd.NOISE_LEVELS[-1]
+    assert len(caught) == 1
+    mu, sd_ = gp.predict(X)
+    assert np.all(np.isfinite(mu)) and np.all(sd_ > 0)
+
+
+def test_candidates_respect_filter(tmp_path):
+    nl = namelist_lattice()
+    nl.expand('a', values=[[1, 2, 3, 4]])
+    nl.expand('b', values=[[10, 20, 30]])
+    nl.filter(nl.lattice.column('a') <= 2)
+    pool = nl.lattice.flat_indices().copy()
+    design = sd.sequential_design(nl, lambda case, output: None, seed=0)
+    assert np.array_equal(nl.candidate_pool, pool)
+
+    # the pool outlives the selection of each batch, and new designs over the lattice
+    design.next_batch(2)
+    assert len(nl.lattice) == 2
+    for design in [design, sd.sequential_design(nl, lambda case, output: None, seed=1)]:
+        assert np.all(np.isin(design.propose(6), pool))
+        assert len(design.propose(10)) == len(pool)
+    nl.save(str(tmp_path / 'manifest.json'))
+    assert np.array_equal(namelist_lattice.load(str(tmp_path / 'manifest.json')).candidate_pool,
+                          pool)
+
+    # refining the lattice discards the pool, along with the selection
+    nl.refine('a', [5])
+    assert nl.candidate_pool is None and len(nl.lattice) == 15
@@ -0,0 +1,159 @@
+import os
+import pytest
+import subprocess
+from fake_case import make_root_case
+from submission import submit_async, parse_job_ids
+from namelist_lattice import namelist_lattice
+
+
+# =============================================================================
+# =============================================================================
+
+
+@pytest.fixture
+def cases(tmp_path, fake_cime):
+    '''
+    Six fake cases, submittable with the stand-in case.submit
+    '''
+    (tmp_path / 'cases').mkdir()
+    cases = [str(tmp_path / 'cases' / 'case{}'.format(i)) for i in range(6)]
+    for case in cases:
+        make_root_case(case, str(tmp_path / 'output'), bulk_kb=1)
+    return cases
+
+
+def queued_jobs(tmp_path, job_seconds):
+    '''
+    (start, end, job name) of every job submitted to the fake queue, by job id
+    '''
+    jobs = {}
+    for job in (tmp_path / 'queue').iterdir():
+        end, name = job.read_text().split()
+        jobs[job.name] = (float(end) - job_seconds, float(end), name)
+    return jobs
+
+
+# -----------------------------------------------------------------------------
+
+
+def test_parse_job_ids():
+    output = 'Submitted job case.run with id 123\nSubmitted job id is 123\n'\
+             'Submitted job case.st_archive with id 124\nSubmitted batch job 125\n'
+    assert parse_job_ids(output) == ['123', '124', '125']
+
+
+def test_submit_async_max_queued(cases, tmp_path, fake_cime, monkeypatch):
+    '''
+    Submissions wait for room in the queue, so no more than max_queued jobs are ever queued
+    '''
+    monkeypatch.setenv('FAKE_CIME_JOB_SECONDS', '0.5')
+    results = submit_async(cases, max_concurrent=3, max_queued=2, 
+                           queue_cmd='{}/squeue'.format(fake_cime), poll_interval=0.05)
+
+    assert [r['clone'] for r in results] == cases
+    assert all(r['returncode'] == 0 and r['attempts'] == 1 for r in results)
+    jobs = queued_jobs(tmp_path, 0.5)
+    assert sorted(job_id for r in results for job_id in r['job_ids']) == sorted(jobs)
+    for r in results:
+        assert jobs[r['job_ids'][0]][2] == 'run.{}'.format(os.path.basename(r['clone']))
+    for start, _, _ in jobs.values():
+        assert sum(s <= start < e for s, e, _ in jobs.values()) <= 2
+
+
+def test_submit_async_retries(cases, tmp_path, fake_cime, monkeypatch):
+    '''
+    Rejected submissions are retried, and reported as failed once retries run out
+    '''
+    monkeypatch.setenv('FAKE_CIME_SUBMIT_FAILURES', '2')
+    results = submit_async(cases[:3], max_concurrent=2, retries=1, retry_delay=0)
+    for r in results:
+        assert r['returncode'] != 0 and r['attempts'] == 2 and r['job_ids'] == []
+        assert r['output'].count('Resource temporarily unavailable') == 2
+    assert not (tmp_path / 'queue').exists()
+
+    # the first three cases have used up their failures
+    results = submit_async(cases[:3], max_concurrent=2, max_queued=10, 
+                           queue_cmd='{}/squeue'.format(fake_cime), retries=2, retry_delay=0)
+    results += submit_async(cases[3:], max_concurrent=2, retries=2, retry_delay=0)
+    assert [r['attempts'] for r in results] == [1, 1, 1, 3, 3, 3]
+    for r in results:
+        assert r['returncode'] == 0 and len(r['job_ids']) == 1
+    assert sorted(r['job_ids'][0] for r in results) == sorted(queued_jobs(tmp_path, 60))
+
+
+def test_submit_clone_runs_async(root_case, tmp_path, fake_cime, monkeypatch):
+    '''
+    Job ids of asynchronous submissions are recorded per clone, and failed submissions are
+    raised once all clones were attempted
+    '''
+    nl = namelist_lattice(component='cam')
+    nl.expand('clubb_c1', values=[[1.0, 2.0]])
+    nl.expand('clubb_c2', values=[[3.0, 4.0]])
+    nl.create_clones(root_case, top_clone_dir=str(tmp_path / 'clones'), cime_dir=fake_cime, 
+                     clone_prefix='c', clone_mode='copy')
+
+    monkeypatch.setenv('FAKE_CIME_SUBMIT_FAILURES', '1')
+    with pytest.raises(RuntimeError, match='4 of 4 submissions failed'):
+        nl.submit_clone_runs(max_concurrent=2)
+    assert nl.job_ids == {}
+    assert all(r['state'] == 'created' for r in nl.clone_records.values())
+
+    nl.submit_clone_runs(max_concurrent=2, retries=1, retry_delay=0)
+    assert sorted(nl.job_ids) == sorted(nl.clone_dirs)
+    assert sorted(j for ids in nl.job_ids.values() for j in ids) == \
+           sorted(queued_jobs(tmp_path, 60))
+    assert all(r['state'] == 'submitted' for r in nl.clone_records.values())
+
+
+def test_submit_array(root_case, tmp_path, fake_cime):
+    '''
+    Clones are submitted in job arrays of at most max_array_size tasks, each dispatching its
+    tasks to clones by line of its index file, and resubmissions only include the clones 
+    with resubmits left
+    '''
+    nl = namelist_lattice(component='cam')
+    nl.expand('clubb_c1', values=[[1.0, 2.0, 3.0, 4.0, 5.0]])
+    nl.expand('clubb_c2', values=[[3.0]])
+    nl.create_clones(root_case, top_clone_dir=str(tmp_path / 'clones'), cime_dir=fake_cime, 
+                     clone_prefix='c', clone_mode='copy', resubmits=1)
+    clones = nl.clone_dirs
+    array_dir = tmp_path / 'arrays'
+    nl.submit_clone_runs(array=True, array_dir=str(array_dir), 
+                         array_kwargs={'max_array_size': 2, 'max_parallel': 1})
+
+    scripts = sorted(array_dir.glob('lattice.*.sh'))
+    assert [s.name for s in scripts] == ['lattice.0.sh', 'lattice.1.sh', 'lattice.2.sh']
+    for i, script in enumerate(scripts):
+        members = clones[2*i:2*i+2]
+        assert script.with_suffix('.index').read_text().splitlines() == members
+        text = script.read_text()
+        assert '#SBATCH --array=0-{}%1\n'.format(len(members)-1) in text
+        assert '#SBATCH --job-name=lattice.{}\n'.format(i) in text
+        assert '#SBATCH --nodes=1\n' in text and 'run.root' not in text
+    jobs = queued_jobs(tmp_path, 60)
+    assert sorted(name for _, _, name in jobs.values()) == ['lattice.0', 'lattice.1', 'lattice.2']
+    for job_id, (_, _, name) in jobs.items():
+        i = int(name.split('.')[1])
+        for task, clone in enumerate(clones[2*i:2*i+2]):
+            assert nl.job_ids[clone] == ['{}_{}'.format(job_id, task)]
+    assert all(r['state'] == 'submitted' for r in nl.clone_records.values())
+
+    # each array task runs case.submit from its clone
+    env = dict(os.environ, SLURM_ARRAY_TASK_ID='1')
+    subprocess.run(['bash', str(scripts[1])], env=env, check=True, stdout=subprocess.DEVNULL)
+    for clone in clones:
+        with open('{}/CaseStatus'.format(clone)) as f:
+            assert ('case.submit success' in f.read()) == (clone == clones[3])
+    env['SLURM_ARRAY_TASK_ID'] = '2'
+    assert subprocess.run(['bash', str(scripts[1])], env=env, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.DEVNULL).returncode == 1
+
+    # only clones with resubmits left are resubmitted
+    for clone in clones[1::2]:
+        subprocess.run(['./xmlchange', 'RESUBMIT=0'], cwd=clone, check=True)
+    nl.resubmit_hung_clone_runs(array=True, array_dir=str(array_dir), 
+                                array_kwargs={'max_array_size': 10})
+    assert (array_dir / 'resubmit.0.index').read_text().splitlines() == clones[0::2]
+    assert '#SBATCH --array=0-2\n' in (array_dir / 'resubmit.0.sh').read_text()
+    for clone in clones:
+        assert len(nl.job_ids[clone]) == (2 if clone in clones[0::2] else 1)
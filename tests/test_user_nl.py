@@ -0,0 +1,68 @@
+import os
+from user_nl import user_nl, NL_HEADER
+
+
+ROOT_NL = [
+    '! user_nl_cam of the root case\n',
+    'NHTFRQ = 0, -24\n',
+    "fincl1 = 'T', 'U',\n",
+    '  ! surface fields\n',
+    "         'PS'\n",
+    '\n',
+    "fincl1(2) = 'Q' ! second tape\n",
+    "history_note = 'dt = 1800 ! not a comment'\n",
+    'clubb_c1 = 1.0',
+]
+
+
+# =============================================================================
+# =============================================================================
+
+
+def test_parse():
+    nl = user_nl(ROOT_NL)
+    assert nl.keys() == ['nhtfrq', 'fincl1', 'history_note', 'clubb_c1']
+    # array element assignments are indexed by the name of the array
+    assert len(nl.index['fincl1']) == 2
+    # comments between continuation lines belong to the value they interrupt
+    key, lines = nl.entries[nl.index['fincl1'][0]]
+    assert lines == ROOT_NL[2:5]
+    # '!' inside a quoted string does not start a comment
+    assert nl.entries[nl.index['history_note'][0]][1] == [ROOT_NL[7]]
+    # a missing final line ending is added
+    assert nl.entries[-1] == ['clubb_c1', ['clubb_c1 = 1.0\n']]
+
+
+def test_trailing_comments_are_standalone():
+    '''
+    Comment and blank lines after a value, which no continuation line follows, are kept
+    when the value is replaced
+    '''
+    nl = user_nl(['a = 1\n', '! about b\n', '\n', 'b = 2\n', '! end\n'])
+    assert nl.render([('a', 3)]) == '! about b\n\nb = 2\n! end\n' + NL_HEADER + 'a = 3\n'
+
+
+def test_render():
+    nl = user_nl(ROOT_NL)
+    text = nl.render([('nhtfrq', -1), ('FINCL1', "'V'")])
+    assert text == ''.join([ROOT_NL[0], '\n', ROOT_NL[7], 'clubb_c1 = 1.0\n', NL_HEADER,
+                            'nhtfrq = -1\n', "FINCL1 = 'V'\n"])
+
+    # re-rendering a rendered file drops its previous header, and the settings replaced
+    again = user_nl(text.splitlines(True)).render([('fincl1', "'W'")])
+    assert again == ''.join([ROOT_NL[0], '\n', ROOT_NL[7], 'clubb_c1 = 1.0\n', 'nhtfrq = -1\n',
+                             NL_HEADER, "fincl1 = 'W'\n"])
+
+
+def test_write(tmp_path):
+    path = str(tmp_path / 'user_nl_cam')
+    with open(path, 'w') as f:
+        f.writelines(ROOT_NL)
+    os.chmod(path, 0o640)
+    user_nl.read(path).write(path, [('clubb_c1', 2.0)])
+    with open(path) as f:
+        text = f.read()
+    assert text.endswith(NL_HEADER + 'clubb_c1 = 2.0\n')
+    assert 'clubb_c1 = 1.0' not in text
+    assert os.stat(path).st_mode & 0o777 == 0o640
+    assert os.listdir(str(tmp_path)) == ['user_nl_cam']
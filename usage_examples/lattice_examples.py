@@ -4,6 +4,7 @@ import pathlib
 
 sys.path.append('{}/..'.format(pathlib.Path(__file__).parent.absolute()))
 from namelist_lattice import namelist_lattice
+from sequential_design import sequential_design
 
 # =============================================================================
 # =============================================================================
@@ -22,9 +23,7 @@ def lattice_submission_example():
     lattice.expand('fv3_d2_bg_k1', limits=[0, 0.2], nsamples = 3)
     lattice.expand('fv3_d2_bg_k2', limits=[0, 0.2], nsamples = 3)
 
-    lat = lattice.lattice
-    mask = lat['fv3_d2_bg_k1'] > lat['fv3_d2_bg_k2'] 
-    lattice.filter(mask)
+    lattice.constrain('fv3_d2_bg_k1 > fv3_d2_bg_k2')
 
     root_case = '/home/hollowed/CESM/cesm2.2_cases/cesm2.2.fv3.C48.L64.fhs94'
     top_clone_dir = '/home/hollowed/CESM/cesm2.2_cases/fhs94_L64_clones'
@@ -52,17 +51,78 @@ def lattice_large_example():
 
     lattice.expand('fv3_d2_bg_k1', limits=[0, 0.2], nsamples = 3)
     lattice.expand('fv3_d2_bg_k2', limits=[0, 0.2], nsamples = 3)
+    lattice.constrain('fv3_d2_bg_k1 > fv3_d2_bg_k2')
+
+    # the constraint is kept as further dimensions are added
     lattice.expand('fv3_d2_bg', limits=[0, 0.02], nsamples = 3)
     lattice.expand('fv3_kord_tm', values=[-9, 9])
     lattice.expand('fv3_n_sponge', values=[5, 10, 15])
 
-    lat = lattice.lattice
-    mask = lat['fv3_d2_bg_k1'] > lat['fv3_d2_bg_k2'] 
-    lattice.filter(mask)
+    print('{} total lattice points'.format(len(lattice.lattice)))
+    lattice.vis_planes()
+
 
-    print('{} total lattice points'.format(sum(mask)))
+# -------------------------------------------------------------------------------
+    
+
+
+def lattice_sampling_example():
+    '''
+    This example creates a 5-dimensional design with 40 total samples, where 4 continuous
+    and discrete FV3 parameters are jointly sampled with a Latin hypercube (rather than 
+    a full-factorial lattice), and crossed with the 2 values of fv3_kord_tm. The simulation
+    configurations are then visualized on each projected parameter pair plane.
+    
+    See docstrings at ../namelist_lattice.py for arg descriptions and more info
+    '''
+
+    lattice = namelist_lattice('cam')
+
+    lattice.sample(['fv3_d2_bg_k1', 'fv3_d2_bg_k2', 'fv3_d2_bg', 'fv3_n_sponge'], 20, 
+                   limits=[[0, 0.2], [0, 0.2], [1e-4, 0.02], [5, 15]], method='lhs', seed=0,
+                   logspace=[False, False, True, False], integer=[False, False, False, True])
+    lattice.expand('fv3_kord_tm', values=[-9, 9])
+
+    print('{} total lattice points'.format(len(lattice.lattice)))
     lattice.vis_planes()
 
 
 # -------------------------------------------------------------------------------
+
+
+def lattice_sequential_example(metric, nrounds=5, batch_size=8):
+    '''
+    This example runs a sequential tuning campaign over a dense Latin hypercube pool of 
+    2000 candidate configurations of the FV3 diffusion strengths. Each round, the given metric
+    is evaluated on the completed runs, a surrogate is fit, and the next batch of 
+    configurations is cloned and submitted. The metric should return None for runs which
+    have not yet completed, e.g. by checking for their history files.
+    
+    See docstrings at ../sequential_design.py for arg descriptions and more info
+    '''
+
+    lattice = namelist_lattice('cam')
+    lattice.sample(['fv3_d2_bg_k1', 'fv3_d2_bg_k2', 'fv3_d2_bg'], 2000, 
+                   limits=[[0, 0.2], [0, 0.2], [1e-4, 0.02]], seed=0, 
+                   logspace=[False, False, True])
+
+    root_case = '/home/hollowed/CESM/cesm2.2_cases/cesm2.2.fv3.C48.L64.fhs94'
+    top_clone_dir = '/home/hollowed/CESM/cesm2.2_cases/fhs94_L64_clones'
+    top_output_dir = '/scratch/cjablono_root/cjablono1/hollowed/tmp'
+    cime_dir = '/home/hollowed/CESM/cesm2.2/cime/scripts'
+    clone_prefix = 'cam'
+
+    design = sequential_design(lattice, metric)
+    for i in range(nrounds):
+        design.observe()
+        design.next_batch(batch_size)
+        lattice.create_clones(root_case, top_clone_dir, top_output_dir, cime_dir, clone_prefix,
+                              only_new=True)
+        lattice.submit_clone_runs(only_new=True)
+        input('round {} submitted; press enter once its runs have completed'.format(i))
     
+    design.observe()
+    print('best configuration: {}'.format(design.best()))
+
+
+# -------------------------------------------------------------------------------
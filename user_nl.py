@@ -0,0 +1,159 @@
+import os
+import re
+import tempfile
+
+NL_HEADER = '! Following entries written by CESM_namelist_automator\n'
+
+# start of a namelist assignment, e.g. 'nhtfrq =', 'fincl1(2)=', 'a%b ='
+_KEY = re.compile(r'^\s*([A-Za-z_][\w%]*)\s*(\([^)]*\))?\s*=')
+
+
+# ==========================================================================================
+# ==========================================================================================
+
+
+class user_nl:
+    def __init__(self, lines=None):
+        '''
+        This class represents the content of a CESM user_nl_* file as a sequence of entries,
+        where each entry is either a namelist assignment (including any continuation lines of
+        a multi-line value, and comment or blank lines between them), or a standalone comment
+        or blank line. An index of the entries
+        per (lower case) parameter name is built on construction, so that files can be
+        re-rendered with a different set of settings without re-parsing.
+
+        Instances are intended to be built once from the root case, and then rendered for each
+        clone, rather than reading back each clone's copy of the file.
+
+        Parameters
+        ----------
+        lines : iterable of strings, optional
+            Lines of the file, including line endings. Consumed in a single pass. Defaults
+            to None, in which case the namelist is empty.
+        '''
+        self.entries = []
+        self.index = {}
+        current = None
+        # comment or blank lines following an assignment, which belong to it only if a
+        # continuation line follows them
+        held = []
+        for line in ([] if lines is None else lines):
+            if(not line.endswith('\n')):
+                line += '\n'
+            content = _strip_comment(line).strip()
+            m = _KEY.match(content)
+            if(len(content) > 0 and m is None and current is not None):
+                # continuation of the previous assignment
+                current[1].extend(held + [line])
+                held = []
+                continue
+            self.entries.extend([[None, [h]] for h in held])
+            held = []
+            if(m is not None):
+                # new assignment
+                current = [m.group(1).lower(), [line]]
+                self.index.setdefault(current[0], []).append(len(self.entries))
+                self.entries.append(current)
+            elif(current is not None):
+                held.append(line)
+            else:
+                # comment or blank line
+                self.entries.append([None, [line]])
+        self.entries.extend([[None, [h]] for h in held])
+
+    @classmethod
+    def read(cls, path):
+        '''
+        Parses a user_nl file
+
+        Parameters
+        ----------
+        path : string
+            Location of the file
+        '''
+        with open(path) as f:
+            return cls(f)
+
+    def keys(self):
+        '''
+        Returns the (lower case) names of all parameters set in the namelist
+        '''
+        return list(self.index)
+
+
+    # ------------------------------------------------------------------------------
+
+
+    def render(self, settings):
+        '''
+        Renders the namelist with new settings. All existing assignments to the parameters
+        in settings (matched case-insensitively, and including assignments to any of their
+        array elements) are removed, as well as any header of entries previously written by
+        this package. The new settings are then appended after NL_HEADER.
+
+        Parameters
+        ----------
+        settings : list of (name, value) tuples
+            Parameter settings to write
+
+        Returns
+        -------
+        text : string
+            The new content of the file
+        '''
+        purge = set()
+        for name, _ in settings:
+            purge.update(self.index.get(name.lower(), []))
+
+        out = []
+        for i, (key, lines) in enumerate(self.entries):
+            if(i in purge or (key is None and lines[0] == NL_HEADER)):
+                continue
+            out.extend(lines)
+        out.append(NL_HEADER)
+        out.extend(['{} = {}\n'.format(name, value) for name, value in settings])
+        return ''.join(out)
+
+
+    def write(self, path, settings):
+        '''
+        Renders the namelist with new settings (see render()) and atomically replaces the
+        file at path with the result. The permissions of the existing file are kept.
+
+        Parameters
+        ----------
+        path : string
+            Location of the file to write
+        settings : list of (name, value) tuples
+            Parameter settings to write
+        '''
+        text = self.render(settings)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                   prefix='.{}.'.format(os.path.basename(path)))
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(text)
+            if(os.path.exists(path)):
+                os.chmod(tmp, os.stat(path).st_mode & 0o7777)
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+
+# ------------------------------------------------------------------------------
+
+
+def _strip_comment(line):
+    '''
+    Removes a trailing Fortran comment from a line, ignoring '!' inside quoted strings
+    '''
+    quote = None
+    for i, c in enumerate(line):
+        if(quote is not None):
+            if(c == quote): quote = None
+        elif(c in '\'"'):
+            quote = c
+        elif(c == '!'):
+            return line[:i]
+    return line